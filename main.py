@@ -8,7 +8,9 @@ from loguru import logger
 from src.batch_generation.core import (run_batch_generation,
                                        run_batch_generation_with_existing_plot)
 from src.generation.core import run_generation_with, run_resume_generation_with
+from src.models.enums.frontier_order import FrontierOrder
 from src.models.enums.generation_approach import GenerationApproach
+from src.models.enums.repository_backend import RepositoryBackend
 from src.models.generation_config import GenerationConfig
 from src.utils.validators import validate_config, validate_existing_plot
 
@@ -58,18 +60,35 @@ def generate_story_with(
         ] = False,
         seed: Annotated[
             Optional[int], typer.Option(help="Seed for random generation"),
-        ] = None
+        ] = None,
+        num_workers: Annotated[
+            Optional[int], typer.Option(help="Number of frontier items generated concurrently"),
+        ] = 1,
+        frontier_order: Annotated[
+            Optional[FrontierOrder], typer.Option(help="Order in which frontier items are generated"),
+        ] = "bfs",
+        repository_backend: Annotated[
+            Optional[RepositoryBackend], typer.Option(help="Story graph storage, REPOSITORY_BACKEND if omitted"),
+        ] = None,
+        pipelined: Annotated[
+            Optional[bool], typer.Option(help="Generate the children of a chunk while it is saved (proposed approach)"),
+        ] = False,
+        batch_api: Annotated[
+            Optional[bool], typer.Option(help="Submit every ready frontier item through the provider batch API"),
+        ] = False
 ):
     validate_existing_plot(existing_plot)
     validate_config(min_num_choices, max_num_choices, min_num_choices_opportunity, max_num_choices_opportunity,
-                    num_chapters, num_endings, num_main_characters, num_main_scenes)
+                    num_chapters, num_endings, num_main_characters, num_main_scenes, num_workers)
 
     config = GenerationConfig(
         min_num_choices=min_num_choices, max_num_choices=max_num_choices,
         min_num_choices_opportunity=min_num_choices_opportunity, max_num_choices_opportunity=max_num_choices_opportunity,
         game_genre=game_genre, themes=themes, num_chapters=num_chapters, num_endings=num_endings,
         num_main_characters=num_main_characters, num_main_scenes=num_main_scenes,
-        enable_image_generation=enable_image_generation, existing_plot=existing_plot, seed=seed
+        enable_image_generation=enable_image_generation, existing_plot=existing_plot, seed=seed,
+        num_workers=num_workers, frontier_order=frontier_order, repository_backend=repository_backend,
+        pipelined=pipelined, batch_api=batch_api
     )
     logger.info(f"Generation config: {config}")
     run_generation_with(config, approach)
@@ -78,8 +97,11 @@ def generate_story_with(
 @app.command()
 def resume_generation(
         story_id: Annotated[str, typer.Option(help="Story ID to resume generation")],
-        approach: Annotated[Optional[GenerationApproach], typer.Option(help="Approach to be used")]):
-    run_resume_generation_with(story_id, approach)
+        approach: Annotated[Optional[GenerationApproach], typer.Option(help="Approach to be used")],
+        repository_backend: Annotated[
+            Optional[RepositoryBackend], typer.Option(help="Story graph storage, the one of the original run if omitted"),
+        ] = None):
+    run_resume_generation_with(story_id, approach, repository_backend)
 
 
 @app.command()
@@ -123,31 +145,53 @@ def batch_generation(
         seed: Annotated[
             Optional[int], typer.Option(help="Seed for random generation"),
         ] = None,
+        num_workers: Annotated[
+            Optional[int], typer.Option(help="Number of frontier items generated concurrently"),
+        ] = 1,
+        frontier_order: Annotated[
+            Optional[FrontierOrder], typer.Option(help="Order in which frontier items are generated"),
+        ] = "bfs",
+        repository_backend: Annotated[
+            Optional[RepositoryBackend], typer.Option(help="Story graph storage, REPOSITORY_BACKEND if omitted"),
+        ] = None,
+        pipelined: Annotated[
+            Optional[bool], typer.Option(help="Generate the children of a chunk while it is saved (proposed approach)"),
+        ] = False,
+        batch_api: Annotated[
+            Optional[bool], typer.Option(help="Submit every ready frontier item through the provider batch API"),
+        ] = False,
+        workers: Annotated[
+            Optional[int], typer.Option(help="Number of stories generated concurrently, each in its own process"),
+        ] = 1,
         is_proposed_first: Annotated[
             Optional[bool], typer.Option(help="Whether to run proposed approach first"),
         ] = True):
     validate_config(min_num_choices, max_num_choices, min_num_choices_opportunity, max_num_choices_opportunity,
-                    num_chapters, num_endings, num_main_characters, num_main_scenes)
+                    num_chapters, num_endings, num_main_characters, num_main_scenes, num_workers, workers)
 
     config = GenerationConfig(
         min_num_choices=min_num_choices, max_num_choices=max_num_choices,
         min_num_choices_opportunity=min_num_choices_opportunity, max_num_choices_opportunity=max_num_choices_opportunity,
         game_genre=game_genre, themes=themes, num_chapters=num_chapters, num_endings=num_endings,
         num_main_characters=num_main_characters, num_main_scenes=num_main_scenes,
-        enable_image_generation=enable_image_generation, seed=seed
+        enable_image_generation=enable_image_generation, seed=seed, num_workers=num_workers,
+        frontier_order=frontier_order, repository_backend=repository_backend, pipelined=pipelined,
+        batch_api=batch_api
     )
     logger.info(f"Generation config: {config}")
 
     if is_proposed_first:
         logger.info(f"Generating {n_stories} stories with proposed approach")
-        proposed_stories = run_batch_generation(config, n_stories, GenerationApproach.PROPOSED)
+        proposed_stories = run_batch_generation(config, n_stories, GenerationApproach.PROPOSED, workers)
         logger.info(f"Generating {n_stories} stories with baseline approach with existing plot")
-        _ = run_batch_generation_with_existing_plot(config, proposed_stories, GenerationApproach.BASELINE)
+        _ = run_batch_generation_with_existing_plot(config, proposed_stories, GenerationApproach.BASELINE,
+                                                    workers)
     else:
         logger.info(f"Generating {n_stories} stories with baseline approach")
-        baseline_stories = run_batch_generation(config, n_stories, GenerationApproach.BASELINE)
+        baseline_stories = run_batch_generation(config, n_stories, GenerationApproach.BASELINE, workers)
         logger.info(f"Generating {n_stories} stories with proposed approach with existing plot")
-        _ = run_batch_generation_with_existing_plot(config, baseline_stories, GenerationApproach.PROPOSED)
+        _ = run_batch_generation_with_existing_plot(config, baseline_stories, GenerationApproach.PROPOSED,
+                                                    workers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,256 @@
+import copy
+import functools
+import itertools
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Annotated, Optional
+
+import typer
+import ujson
+from loguru import logger
+from pydantic import BaseModel
+
+import src.algorithms.baseline as baseline
+import src.algorithms.proposed as proposed
+from src.llms.llm import LLM
+from src.llms.token_estimator import TokenEstimator
+from src.models.enums.generation_approach import GenerationApproach
+from src.models.generation_config import GenerationConfig
+from src.models.frontier_journal import FrontierJournal
+from src.models.generation_context import GenerationContext
+from src.models.story_chunk_store import StoryChunkStore
+from src.repository import SQLiteRepository
+from tests.helpers import (FakeLLM, InMemoryRepository, get_story_data,
+                           temporary_working_directory)
+
+app = typer.Typer()
+
+class RemoteTokenCountingLLM(LLM):
+    def __init__(self, max_tokens: int, count_latency: float):
+        super().__init__(model_name="remote-counting-model", max_tokens=max_tokens)
+        self.count_latency = count_latency
+        self.token_estimator = TokenEstimator()
+        self.num_count_calls = 0
+
+    def count_token(self, message: str) -> int:
+        # Stands in for a provider token counting endpoint
+        time.sleep(self.count_latency)
+        self.num_count_calls += 1
+        return self.token_estimator.count_base_tokens(message)
+
+    def request_content(self, history):
+        raise NotImplementedError
+
+    def __str__(self):
+        return f"RemoteTokenCountingLLM(count_latency={self.count_latency})"
+
+
+class EstimatingLLM(LLM):
+    memoize_token_counts = False
+
+    def __init__(self, max_tokens: int):
+        super().__init__(model_name="estimating-model", max_tokens=max_tokens)
+        self.token_estimator = TokenEstimator()
+
+    def count_token(self, message: str) -> int:
+        return self.token_estimator.estimate(message)
+
+    def request_content(self, history):
+        raise NotImplementedError
+
+    def __str__(self):
+        return "EstimatingLLM()"
+
+
+class OverheadTimer:
+    def __init__(self):
+        self.totals: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def wrap(self, category: str, function):
+        self.totals.setdefault(category, 0.0)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            # Only the outermost call is timed, so recursive and nested calls in the same category count once
+            active = getattr(self._local, "active", set())
+            self._local.active = active
+            if category in active:
+                return function(*args, **kwargs)
+            active.add(category)
+            start_time = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                active.discard(category)
+                with self._lock:
+                    self.totals[category] += time.perf_counter() - start_time
+
+        return wrapper
+
+    @contextmanager
+    def patch(self):
+        # Framework functions whose time is reported per chunk. They run in the worker threads as well,
+        # which a profiler enabled on the main thread would not see.
+        targets = [
+            ("deepcopy", copy, "deepcopy"),
+            ("validation", BaseModel, "model_validate"),
+            ("validation", BaseModel, "model_validate_json"),
+            ("file_writes", GenerationContext, "append_response_to_file"),
+            ("file_writes", GenerationContext, "append_history_to_file"),
+            ("file_writes", GenerationContext, "sync_file"),
+            ("file_writes", FrontierJournal, "append"),
+            ("file_writes", FrontierJournal, "compact"),
+            ("file_writes", StoryChunkStore, "put"),
+            ("db_writes", InMemoryRepository, "create_story_chunk"),
+            ("db_writes", InMemoryRepository, "create_branch"),
+            ("db_writes", InMemoryRepository, "set_start_chunk"),
+            ("db_writes", SQLiteRepository, "create_story_chunk"),
+            ("db_writes", SQLiteRepository, "create_branch"),
+            ("db_writes", SQLiteRepository, "set_start_chunk"),
+        ]
+        originals = [(owner, name, owner.__dict__[name]) for _, owner, name in targets]
+        for category, owner, name in targets:
+            original = owner.__dict__[name]
+            if isinstance(original, classmethod):
+                setattr(owner, name, classmethod(self.wrap(category, original.__func__)))
+            else:
+                setattr(owner, name, self.wrap(category, original))
+        try:
+            yield self
+        finally:
+            for owner, name, original in originals:
+                setattr(owner, name, original)
+
+
+def get_tree_size(num_chapters: int, num_choices: int, num_opportunities: int) -> int:
+    chapter_size = sum(num_choices ** depth for depth in range(num_opportunities + 1)) + num_choices ** num_opportunities
+    return sum(num_choices ** (num_opportunities * chapter) * chapter_size for chapter in range(num_chapters))
+
+
+def get_tree_shape(target_size: int) -> tuple[int, int, int]:
+    shapes = itertools.product(range(1, 6), range(2, 5), range(1, 5))
+    return min(shapes, key=lambda shape: (abs(get_tree_size(*shape) - target_size), shape))
+
+
+def run_pipeline(approach: GenerationApproach, shape: tuple[int, int, int], model: FakeLLM, num_workers: int,
+                 sqlite: bool, pipelined: bool, write_latency: float) -> GenerationContext:
+    num_chapters, num_choices, num_opportunities = shape
+    config = GenerationConfig(min_num_choices=num_choices, max_num_choices=num_choices,
+                              min_num_choices_opportunity=num_opportunities, max_num_choices_opportunity=num_opportunities,
+                              game_genre="visual novel", themes=["benchmark"], num_chapters=num_chapters, num_endings=1,
+                              num_main_characters=1, num_main_scenes=1, enable_image_generation=False,
+                              num_workers=num_workers, pipelined=pipelined)
+    ctx = GenerationContext(approach, config)
+    ctx.repository = SQLiteRepository() if sqlite else InMemoryRepository(write_latency)
+    ctx.generation_model = model
+    initial_history = [{"role": "user", "content": "Plot prompt"}, {"role": "assistant", "content": model.response}]
+    ctx.set_initial_history(initial_history)
+
+    story_data = get_story_data(num_chapters)
+    if approach is GenerationApproach.BASELINE:
+        baseline.process_generation_queue(ctx, story_data)
+    else:
+        proposed.process_generation_queue(ctx, story_data)
+    return ctx
+
+
+def benchmark(approach: GenerationApproach, target_size: int, latency: float, num_workers: int, num_narratives: int,
+              narrative_length: int, breakdown: bool, memory: bool, sqlite: bool, pipelined: bool,
+              write_latency: float) -> dict:
+    shape = get_tree_shape(target_size)
+    model = FakeLLM(shape[1], latency, num_narratives, narrative_length)
+    result = {"approach": approach.value, "target_size": target_size, "shape": shape,
+              "repository": "sqlite" if sqlite else "memory", "pipelined": pipelined}
+
+    start_time = time.perf_counter()
+    ctx = run_pipeline(approach, shape, model, num_workers, sqlite, pipelined, write_latency)
+    result["total_time"] = time.perf_counter() - start_time
+    result["num_chunks"] = ctx.repository.get_num_story_chunks(ctx.story_id)
+    result["time_per_chunk"] = result["total_time"] / result["num_chunks"]
+    result["overhead_per_chunk"] = result["time_per_chunk"] - latency / min(num_workers, result["num_chunks"])
+
+    if breakdown:
+        with OverheadTimer().patch() as timer:
+            run_pipeline(approach, shape, model, num_workers, sqlite, pipelined, write_latency)
+        result["overheads_per_chunk"] = {category: total / result["num_chunks"] for category, total in timer.totals.items()}
+
+    if memory:
+        tracemalloc.start()
+        run_pipeline(approach, shape, model, num_workers, sqlite, pipelined, write_latency)
+        result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def print_result(result: dict):
+    print(f"[{result['approach']}, {result['repository']}{', pipelined' if result['pipelined'] else ''}] {result['num_chunks']} chunks (chapters, choices, opportunities = {result['shape']})")
+    print(f"  Total time: {result['total_time']:.3f} s, per chunk: {result['time_per_chunk'] * 1000:.3f} ms, "
+          f"framework overhead per chunk: {result['overhead_per_chunk'] * 1000:.3f} ms")
+    for category, seconds in result.get("overheads_per_chunk", {}).items():
+        print(f"  {category}: {seconds * 1000:.3f} ms per chunk")
+    if "peak_memory" in result:
+        print(f"  Peak memory: {result['peak_memory'] / 1024 / 1024:.2f} MiB")
+
+
+@app.command()
+def pipeline(
+        sizes: Annotated[str, typer.Option(help="Comma separated story tree sizes, in chunks")] = "10,100,500,2000",
+        approach: Annotated[Optional[GenerationApproach], typer.Option(help="Approach to benchmark, both if omitted")] = None,
+        latency: Annotated[float, typer.Option(help="Simulated LLM latency in seconds")] = 0.0,
+        num_workers: Annotated[int, typer.Option(help="Number of concurrent generation workers")] = 1,
+        num_narratives: Annotated[int, typer.Option(help="Number of narratives in each simulated response")] = 10,
+        narrative_length: Annotated[int, typer.Option(help="Number of characters in each simulated narrative")] = 200,
+        breakdown: Annotated[bool, typer.Option(help="Time a second run to break down the framework overhead")] = True,
+        memory: Annotated[bool, typer.Option(help="Trace a third run to measure the peak memory")] = True,
+        sqlite: Annotated[bool, typer.Option(help="Store the story graph in the SQLite repository instead of memory")] = False,
+        pipelined: Annotated[bool, typer.Option(help="Generate the children of a chunk while it is saved")] = False,
+        write_latency: Annotated[float, typer.Option(help="Simulated latency of a story chunk write in seconds")] = 0.0,
+        output: Annotated[Optional[Path], typer.Option(help="Write the results as JSON to this file")] = None):
+    logger.remove()  # Logging would dominate the measured hot path
+    approaches = list(GenerationApproach) if approach is None else [approach]
+    output = None if output is None else output.absolute()
+
+    results = []
+    with temporary_working_directory():
+        for target_size, current_approach in itertools.product([int(size) for size in sizes.split(",")], approaches):
+            result = benchmark(current_approach, target_size, latency, num_workers, num_narratives, narrative_length,
+                               breakdown, memory, sqlite, pipelined, write_latency)
+            print_result(result)
+            results.append(result)
+
+    if output is not None:
+        with open(output, "w") as file:
+            ujson.dump({"results": results}, file, indent=2)
+
+
+@app.command()
+def token_counting(
+        num_chunks: Annotated[int, typer.Option(help="Number of chunks generated along one story path")] = 50,
+        count_latency: Annotated[float, typer.Option(help="Simulated latency of a provider token count request")] = 0.05,
+        max_tokens: Annotated[int, typer.Option(help="Context window of the simulated model")] = 16385,
+        message_length: Annotated[int, typer.Option(help="Number of characters in each prompt and response")] = 2000):
+    logger.remove()
+    initial_history = [{"role": "user", "content": "Plot prompt " * (message_length // 12)},
+                       {"role": "assistant", "content": "Story data " * (message_length // 11)}]
+    for model in [RemoteTokenCountingLLM(max_tokens, count_latency), EstimatingLLM(max_tokens)]:
+        history = list(initial_history)
+        setup_time = 0.0
+        for i in range(num_chunks):
+            history.append({"role": "user", "content": f"Prompt {i} " + "word " * (message_length // 5)})
+            start_time = time.perf_counter()
+            model.rolling_history(history)
+            setup_time += time.perf_counter() - start_time
+            history.append({"role": "assistant", "content": f"Response {i} " + "text " * (message_length // 5)})
+
+        print(f"{model}: {setup_time / num_chunks * 1000:.3f} ms request setup per chunk"
+              + (f", {model.num_count_calls / num_chunks:.1f} count requests per chunk"
+                 if isinstance(model, RemoteTokenCountingLLM) else ""))
+
+
+if __name__ == "__main__":
+    app()
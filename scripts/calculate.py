@@ -5,31 +5,29 @@ from pathlib import Path
 import typer
 from dotenv import load_dotenv
 
+from src.models.generation_log import (get_response_log_model_names,
+                                       iter_histories, iter_responses,
+                                       read_response_totals)
+
 app = typer.Typer()
 
 
 @app.command()
 def cost_per_story(story_id: str):
-    files = list((Path.cwd() / "outputs" / story_id).glob("*.json"))
-    model_name = None
-    responses_path = None
-    for file in files:
-        if file.stem not in ["context", "histories", "plot"]:
-            responses_path = file
-            model_name = file.stem
-            break
-
-    plot_path = Path.cwd() / "outputs" / story_id / "plot.json"
-    context_path = Path.cwd() / "outputs" / story_id / "context.json"
-    with open(responses_path, "r") as f:
-        responses = json.load(f)
+    story_path = Path.cwd() / "outputs" / story_id
+    model_name = get_response_log_model_names(story_path)[0]
+
+    plot_path = story_path / "plot.json"
+    context_path = story_path / "context.json"
     with open(plot_path, "r") as f:
         plot = json.load(f)
     with open(context_path, "r") as f:
         context = json.load(f)
 
-    prompt_tokens = responses["prompt_tokens"]
-    completion_tokens = responses["completion_tokens"]
+    totals = read_response_totals(story_path, model_name)
+    prompt_tokens = totals["prompt_tokens"]
+    cached_prompt_tokens = totals["cached_prompt_tokens"]
+    completion_tokens = totals["completion_tokens"]
 
     LLM_PRICES = {
         'claude-3-opus-20240229': {
@@ -64,6 +62,8 @@ def cost_per_story(story_id: str):
     completion_token_price = LLM_PRICES[model_name]["completion"]
 
     print(f"Prompt tokens: {prompt_tokens}")
+    print(f"Cached prompt tokens: {cached_prompt_tokens}")
+    print(f"Uncached prompt tokens: {prompt_tokens - cached_prompt_tokens}")
     print(f"Completion tokens: {completion_tokens}")
     print(f"Total tokens: {prompt_tokens + completion_tokens}")
 
@@ -122,6 +122,23 @@ def time_to_completion(story_id: str):
         print(f"Time to last update: {hour} hours, {minute} minutes, {second} seconds")
 
 
+@app.command()
+def log_stats(story_id: str):
+    story_path = Path.cwd() / "outputs" / story_id
+    for model_name in get_response_log_model_names(story_path):
+        num_responses = sum(1 for _ in iter_responses(story_path, model_name))
+        print(f"Responses from {model_name}: {num_responses}")
+
+    num_histories, num_messages, max_messages = 0, 0, 0
+    for history in iter_histories(story_path):
+        num_histories += 1
+        num_messages += len(history)
+        max_messages = max(max_messages, len(history))
+    print(f"Histories: {num_histories}")
+    if num_histories > 0:
+        print(f"Average history length: {num_messages / num_histories:.1f} messages, longest: {max_messages} messages")
+
+
 if __name__ == "__main__":
     load_dotenv()
     app()
@@ -0,0 +1,49 @@
+import os
+from pathlib import Path
+from typing import Annotated, Optional
+
+import typer
+from dotenv import load_dotenv
+
+from src.models.generation_log import (HistoryLog, MessageStore,
+                                       iter_histories)
+
+
+def get_directory_size(path: Path) -> int:
+    return sum(file.stat().st_size for file in path.iterdir() if file.is_file())
+
+
+def import_histories(story_path: Path, keep_original: bool):
+    size_before = get_directory_size(story_path)
+    temp_path = story_path / "histories.jsonl.tmp"
+    history_log = HistoryLog(temp_path, MessageStore(story_path / "messages.jsonl"))
+    num_histories = 0
+    for history in iter_histories(story_path):
+        history_log.append(history)
+        num_histories += 1
+    history_log.close()
+
+    os.replace(temp_path, story_path / "histories.jsonl")
+    if (story_path / "histories.json").exists():  # Its histories are in histories.jsonl now
+        if keep_original:
+            os.replace(story_path / "histories.json", story_path / "histories.json.orig")
+        else:
+            os.remove(story_path / "histories.json")
+
+    size_after = get_directory_size(story_path)
+    print(f"{story_path}: {num_histories} histories, {size_before / 1024 / 1024:.2f} MiB -> {size_after / 1024 / 1024:.2f} MiB")
+
+
+def main(
+        story_path: Annotated[Optional[Path], typer.Option(help="Story output directory to import")] = None,
+        outputs_path: Annotated[Path, typer.Option(help="Import every story in this outputs directory")] = Path("outputs"),
+        keep_original: Annotated[bool, typer.Option(help="Keep histories.json as histories.json.orig after importing it")] = False):
+    story_paths = [story_path] if story_path is not None else sorted(outputs_path.glob("*/*/"))
+    for path in story_paths:
+        if (path / "histories.json").exists() or (path / "histories.jsonl").exists():
+            import_histories(path, keep_original)
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    typer.run(main)
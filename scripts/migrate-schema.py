@@ -0,0 +1,55 @@
+from typing import Annotated
+
+import typer
+from dotenv import load_dotenv
+
+from neo4j import Session
+from src.database import Neo4J
+
+# The node kept for a duplicated id is the first one by element id, the others hand over their relationships
+DUPLICATES = ("MATCH (node:{label}) WITH node ORDER BY elementId(node) "
+              "WITH node.id AS id, collect(node) AS nodes WHERE size(nodes) > 1 "
+              "WITH head(nodes) AS kept, tail(nodes) AS duplicates UNWIND duplicates AS duplicate ")
+MIGRATION_QUERIES = [
+    DUPLICATES.format(label="StoryChunk") +
+    "MATCH (duplicate)-[branch:BRANCHED_TO]->(target) MERGE (kept)-[:BRANCHED_TO {choice: branch.choice}]->(target)",
+    DUPLICATES.format(label="StoryChunk") +
+    "MATCH (source)-[branch:BRANCHED_TO]->(duplicate) MERGE (source)-[:BRANCHED_TO {choice: branch.choice}]->(kept)",
+    DUPLICATES.format(label="StoryChunk") +
+    "MATCH (storyData:StoryData)-[:STARTED_AT]->(duplicate) MERGE (storyData)-[:STARTED_AT]->(kept)",
+    DUPLICATES.format(label="StoryChunk") + "DETACH DELETE duplicate",
+    DUPLICATES.format(label="StoryData") +
+    "MATCH (duplicate)-[:STARTED_AT]->(storyChunk) MERGE (kept)-[:STARTED_AT]->(storyChunk)",
+    DUPLICATES.format(label="StoryData") + "DETACH DELETE duplicate",
+]
+
+
+def count_duplicates(session: Session, label: str) -> int:
+    record = session.run(f"MATCH (node:{label}) WITH node.id AS id, count(node) AS num_nodes WHERE num_nodes > 1 "
+                         "RETURN coalesce(sum(num_nodes - 1), 0) AS num_duplicates").single()
+    return record["num_duplicates"]
+
+
+def migrate_schema(session: Session, dry_run: bool):
+    for label in ["StoryChunk", "StoryData"]:
+        print(f"Duplicated {label} nodes: {count_duplicates(session, label)}")
+    if dry_run:
+        return
+
+    for query in MIGRATION_QUERIES:
+        session.run(query)
+    print("Duplicated nodes merged")
+
+
+def main(
+        dry_run: Annotated[bool, typer.Option(help="Only report duplicated nodes")] = False):
+    database = Neo4J()
+    database.with_session(migrate_schema, dry_run)
+    if not dry_run:
+        database.bootstrap_schema()
+        print("Schema constraints and indexes created" if database.is_schema_ready else "Schema creation failed")
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    typer.run(main)
@@ -0,0 +1,59 @@
+import itertools
+from pathlib import Path
+from typing import Annotated, Optional
+
+import typer
+import ujson
+from dotenv import load_dotenv
+
+from neo4j import ManagedTransaction
+from src.database import Neo4J
+from src.repository import SQLiteRepository, WriteBehindRepository
+
+
+def get_completed_story_ids(outputs_path: Path) -> list[str]:
+    story_ids = []
+    for context_path in sorted(outputs_path.glob("*/*/context.json")):
+        with open(context_path, "r") as file:
+            if ujson.load(file)["is_generation_completed"]:
+                story_ids.append(context_path.parent.name)
+    return story_ids
+
+
+def write_rows(tx: ManagedTransaction, query: str, rows: list[dict]):
+    tx.run(query, rows=rows)
+
+
+def sync_story(repository: SQLiteRepository, database: Neo4J, story_id: str, batch_size: int):
+    # The write-behind queries merge every node they refer to, so a story can be synced again after a partial sync
+    story_graph = repository.get_story_graph(story_id)
+    with database.driver.session() as session:
+        for operation, query in WriteBehindRepository.WRITE_QUERIES.items():
+            for rows in itertools.batched(story_graph[operation], batch_size):
+                session.execute_write(write_rows, query, list(rows))
+    print(f"{story_id}: {len(story_graph['story_chunk'])} story chunks and {len(story_graph['branch'])} branches synced")
+
+
+def main(
+        story_id: Annotated[Optional[list[str]], typer.Option(help="Story ID to sync, every completed story if omitted")] = None,
+        outputs_path: Annotated[Path, typer.Option(help="Outputs directory used to find the completed stories")] = Path("outputs"),
+        batch_size: Annotated[int, typer.Option(help="Number of rows written to Neo4J per transaction")] = 1000):
+    repository = SQLiteRepository()
+    stored_story_ids = set(repository.get_story_ids())
+    story_ids = story_id if story_id else [completed_id for completed_id in get_completed_story_ids(outputs_path)
+                                           if completed_id in stored_story_ids]
+    missing_story_ids = [missing_id for missing_id in story_ids if missing_id not in stored_story_ids]
+    if missing_story_ids:
+        print(f"Stories not found in {repository.database.path}: {', '.join(missing_story_ids)}")
+        raise typer.Exit(1)
+
+    database = Neo4J()
+    database.bootstrap_schema()
+    for current_story_id in story_ids:
+        sync_story(repository, database, current_story_id, batch_size)
+    print(f"{len(story_ids)} stories synced to {database}")
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    typer.run(main)
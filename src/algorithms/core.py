@@ -1,10 +1,16 @@
+from typing import Callable
+
 import ujson
 from loguru import logger
 from pydantic import ValidationError
 
 from src.models.enums.branching_type import BranchingType
+from src.models.enums.retry_kind import RetryKind
+from src.models.frontier_item import FrontierItem
 from src.models.generation_config import GenerationConfig
 from src.models.generation_context import GenerationContext
+from src.models.retry_policy import RetryError
+from src.models.shared_history import SharedHistory
 from src.models.story.story_choice import StoryChoice
 from src.models.story_chunk import StoryChunk
 from src.models.story_data import StoryData
@@ -23,36 +29,31 @@ from src.utils.pydantic import map_validation_errors_to_string
 def initialize_generation(ctx: GenerationContext):
     logger.debug("Start story plot generation")
 
-    game_story_prompt = get_plot_prompt(ctx.config)
+    game_story_prompt = get_plot_prompt(ctx.config, ctx.random)
     history = append_openai_message(game_story_prompt)
 
-    with open(ctx.output_path / "histories.json", "w") as file:
-        ujson.dump({"histories": [history]}, file, indent=2)
+    ctx.append_history_to_file(history)
 
     story_data_raw, story_data_obj, story_data = None, None, None
 
     if not ctx.config.existing_plot:
-        # Generate plot until success or max retry attempts
-        max_retry_attempts = 3
-        has_plot_generation_success, current_attempt = False, 0
-        while not has_plot_generation_success and current_attempt < max_retry_attempts:
+        def generate() -> tuple[str, dict, StoryData]:
+            raw, obj = ctx.generate_content(history)
+            obj["id"] = ctx.story_id
+            obj["generated_by"] = ctx.generation_model.model_name
+            obj["approach"] = ctx.approach
             try:
-                story_data_raw, story_data_obj = ctx.generate_content(history)
-                story_data_obj["id"] = ctx.story_id
-                story_data_obj["generated_by"] = ctx.generation_model.model_name
-                story_data_obj["approach"] = ctx.approach
-                story_data = StoryData.model_validate(story_data_obj)
-                validate_story_data(ctx.config, story_data)
-                has_plot_generation_success = True
+                data = StoryData.model_validate(obj)
             except ValidationError as e:
-                current_attempt += 1
-                logger.warning(f"Validation error on chat completion response: {map_validation_errors_to_string(e)}")
-            except Exception as e:
-                current_attempt += 1
-                logger.warning(f"Exception occurred while chat completion: {e}")
-
-        if not has_plot_generation_success:
-            logger.error(f"Failed to generate story data.")
+                raise ValueError(f"Validation error on chat completion response: {map_validation_errors_to_string(e)}")
+            validate_story_data(ctx.config, data)
+            ctx.accept_response(history)
+            return raw, obj, data
+
+        try:
+            story_data_raw, story_data_obj, story_data = ctx.retry_policy.call(RetryKind.CONTENT, generate, (Exception,))
+        except RetryError as e:
+            logger.error(f"Failed to generate story data: {e}")
             logger.error(f"Story ID: {ctx.story_id}")
             logger.error("Exiting...")
             exit(1)
@@ -94,6 +95,7 @@ def initialize_generation(ctx: GenerationContext):
     ctx.repository.create_story_data(story_data)
 
     initial_history = append_openai_message(story_data_raw, role="assistant", history=history)
+    ctx.repository.set_initial_history(ctx.story_id, initial_history)
     logger.debug("End story plot generation")
 
     with open(ctx.output_path / "plot.json", "w") as file:
@@ -114,13 +116,109 @@ def get_prompts_by_branching_type(choice: StoryChoice, ctx: GenerationContext, c
     elif state is BranchingType.CHAPTER_END:
         prompt = get_story_until_chapter_end_prompt(ctx.config, story_data, parent_chunk)
     elif state is BranchingType.GAME_END:
-        prompt = get_story_until_game_end_prompt(ctx.config, story_data, parent_chunk)
+        prompt = get_story_until_game_end_prompt(ctx.config, story_data, parent_chunk, ctx.random)
     else:
         logger.error(f"Invalid state: {state}")
         exit(1)
     return prompt
 
 
+def get_child_frontier_items(ctx: GenerationContext, item: FrontierItem, story_chunk: StoryChunk,
+                             choices: list[StoryChoice]) -> list[FrontierItem]:
+    child_chunks: list[FrontierItem] = []
+    if item.state is BranchingType.BRANCHING:
+        if item.used_choice_opportunity < ctx.config.max_num_choices_opportunity:  # Branch to multiple choices
+            for choice in choices:
+                child_chunks.append(
+                    FrontierItem(current_chapter=item.current_chapter, used_choice_opportunity=item.used_choice_opportunity + 1,
+                                 parent_chunk_id=story_chunk.id, choice=choice, state=BranchingType.BRANCHING)
+                )
+        elif item.used_choice_opportunity == ctx.config.max_num_choices_opportunity:
+            if item.current_chapter < ctx.config.num_chapters:  # Branch to the end of chapter
+                child_chunks.append(
+                    FrontierItem(current_chapter=item.current_chapter, used_choice_opportunity=item.used_choice_opportunity,
+                                 parent_chunk_id=story_chunk.id, state=BranchingType.CHAPTER_END)
+                )
+            elif item.current_chapter == ctx.config.num_chapters:  # Branch to the end of game
+                child_chunks.append(
+                    FrontierItem(current_chapter=item.current_chapter, used_choice_opportunity=item.used_choice_opportunity,
+                                 parent_chunk_id=story_chunk.id, state=BranchingType.GAME_END)
+                )
+    elif item.state is BranchingType.CHAPTER_END:
+        if item.current_chapter < ctx.config.num_chapters:  # Branch to the next chapter
+            child_chunks.append(
+                FrontierItem(current_chapter=item.current_chapter + 1, used_choice_opportunity=0,
+                             parent_chunk_id=story_chunk.id, state=BranchingType.BRANCHING)
+            )
+    return child_chunks
+
+
+def process_generation_queue_in_batches(
+        ctx: GenerationContext, story_data: StoryData,
+        prepare_generation: Callable[[GenerationContext, StoryData, FrontierItem], tuple[SharedHistory, int]],
+        parse_story_chunk: Callable[..., tuple[StoryChunk, list[StoryChoice]]],
+        commit_story_chunk: Callable[[GenerationContext, FrontierItem, StoryChunk, list[StoryChoice]], list[FrontierItem]]):
+    cnt = 0
+    frontiers = ctx.get_frontiers()
+    while len(frontiers) > 0:
+        # Every ready item is sent in one provider batch, their children form the next one
+        items = [ctx.pop_frontier() for _ in range(len(frontiers))]
+        requests = [(item, *prepare_generation(ctx, story_data, item)) for item in items]
+        failed_items = []
+        for item, (story_chunk, choices) in zip(items, generate_story_chunks_in_batches(ctx, requests, parse_story_chunk)):
+            if story_chunk is None:
+                failed_items.append(item)
+                continue
+
+            cnt += 1
+            ctx.commit_frontier(item, commit_story_chunk(ctx, item, story_chunk, choices))
+
+        if failed_items:  # The chunks of the batch that succeeded are committed, the failed items are regenerated on resume
+            logger.error(f"Failed to generate {len(failed_items)} story chunks.")
+            logger.error(f"Story ID: {ctx.story_id}, Frontier items: {failed_items}")
+            logger.error("Exiting...")
+            exit(1)
+        logger.info(f"Batch of {len(items)} story chunks committed, frontiers: {len(frontiers)}")
+
+    ctx.completed()
+    logger.debug(f"Total number of chunks: {cnt}")
+    logger.debug(f"End of story generation for story ID: {ctx.story_id}")
+
+
+def generate_story_chunks_in_batches(
+        ctx: GenerationContext, requests: list[tuple[FrontierItem, SharedHistory, int]],
+        parse_story_chunk: Callable[..., tuple[StoryChunk, list[StoryChoice]]]
+) -> list[tuple[StoryChunk, list[StoryChoice]] | tuple[None, None]]:
+    results: list[tuple[StoryChunk, list[StoryChoice]] | tuple[None, None]] = [(None, None)] * len(requests)
+    pending_indices = list(range(len(requests)))
+    attempt = 0
+    while len(pending_indices) > 0:
+        attempt += 1
+        try:
+            responses = ctx.generate_batch([requests[idx][1] for idx in pending_indices])
+        except Exception as e:  # A batch that could not be submitted or did not complete fails all of its requests
+            logger.warning(f"Batch of {len(pending_indices)} requests failed on attempt {attempt}: {e}")
+            responses = [e] * len(pending_indices)
+        failed_indices = []
+        for idx, response in zip(pending_indices, responses):
+            item, history, current_num_choices = requests[idx]
+            try:
+                if isinstance(response, Exception):
+                    raise response
+                results[idx] = parse_story_chunk(ctx, item, history, current_num_choices, *response)
+            except Exception as e:
+                logger.warning(f"Batch request for {item} failed on attempt {attempt}: {e}")
+                failed_indices.append(idx)
+        ctx.retry_policy.record_completed(len(pending_indices) - len(failed_indices))
+
+        # Failed requests are sent again in a smaller batch, within the same limits as individual content retries
+        if attempt >= ctx.retry_policy.max_attempts[RetryKind.CONTENT] or \
+                not all(ctx.retry_policy.consume_budget(RetryKind.CONTENT) for _ in failed_indices):
+            break
+        pending_indices = failed_indices
+    return results
+
+
 def validate_story_data(config: GenerationConfig, story_data: StoryData):
     if len(story_data.main_scenes) < config.num_main_scenes:
         raise ValueError(f"Main scenes generated by model ({len(story_data.main_scenes)}) less than setting scenes ({config.num_main_scenes})")
@@ -1,3 +1,10 @@
+import multiprocessing
+import sys
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
 from loguru import logger
 
 from src.generation.core import run_generation_with
@@ -6,23 +13,76 @@ from src.models.generation_config import GenerationConfig
 from src.models.story_data import StoryData
 
 
-def run_batch_generation(config: GenerationConfig, n_stories: int, approach: GenerationApproach) -> list[StoryData]:
+def initialize_worker():
+    # Story logs go to their own files, the terminal only shows what needs attention across all workers
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+
+def generate_story(config: GenerationConfig, approach: GenerationApproach) -> tuple[str, Optional[StoryData], Optional[str]]:
+    story_id = str(uuid.uuid1())
+    log_handler_id = logger.add(Path("outputs") / approach.value / story_id / "generation.log")
+    try:
+        return story_id, run_generation_with(config, approach, story_id), None
+    except (Exception, SystemExit) as e:  # The algorithms exit on unrecoverable responses, which only ends this story
+        logger.exception(f"Story {story_id} failed")
+        return story_id, None, repr(e)
+    finally:
+        logger.remove(log_handler_id)
+
+
+def get_story_config(config: GenerationConfig, story_idx: int) -> GenerationConfig:
+    # Stories of a seeded run get different seeds, derived from their position so the run stays reproducible
+    if config.seed is None:
+        return config
+    story_config = GenerationConfig.copy_from(config)
+    story_config.seed = config.seed + story_idx
+    return story_config
+
+
+def run_stories(configs: list[GenerationConfig], approach: GenerationApproach, workers: int) -> list[StoryData]:
+    configs = [get_story_config(config, idx) for idx, config in enumerate(configs)]
+    if workers <= 1:
+        results = [generate_story(config, approach) for config in configs]
+    else:
+        # Spawned processes, one per story, start without the parent's model clients and database connections
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=initialize_worker, max_tasks_per_child=1) as executor:
+            futures = [executor.submit(generate_story, config, approach) for config in configs]
+            results = []
+            for idx, future in enumerate(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:  # The worker process died before it could report the failure
+                    results.append((None, None, repr(e)))
+                logger.info(f"Story {idx + 1}/{len(configs)} finished")
+
     generated_stories: list[StoryData] = []
+    for idx, (story_id, story_data, error) in enumerate(results):
+        if story_data is None:
+            logger.error(f"Story {idx + 1}/{len(configs)} ({story_id}) failed: {error}")
+        else:
+            generated_stories.append(story_data)
+    logger.info(f"{len(generated_stories)}/{len(configs)} stories generated")
+    return generated_stories
+
+
+def run_batch_generation(config: GenerationConfig, n_stories: int, approach: GenerationApproach,
+                         workers: int = 1) -> list[StoryData]:
     logger.info("Starting batch generation")
-    for _ in range(n_stories):
-        story_data = run_generation_with(config, approach)
-        generated_stories.append(story_data)
+    generated_stories = run_stories([config] * n_stories, approach, workers)
     logger.info("Batch generation completed")
     return generated_stories
 
 
-def run_batch_generation_with_existing_plot(config: GenerationConfig, existing_stories: list[StoryData], approach: GenerationApproach) -> list[StoryData]:
-    generated_stories: list[StoryData] = []
+def run_batch_generation_with_existing_plot(config: GenerationConfig, existing_stories: list[StoryData],
+                                            approach: GenerationApproach, workers: int = 1) -> list[StoryData]:
     logger.info("Starting batch generation with existing plot")
+    configs = []
     for story_data in existing_stories:
         new_config = GenerationConfig.copy_from(config)
         new_config.existing_plot = str(story_data.existing_plot_path)
-        story_data = run_generation_with(new_config, approach)
-        generated_stories.append(story_data)
+        configs.append(new_config)
+    generated_stories = run_stories(configs, approach, workers)
     logger.info("Batch generation with existing plot completed")
     return generated_stories
@@ -1,13 +1,24 @@
 import os
-from typing import Callable
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator
 
 from loguru import logger
 
 from neo4j import GraphDatabase
+from neo4j.exceptions import DriverError, Neo4jError, TransientError
 
 
 class Neo4J:
     _instance = None
+    # Lookups by id and story_id would otherwise scan every node with the label
+    SCHEMA_QUERIES = [
+        "CREATE CONSTRAINT story_chunk_id IF NOT EXISTS FOR (storyChunk:StoryChunk) REQUIRE storyChunk.id IS UNIQUE",
+        "CREATE CONSTRAINT story_data_id IF NOT EXISTS FOR (storyData:StoryData) REQUIRE storyData.id IS UNIQUE",
+        "CREATE INDEX story_chunk_story_id IF NOT EXISTS FOR (storyChunk:StoryChunk) ON (storyChunk.story_id)",
+    ]
 
     def __new__(cls):
         if cls._instance is None:
@@ -20,6 +31,26 @@ class Neo4J:
         self.uri = os.getenv("NEO4J_URI")
         username, password = os.getenv("NEO4J_AUTH").split("/")
         self.driver = GraphDatabase.driver(self.uri, auth=(username, password))
+        self.is_schema_ready = False
+        # Set when the database rejected the schema, which is only retried once the database is migrated
+        self.is_schema_rejected = False
+
+    def bootstrap_schema(self):
+        if self.is_schema_ready or self.is_schema_rejected:
+            return
+        try:
+            with self.driver.session() as session:
+                for query in self.SCHEMA_QUERIES:
+                    session.run(query)
+            self.is_schema_ready = True
+            logger.info("Neo4J schema constraints and indexes are ready")
+        except TransientError as e:
+            logger.warning(f"Failed to create Neo4J schema, retrying on the next write: {e}")
+        except Neo4jError as e:  # Duplicated ids from before the constraints block them from being created
+            self.is_schema_rejected = True
+            logger.error(f"Failed to create Neo4J schema, run scripts/migrate-schema.py to migrate the database: {e}")
+        except DriverError as e:
+            logger.warning(f"Failed to create Neo4J schema, the database is unavailable, retrying on the next write: {e}")
 
     def with_session(self, func: Callable, *args, **kwargs):
         with self.driver.session() as session:
@@ -30,3 +61,70 @@ class Neo4J:
 
     def __str__(self):
         return f"Neo4J(uri={self.uri})"
+
+
+class SQLite:
+    _instance = None
+    SCHEMA_QUERIES = [
+        ("CREATE TABLE IF NOT EXISTS story_data (id TEXT PRIMARY KEY, title TEXT, genre TEXT, themes TEXT, "
+         "main_scenes TEXT, main_characters TEXT, synopsis TEXT, chapter_synopses TEXT, beginning TEXT, endings TEXT, "
+         "generated_by TEXT, approach TEXT, initial_history BLOB)"),
+        ("CREATE TABLE IF NOT EXISTS story_chunks (id TEXT PRIMARY KEY, story_id TEXT NOT NULL, chapter INTEGER, "
+         "story_so_far TEXT, story TEXT, history BLOB, history_storage TEXT, num_opportunities INTEGER)"),
+        ("CREATE TABLE IF NOT EXISTS branches (source_id TEXT NOT NULL, branched_id TEXT NOT NULL, choice TEXT NOT NULL, "
+         "PRIMARY KEY (source_id, branched_id, choice))"),
+        "CREATE TABLE IF NOT EXISTS start_chunks (story_id TEXT NOT NULL, chunk_id TEXT NOT NULL, PRIMARY KEY (story_id, chunk_id))",
+        # History lookups walk the branches backwards, syncs read a whole story at once
+        "CREATE INDEX IF NOT EXISTS branches_branched_id ON branches (branched_id)",
+        "CREATE INDEX IF NOT EXISTS story_chunks_story_id ON story_chunks (story_id)",
+    ]
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SQLite, cls).__new__(cls)
+            cls._instance._initialize()
+            logger.info("SQLite instance created")
+        return cls._instance
+
+    def _initialize(self):
+        self.path = Path(os.getenv("SQLITE_PATH", "outputs/story-graph.sqlite3"))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # WAL lets readers and other generation processes use the file while a write is committed
+        self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.lock = threading.Lock()
+        self.is_schema_ready = False
+
+    def bootstrap_schema(self):
+        if self.is_schema_ready:
+            return
+        with self.transaction() as connection:
+            for query in self.SCHEMA_QUERIES:
+                connection.execute(query)
+        self.is_schema_ready = True
+        logger.info(f"SQLite schema is ready in {self.path}")
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def query(self, query: str, parameters: tuple | dict = ()) -> list[sqlite3.Row]:
+        with self.lock:
+            cursor = self.connection.execute(query, parameters)
+            cursor.row_factory = sqlite3.Row
+            return cursor.fetchall()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def __str__(self):
+        return f"SQLite(path={self.path})"
@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from typing import Optional
 
 import ujson
 from loguru import logger
@@ -9,16 +10,18 @@ import src.algorithms.proposed as proposed
 from src.algorithms.core import initialize_generation
 from src.bg_remover.bria import Bria
 from src.models.enums.generation_approach import GenerationApproach
+from src.models.enums.repository_backend import RepositoryBackend
 from src.models.generation_config import GenerationConfig
 from src.models.generation_context import GenerationContext
+from src.models.retry_policy import get_retry_policy
 from src.models.story_data import StoryData
-from src.repository import CommonRepository
+from src.repository import get_repository, get_repository_backend
 from src.utils.generative_models import (get_generation_model,
                                          get_image_generation_model)
 
 
-def run_generation_with(config: GenerationConfig, approach: GenerationApproach) -> StoryData:
-    generation_context = GenerationContext(approach, config)
+def run_generation_with(config: GenerationConfig, approach: GenerationApproach, story_id: Optional[str] = None) -> StoryData:
+    generation_context = GenerationContext(approach, config, story_id)
     logger.info(f"Generation context: {generation_context}")
 
     initialize_context(generation_context)
@@ -35,14 +38,19 @@ def run_generation_with(config: GenerationConfig, approach: GenerationApproach)
     return story_data
 
 
-def run_resume_generation_with(story_id: str, approach: GenerationApproach):
+def run_resume_generation_with(story_id: str, approach: GenerationApproach,
+                               repository_backend: Optional[RepositoryBackend] = None):
     story_path = Path("outputs") / approach.value / story_id
     with open(story_path / "context.json", "r") as context_file:
         generation_context = GenerationContext.from_dict(ujson.load(context_file))
+    if repository_backend is not None:
+        generation_context.config.repository_backend = repository_backend
 
     if generation_context.is_generation_completed:
         logger.info("Generation already completed")
+        get_repository(generation_context.config.repository_backend).flush()  # Writes still queued by the previous run are replayed
         return
+    logger.info(f"Frontiers restored from journal: {len(generation_context.get_frontiers())}")
     
     with open(story_path / "plot.json", "r") as plot_file:
         content = ujson.load(plot_file)
@@ -50,6 +58,7 @@ def run_resume_generation_with(story_id: str, approach: GenerationApproach):
     
     logger.info(f"Generation context: {generation_context}")
     initialize_context(generation_context)
+    logger.info(f"Repository writes queued by the previous run: {generation_context.repository.get_num_pending_writes()}")
 
     if approach is GenerationApproach.BASELINE:
         baseline.process_generation_queue(generation_context, story_data)
@@ -62,8 +71,13 @@ def run_resume_generation_with(story_id: str, approach: GenerationApproach):
 
 
 def initialize_context(ctx: GenerationContext):
-    ctx.repository = CommonRepository()
-    ctx.generation_model = get_generation_model(os.getenv("GENERATION_MODEL"), ctx.config.seed)
+    if ctx.config.repository_backend is None:  # Stored in the context so a resumed run writes to the same backend
+        ctx.config.repository_backend = get_repository_backend()
+    ctx.repository = get_repository(ctx.config.repository_backend)
+    ctx.retry_policy = get_retry_policy()
+    ctx.generation_model = get_generation_model(os.getenv("GENERATION_MODEL"), ctx.config.seed, ctx.retry_policy)
+    if ctx.config.batch_api and not ctx.generation_model.supports_batch:
+        logger.warning(f"{ctx.generation_model.model_name} has no batch API, story chunks are requested individually")
     ctx.background_remover_model = Bria()
     if ctx.config.enable_image_generation:
         ctx.image_generation_model = get_image_generation_model(os.getenv("IMAGE_GENERATION_MODEL"))
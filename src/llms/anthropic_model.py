@@ -1,51 +1,84 @@
-import copy
 import os
-from time import sleep
 
 from anthropic import (Anthropic, APIConnectionError, APIStatusError,
                        APITimeoutError, RateLimitError)
-from loguru import logger
+from anthropic.types import Message
 
 from src.llms.llm import LLM
-from src.types.openai import (ConversationHistory, InputTokenCount,
-                              ModelResponse, OutputTokenCount)
-from src.utils.anthropic_ai import map_openai_history_to_anthropic_history
+from src.llms.stream_validator import JSONStreamValidator
+from src.llms.token_estimator import TokenEstimator
+from src.types.openai import (CachedInputTokenCount, ConversationHistory,
+                              InputTokenCount, ModelResponse, OutputTokenCount)
+from src.utils.anthropic_ai import (map_openai_history_to_anthropic_history,
+                                    mark_anthropic_cache_breakpoints)
 
 
 class AnthropicModel(LLM):
+    provider = "anthropic"
+    retryable_errors = (APITimeoutError, APIConnectionError, RateLimitError, APIStatusError)
+    throttling_errors = (RateLimitError,)
+    timeout_errors = (APITimeoutError,)
+    # The estimator memoizes the base counts and applies the latest calibration ratio on every call
+    memoize_token_counts = False
+
     def __init__(self, model_name: str, max_tokens: int = 200000):
         super().__init__(model_name, max_tokens)
         self.client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), timeout=60)
         self.max_tokens = max_tokens
+        self.token_estimator = TokenEstimator(calibration_interval=int(os.getenv("TOKEN_ESTIMATOR_CALIBRATION_INTERVAL", "10")))
 
     def count_token(self, message: str) -> int:
-        return self.client.count_tokens(message)
+        return self.token_estimator.estimate(message)
+
+    def get_request_parameters(self) -> dict:
+        return {**super().get_request_parameters(), "max_output_tokens": 4096}
+
+    def get_request_messages(self, history: ConversationHistory) -> tuple[list, list]:
+        copied_messages = map_openai_history_to_anthropic_history(history)
+        return copied_messages, mark_anthropic_cache_breakpoints(copied_messages, self.get_cache_breakpoints(copied_messages))
+
+    def get_usage(self, copied_messages: list, chat_completion: Message) -> tuple[InputTokenCount, OutputTokenCount,
+                                                                                  CachedInputTokenCount]:
+        # Input tokens exclude the tokens read from or written to the prompt cache
+        cache_read_tokens = getattr(chat_completion.usage, "cache_read_input_tokens", None) or 0
+        cache_creation_tokens = getattr(chat_completion.usage, "cache_creation_input_tokens", None) or 0
+        input_tokens = chat_completion.usage.input_tokens + cache_read_tokens + cache_creation_tokens
+        self.token_estimator.calibrate([message["content"] for message in copied_messages], input_tokens)
+        return input_tokens, chat_completion.usage.output_tokens, cache_read_tokens
 
-    def generate_content(self, messages: ConversationHistory) -> tuple[ConversationHistory, ModelResponse, 
-                                                                       InputTokenCount, OutputTokenCount]:
-        logger.debug(f"Starting chat completion with model: {self.model_name}")
+    def request_content(self, history: ConversationHistory) -> tuple[ConversationHistory, ModelResponse,
+                                                                     InputTokenCount, OutputTokenCount,
+                                                                     CachedInputTokenCount]:
+        copied_messages, request_messages = self.get_request_messages(history)
 
-        copied_messages = copy.deepcopy(messages)
+        chat_completion = self.client.messages.create(
+            model=self.model_name,
+            messages=request_messages,
+            max_tokens=4096,
+            extra_headers={"anthropic-beta": "prompt-caching-2024-07-31"}
+        )
 
-        copied_messages = self.rolling_history(copied_messages)
-        copied_messages = map_openai_history_to_anthropic_history(copied_messages)
+        response = chat_completion.content[0].text.strip()
+        return copied_messages, response, *self.get_usage(copied_messages, chat_completion)
 
-        try:
-            chat_completion = self.client.messages.create(
-                model=self.model_name,
-                messages=copied_messages,
-                max_tokens=4096
-            )
+    def stream_content(self, history: ConversationHistory,
+                       validator: JSONStreamValidator) -> tuple[ConversationHistory, ModelResponse, InputTokenCount,
+                                                                OutputTokenCount, CachedInputTokenCount]:
+        copied_messages, request_messages = self.get_request_messages(history)
 
-            response = chat_completion.content[0].text.strip()
-            input_tokens = chat_completion.usage.input_tokens
-            output_tokens = chat_completion.usage.output_tokens
+        # Leaving the block closes the connection, which cancels the generation when the validator aborts
+        with self.client.messages.stream(
+            model=self.model_name,
+            messages=request_messages,
+            max_tokens=4096,
+            extra_headers={"anthropic-beta": "prompt-caching-2024-07-31"}
+        ) as stream:
+            for text in stream.text_stream:
+                validator.feed(text)
+            chat_completion = stream.get_final_message()
 
-            return copied_messages, response, input_tokens, output_tokens
-        except (APITimeoutError, APIConnectionError, RateLimitError, APIStatusError) as e:
-            logger.warning(f"Anthropic API error: {e}")
-            sleep(3)
-            return self.generate_content(messages)
+        response = validator.get_response().strip()
+        return copied_messages, response, *self.get_usage(copied_messages, chat_completion)
 
     def __str__(self):
         return f"AnthropicModel(model_name={self.model_name}, max_tokens={self.max_tokens})"
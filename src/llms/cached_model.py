@@ -0,0 +1,129 @@
+import threading
+
+from loguru import logger
+from typing_extensions import Optional
+
+from src.llms.llm import LLM
+from src.llms.response_cache import ResponseCache
+from src.llms.stream_validator import JSONStreamValidator
+from src.models.enums.llm_cache_mode import LLMCacheMode
+from src.models.shared_history import SharedHistory
+from src.types.openai import (BatchResult, CachedInputTokenCount,
+                              ConversationHistory, InputTokenCount,
+                              ModelResponse, OutputTokenCount)
+from src.utils.openai_ai import to_conversation_history
+
+
+class CachedModel(LLM):
+    def __init__(self, model: LLM, cache: ResponseCache, mode: LLMCacheMode):
+        super().__init__(model.model_name, model.max_tokens)
+        self.model = model
+        self.cache = cache
+        self.mode = mode
+        self.supports_batch = model.supports_batch
+        # Recorded responses are only stored once accepted, so a content retry is not answered with the same invalid one
+        self._pending_entries: dict[str, tuple[ConversationHistory, ModelResponse, InputTokenCount, OutputTokenCount,
+                                               CachedInputTokenCount]] = {}
+        self._pending_lock = threading.Lock()
+
+    def count_token(self, message: str) -> int:
+        return self.model.count_token(message)
+
+    def get_request_parameters(self) -> dict:
+        return self.model.get_request_parameters()
+
+    def request_content(self, history: ConversationHistory) -> tuple[ConversationHistory, ModelResponse,
+                                                                     InputTokenCount, OutputTokenCount,
+                                                                     CachedInputTokenCount]:
+        return self.model.request_content(history)
+
+    def stream_content(self, history: ConversationHistory,
+                       validator: JSONStreamValidator) -> tuple[ConversationHistory, ModelResponse, InputTokenCount,
+                                                                OutputTokenCount, CachedInputTokenCount]:
+        return self.model.stream_content(history, validator)
+
+    def generate_content(self, messages: ConversationHistory | SharedHistory,
+                         validator: Optional[JSONStreamValidator] = None) -> tuple[ConversationHistory, ModelResponse,
+                                                                                   InputTokenCount, OutputTokenCount,
+                                                                                   CachedInputTokenCount]:
+        if self.mode is LLMCacheMode.PASSTHROUGH:
+            return self.model.generate_content(messages, validator)
+
+        key = self.get_key(messages)
+        entry = self.get_entry(key)
+        if entry is not None:
+            return entry
+
+        logger.debug(f"Response cache miss: {key}")
+        result = self.model.generate_content(messages, validator)
+        self.put_pending_entry(key, result)
+        return result
+
+    def generate_batch(self, messages_list: list[ConversationHistory | SharedHistory]) -> list[BatchResult]:
+        if self.mode is LLMCacheMode.PASSTHROUGH:
+            return self.model.generate_batch(messages_list)
+
+        keys = [self.get_key(messages) for messages in messages_list]
+        results: list[Optional[BatchResult]] = []
+        for key in keys:
+            try:
+                results.append(self.get_entry(key))
+            except ValueError as e:  # Not cached in replay mode, which only fails this request
+                results.append(e)
+
+        missed_indices = [idx for idx, result in enumerate(results) if result is None]
+        if missed_indices:
+            logger.debug(f"Response cache missed {len(missed_indices)}/{len(keys)} batch requests")
+            for idx, result in zip(missed_indices, self.model.generate_batch([messages_list[idx] for idx in missed_indices])):
+                if not isinstance(result, Exception):
+                    self.put_pending_entry(keys[idx], result)
+                results[idx] = result
+        return results
+
+    def accept_response(self, messages: ConversationHistory | SharedHistory):
+        if self.mode is LLMCacheMode.PASSTHROUGH:
+            return
+        key = self.get_key(messages)
+        with self._pending_lock:
+            result = self._pending_entries.pop(key, None)
+        if result is not None:
+            self.put_entry(key, result)
+
+    def put_pending_entry(self, key: str, result: tuple[ConversationHistory, ModelResponse, InputTokenCount,
+                                                        OutputTokenCount, CachedInputTokenCount]):
+        # A retry of the same messages replaces the rejected response
+        with self._pending_lock:
+            self._pending_entries[key] = result
+
+    def get_key(self, messages: ConversationHistory | SharedHistory) -> str:
+        return self.cache.get_key(self.model_name, to_conversation_history(messages), getattr(self.model, "seed", None),
+                                  self.model.get_request_parameters())
+
+    def get_entry(self, key: str) -> Optional[tuple[ConversationHistory, ModelResponse, InputTokenCount,
+                                                     OutputTokenCount, CachedInputTokenCount]]:
+        entry = self.cache.get(key)
+        if entry is not None:
+            logger.debug(f"Response cache hit: {key}")
+            return (entry["history"], entry["response"], entry["input_tokens"], entry["output_tokens"],
+                    entry["cached_input_tokens"])
+        if self.mode is LLMCacheMode.REPLAY:
+            raise ValueError(f"No cached response for request {key} in replay mode")
+        return None
+
+    def put_entry(self, key: str, result: tuple[ConversationHistory, ModelResponse, InputTokenCount, OutputTokenCount,
+                                                CachedInputTokenCount]):
+        history, response, input_tokens, output_tokens, cached_input_tokens = result
+        self.cache.put(key, {
+            "model_name": self.model_name,
+            "history": history,
+            "response": response,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cached_input_tokens": cached_input_tokens
+        })
+
+    def get_stats(self) -> dict:
+        return self.model.get_stats()
+
+    def __str__(self):
+        return f"CachedModel(model={self.model}, mode={self.mode.value}, entries={len(self.cache)})"
@@ -0,0 +1,94 @@
+import statistics
+import threading
+import time
+from collections import deque
+
+from loguru import logger
+
+from src.models.enums.request_outcome import RequestOutcome
+
+
+class ConcurrencyController:
+    def __init__(self, initial_limit: int = 4, min_limit: int = 1, max_limit: int = 64, decrease_factor: float = 0.5,
+                 latency_tolerance: float = 3.0, max_error_rate: float = 0.1, window_size: int = 100,
+                 min_decrease_interval: float = 1.0):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        # A request slower than this multiple of the median latency means the provider is queueing requests
+        self.latency_tolerance = latency_tolerance
+        self.max_error_rate = max_error_rate
+        self.min_decrease_interval = min_decrease_interval
+        self.num_in_flight = 0
+        self._latencies: deque[float] = deque(maxlen=window_size)
+        self._outcomes: deque[RequestOutcome] = deque(maxlen=window_size)
+        self._last_decreased_at = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self.num_in_flight < int(self.limit))
+            self.num_in_flight += 1
+
+    def release(self, latency: float, outcome: RequestOutcome):
+        with self._condition:
+            self.num_in_flight -= 1
+            self._outcomes.append(outcome)
+            if outcome is RequestOutcome.SUCCESS:
+                self._latencies.append(latency)
+
+            previous_limit = self.limit
+            if outcome in (RequestOutcome.THROTTLED, RequestOutcome.TIMEOUT):
+                # Requests sent before the first throttling signal fail together, they only count as one decrease
+                now = time.monotonic()
+                if now - self._last_decreased_at >= max(self.min_decrease_interval, self.get_latency_percentile(50)):
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self._last_decreased_at = now
+            elif outcome is RequestOutcome.SUCCESS and self.is_healthy(latency):
+                # Grows by about one request for every limit requests, as TCP congestion avoidance does
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+            stats = self.get_stats()
+
+        if stats["limit"] != int(previous_limit):
+            logger.info(f"Concurrency limit {int(previous_limit)} -> {stats['limit']} after a {outcome.value} request: {stats}")
+
+    def is_healthy(self, latency: float) -> bool:
+        if self.get_error_rate() > self.max_error_rate:
+            return False
+        return len(self._latencies) < 10 or latency <= self.latency_tolerance * self.get_latency_percentile(50)
+
+    def get_latency_percentile(self, percentile: int) -> float:
+        if not self._latencies:
+            return 0.0
+        if len(self._latencies) == 1:
+            return self._latencies[0]
+        return statistics.quantiles(self._latencies, n=100, method="inclusive")[percentile - 1]
+
+    def get_rate(self, outcomes: tuple[RequestOutcome, ...]) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for outcome in self._outcomes if outcome in outcomes) / len(self._outcomes)
+
+    def get_throttle_rate(self) -> float:
+        return self.get_rate((RequestOutcome.THROTTLED, RequestOutcome.TIMEOUT))
+
+    def get_error_rate(self) -> float:
+        return self.get_rate((RequestOutcome.THROTTLED, RequestOutcome.TIMEOUT, RequestOutcome.ERROR))
+
+    def get_stats(self) -> dict:
+        with self._condition:  # The condition lock is reentrant, release already holds it
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.num_in_flight,
+                "latency_p50": round(self.get_latency_percentile(50), 3),
+                "latency_p90": round(self.get_latency_percentile(90), 3),
+                "latency_p99": round(self.get_latency_percentile(99), 3),
+                "throttle_rate": round(self.get_throttle_rate(), 3),
+                "error_rate": round(self.get_error_rate(), 3),
+                "abort_rate": round(self.get_rate((RequestOutcome.ABORTED,)), 3),
+            }
+
+    def __str__(self):
+        return f"ConcurrencyController({', '.join(f'{key}={value}' for key, value in self.get_stats().items())})"
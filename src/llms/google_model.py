@@ -1,16 +1,18 @@
-import copy
 import os
-from time import sleep
 
 import google.generativeai as genai
 from google.ai.generativelanguage_v1beta import Content
 from google.api_core.exceptions import (DeadlineExceeded, InternalServerError,
                                         ServiceUnavailable, TooManyRequests)
-from google.generativeai.types import HarmBlockThreshold, HarmCategory
-from loguru import logger
+from google.generativeai import ChatSession
+from google.generativeai.types import (GenerateContentResponse,
+                                       HarmBlockThreshold, HarmCategory)
 
 from src.llms.llm import LLM
-from src.types.openai import ConversationHistory, ModelResponse, InputTokenCount, OutputTokenCount
+from src.llms.stream_validator import JSONStreamValidator
+from src.llms.token_estimator import TokenEstimator
+from src.types.openai import (CachedInputTokenCount, ConversationHistory,
+                              InputTokenCount, ModelResponse, OutputTokenCount)
 from src.utils.google_ai import (map_google_history_to_openai_history,
                                  map_openai_history_to_google_history)
 
@@ -23,14 +25,24 @@ safety_settings={
 
 
 class GoogleModel(LLM):
+    provider = "google"
+    retryable_errors = (ServiceUnavailable, InternalServerError, TooManyRequests, DeadlineExceeded)
+    throttling_errors = (TooManyRequests,)
+    timeout_errors = (DeadlineExceeded,)
+    # The estimator memoizes the base counts and applies the latest calibration ratio on every call
+    memoize_token_counts = False
+
     def __init__(self, model_name: str, max_tokens: int = 32768):
         super().__init__(model_name, max_tokens)
         genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
         self.client = genai.GenerativeModel(self.model_name)
+        self.token_estimator = TokenEstimator(calibration_interval=int(os.getenv("TOKEN_ESTIMATOR_CALIBRATION_INTERVAL", "10")))
 
     def count_token(self, message: str) -> int:
-        count = genai.GenerativeModel(self.model_name).count_tokens(message).total_tokens
-        return count
+        return self.token_estimator.estimate(message)
+
+    def count_exact_token(self, message: str) -> int:
+        return self.client.count_tokens(message).total_tokens
 
     @staticmethod
     def get_history_message(messages: list[Content]) -> str:
@@ -39,34 +51,54 @@ class GoogleModel(LLM):
             history += f"{message.parts[0].text} "
         return history
 
-    def generate_content(self, messages: ConversationHistory) -> tuple[ConversationHistory, ModelResponse, 
-                                                                       InputTokenCount, OutputTokenCount]:
-        logger.debug(f"Starting chat completion with model: {self.model_name}")
-
-        copied_messages: ConversationHistory = copy.deepcopy(messages)
-        copied_messages = self.rolling_history(copied_messages)
-        last_message = copied_messages.pop()
+    def start_chat(self, history: ConversationHistory) -> tuple[ChatSession, list[Content], dict]:
+        last_message = history[-1]
         if last_message["role"] == "system" or last_message["role"] == "assistant":
             raise ValueError(f"Last message role is not user: {last_message['role']}")
-        current_message = last_message["content"]
 
-        copied_messages = map_openai_history_to_google_history(copied_messages)
-        chat = self.client.start_chat(history=copied_messages)
+        copied_messages = map_openai_history_to_google_history(history[:-1])
+        return self.client.start_chat(history=copied_messages), copied_messages, last_message
+
+    def get_usage(self, copied_messages: list[Content], last_message: dict, response: str,
+                  chat_completion: GenerateContentResponse) -> tuple[ConversationHistory, InputTokenCount,
+                                                                     OutputTokenCount, CachedInputTokenCount]:
+        copied_messages = copied_messages + map_openai_history_to_google_history([last_message])
+        prompt_message = self.get_history_message(copied_messages)
+        prompt_tokens = self.count_exact_token(prompt_message)
+        response_tokens = self.count_exact_token(response)
+        self.token_estimator.calibrate([prompt_message], prompt_tokens)
+        # Context caching is not available in this SDK version, so only explicitly reported cached tokens are recorded
+        usage_metadata = getattr(chat_completion, "usage_metadata", None)
+        cached_prompt_tokens = getattr(usage_metadata, "cached_content_token_count", None) or 0
+
+        return map_google_history_to_openai_history(copied_messages), prompt_tokens, response_tokens, cached_prompt_tokens
+
+    def request_content(self, history: ConversationHistory) -> tuple[ConversationHistory, ModelResponse,
+                                                                     InputTokenCount, OutputTokenCount,
+                                                                     CachedInputTokenCount]:
+        chat, copied_messages, last_message = self.start_chat(history)
+
+        chat_completion = chat.send_message(last_message["content"], safety_settings=safety_settings)
 
-        try:
-            chat_completion = chat.send_message(current_message, safety_settings=safety_settings)
+        response = chat_completion.text.strip()
+        history, prompt_tokens, response_tokens, cached_prompt_tokens = \
+            self.get_usage(copied_messages, last_message, response, chat_completion)
+        return history, response, prompt_tokens, response_tokens, cached_prompt_tokens
 
-            response = chat_completion.text.strip()
+    def stream_content(self, history: ConversationHistory,
+                       validator: JSONStreamValidator) -> tuple[ConversationHistory, ModelResponse, InputTokenCount,
+                                                                OutputTokenCount, CachedInputTokenCount]:
+        chat, copied_messages, last_message = self.start_chat(history)
 
-            copied_messages = copied_messages + map_openai_history_to_google_history([last_message])
-            prompt_tokens = self.count_token(self.get_history_message(copied_messages))
-            response_tokens = self.count_token(response)
+        # The response is not read any further when the validator aborts, which drops the stream
+        chat_completion = chat.send_message(last_message["content"], safety_settings=safety_settings, stream=True)
+        for chunk in chat_completion:
+            validator.feed(chunk.text)
 
-            return map_google_history_to_openai_history(copied_messages), response, prompt_tokens, response_tokens
-        except (ServiceUnavailable, InternalServerError, TooManyRequests, DeadlineExceeded) as e:
-            logger.warning(f"Google API error: {e}")
-            sleep(3)
-            return self.generate_content(messages)
+        response = validator.get_response().strip()
+        history, prompt_tokens, response_tokens, cached_prompt_tokens = \
+            self.get_usage(copied_messages, last_message, response, chat_completion)
+        return history, response, prompt_tokens, response_tokens, cached_prompt_tokens
 
     def __str__(self):
         return f"GoogleModel(model_name={self.model_name}, max_tokens={self.max_tokens})"
@@ -1,31 +1,79 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import accumulate
+from time import monotonic, sleep
+from typing import Optional
 
 from loguru import logger
 
-from src.types.openai import (ConversationHistory, InputTokenCount,
+from src.llms.concurrency_controller import ConcurrencyController
+from src.llms.rate_limiter import RateLimiter
+from src.llms.stream_validator import JSONStreamValidator, StreamAbortedError
+from src.models.enums.request_outcome import RequestOutcome
+from src.models.enums.retry_kind import RetryKind
+from src.models.retry_policy import RetryPolicy
+from src.models.shared_history import SharedHistory
+from src.types.openai import (BatchResult, CachedInputTokenCount,
+                              ConversationHistory, InputTokenCount,
                               ModelResponse, OutputTokenCount)
+from src.utils.openai_ai import to_conversation_history
 
 
 class LLM(ABC):
+    # Requests to the same provider and model share a rate limit
+    provider = "local"
+    # Provider errors after which the request is sent again, and those that signal the provider is overloaded
+    retryable_errors: tuple[type[Exception], ...] = ()
+    throttling_errors: tuple[type[Exception], ...] = ()
+    timeout_errors: tuple[type[Exception], ...] = ()
+    # Providers with an asynchronous batch endpoint implement submit_batch and poll_batch
+    supports_batch = False
+
+    # The plot prompt and StoryData response (index 1) and the first story chunk (index 3) are kept verbatim by
+    # rolling_history, so they form a prefix shared by every request that providers can cache
+    cache_breakpoints = (1, 3)
+
+    # Bounds the memoized token counts, a story tree rarely has more distinct messages than this
+    token_count_cache_size = 65536
+    # Models whose count changes over time, such as a calibrated estimate, memoize only the stable part themselves
+    memoize_token_counts = True
+
     def __init__(self, model_name: str, max_tokens: int):
         self.model_name = model_name
         self.max_tokens = max_tokens
+        # Resolved lazily so instances whose count_token is replaced still use the replacement
+        if self.memoize_token_counts:
+            self._count_cached_token = lru_cache(maxsize=self.token_count_cache_size)(lambda message: self.count_token(message))
+        else:
+            self._count_cached_token = lambda message: self.count_token(message)
+        self.rate_limiter: Optional[RateLimiter] = None
+        self.concurrency_controller: Optional[ConcurrencyController] = None
+        self.retry_policy = RetryPolicy()
+        # Streams responses that have a validator, so one that cannot be valid is cancelled before it completes
+        self.streaming = False
+        # Output tokens reserved from the rate limiter before a response says how many were generated
+        self.expected_output_tokens = 1024
+        # Batches complete within hours, so they are polled less often the longer they take
+        self.batch_poll_interval = 5.0
+        self.batch_max_poll_interval = 60.0
+        self.batch_timeout = 24 * 60 * 60.0
 
-    @staticmethod
     @abstractmethod
-    def count_token(message: str) -> int:
+    def count_token(self, message: str) -> int:
         pass
 
+    def get_token_prefix_sums(self, history: ConversationHistory) -> list[int]:
+        # prefix_sums[i] is the number of tokens in history[:i]
+        return [0, *accumulate(self._count_cached_token(message["content"]) for message in history)]
+
     def rolling_history(self, history: ConversationHistory) -> ConversationHistory:
         logger.debug(f"Starting rolling history with max tokens: {self.max_tokens}")
-        count_tokens = 0
-        first_part_history_tokens = 0
-        for i, message in enumerate(history):
-            if i < 4:
-                first_part_history_tokens += self.count_token(message["content"])
-            count_tokens += self.count_token(message["content"])
+        prefix_sums = self.get_token_prefix_sums(history)
+        count_tokens = prefix_sums[-1]
+        first_part_history_tokens = prefix_sums[min(4, len(history))]
 
         if count_tokens > self.max_tokens * 0.8:  # Total tokens is over 80% of the limit
             n_history = len(history)
@@ -34,26 +82,34 @@ class LLM(ABC):
             new_history = []
             if history[-1]["role"] == "user":  # If the last message is user message, keep it
                 new_history.append(history[-1])
-                count_tokens = self.count_token(history[-1]["content"])
+                count_tokens = prefix_sums[n_history] - prefix_sums[n_history - 1]
                 start_idx = n_history - 2  # Start from the latest assistant message
             elif history[-1]["role"] == "assistant":  # If the last message is assistant message, throw an error.
                 # Since this is a history used to interact with LLMs, the last message must be a user message.
                 raise ValueError(f"History is not in the correct conversation format: {history[-1]['role']}")
 
-            # Do it in reverse order
-            for idx in range(start_idx, 3, -2):
+            # Pairs are taken from the latest one backwards while the total stays within 60%. Adding the k latest pairs
+            # costs prefix_sums[start_idx + 1] - prefix_sums[start_idx + 1 - 2k], which only grows with k, so the
+            # first pair over the limit is found by a binary search.
+            num_pairs = len(range(start_idx, 3, -2))
+            limit = self.max_tokens * 0.6 - first_part_history_tokens
+
+            def get_pairs_tokens(num_latest_pairs: int) -> int:
+                return prefix_sums[start_idx + 1] - prefix_sums[start_idx + 1 - 2 * num_latest_pairs]
+
+            num_kept_pairs = bisect_left(range(1, num_pairs + 1), True,
+                                         key=lambda k: count_tokens + get_pairs_tokens(k) > limit)
+            num_examined_pairs = min(num_kept_pairs + 1, num_pairs)  # Includes the pair that went over the limit
+            for idx in range(start_idx, start_idx - 2 * num_examined_pairs, -2):
                 if history[idx]["role"] != "assistant" or history[idx - 1]["role"] != "user":
                     raise ValueError(f"History is not in the correct conversation format: "
                                      f"{history[idx]["role"]} {history[idx - 1]["role"]}")
+            count_tokens += get_pairs_tokens(num_examined_pairs)
 
-                assistant_message = history[idx]
-                user_message = history[idx - 1]
-                count_tokens += self.count_token(assistant_message["content"]) + self.count_token(
-                    user_message["content"])
-                if count_tokens > self.max_tokens * 0.6 - first_part_history_tokens:  # Rolling history until 60%
-                    break
-                new_history.append(assistant_message)
-                new_history.append(user_message)
+            # Do it in reverse order
+            for idx in range(start_idx, start_idx - 2 * num_kept_pairs, -2):
+                new_history.append(history[idx])
+                new_history.append(history[idx - 1])
 
             # Keep story data and the first story chunk
             for message in history[:4][::-1]:
@@ -69,11 +125,115 @@ class LLM(ABC):
             logger.debug(f"History is within token limit: {count_tokens}/{self.max_tokens}. No need to roll.")
             return history
 
+    def get_request_parameters(self) -> dict:
+        # Everything besides the messages that changes what the model would answer
+        return {"max_tokens": self.max_tokens}
+
+    def get_cache_breakpoints(self, history: ConversationHistory) -> list[int]:
+        return [idx for idx in self.cache_breakpoints if idx < len(history) - 1]
+
+    def generate_content(self, messages: ConversationHistory | SharedHistory,
+                         validator: Optional[JSONStreamValidator] = None) -> tuple[ConversationHistory, ModelResponse,
+                                                                                   InputTokenCount, OutputTokenCount,
+                                                                                   CachedInputTokenCount]:
+        logger.debug(f"Starting chat completion with model: {self.model_name}")
+        history = self.rolling_history(to_conversation_history(messages))
+        return self.retry_policy.call(RetryKind.TRANSPORT, lambda: self.send_request(history, validator),
+                                      self.retryable_errors)
+
+    def send_request(self, history: ConversationHistory,
+                     validator: Optional[JSONStreamValidator] = None) -> tuple[ConversationHistory, ModelResponse,
+                                                                               InputTokenCount, OutputTokenCount,
+                                                                               CachedInputTokenCount]:
+        reserved_tokens = self.get_token_prefix_sums(history)[-1] + self.expected_output_tokens
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(reserved_tokens)
+        if self.concurrency_controller is not None:
+            self.concurrency_controller.acquire()
+
+        start_time = monotonic()
+        outcome = RequestOutcome.ERROR
+        try:
+            if validator is not None and self.streaming:
+                validator.reset()
+                history, response, input_tokens, output_tokens, cached_input_tokens = self.stream_content(history, validator)
+            else:
+                history, response, input_tokens, output_tokens, cached_input_tokens = self.request_content(history)
+            outcome = RequestOutcome.SUCCESS
+        except self.throttling_errors:
+            outcome = RequestOutcome.THROTTLED
+            raise
+        except self.timeout_errors:
+            outcome = RequestOutcome.TIMEOUT
+            raise
+        except StreamAbortedError as e:
+            outcome = RequestOutcome.ABORTED
+            logger.warning(f"{e} after {len(e.response)} characters in {monotonic() - start_time:.2f}s")
+            if self.rate_limiter is not None:  # Only the prompt and the partial response were processed
+                self.rate_limiter.release(self.expected_output_tokens - self.count_token(e.response))
+            raise
+        finally:
+            if self.concurrency_controller is not None:
+                self.concurrency_controller.release(monotonic() - start_time, outcome)
+            if self.rate_limiter is not None and outcome not in (RequestOutcome.SUCCESS, RequestOutcome.ABORTED):
+                self.rate_limiter.release(reserved_tokens)  # The provider did not process the prompt
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.release(reserved_tokens - input_tokens - output_tokens)
+        self.expected_output_tokens += round(0.2 * (output_tokens - self.expected_output_tokens))
+        return history, response, input_tokens, output_tokens, cached_input_tokens
+
+    def generate_batch(self, messages_list: list[ConversationHistory | SharedHistory]) -> list[BatchResult]:
+        # Results are in the order of the requests
+        histories = [self.rolling_history(to_conversation_history(messages)) for messages in messages_list]
+        batch_id = self.retry_policy.call(RetryKind.TRANSPORT, lambda: self.submit_batch(histories), self.retryable_errors)
+        logger.info(f"Submitted batch {batch_id} with {len(histories)} requests to {self.model_name}")
+
+        start_time = monotonic()
+        poll_interval = self.batch_poll_interval
+        while True:
+            sleep(poll_interval)
+            results = self.retry_policy.call(RetryKind.TRANSPORT, lambda: self.poll_batch(batch_id, histories),
+                                             self.retryable_errors)
+            if results is not None:
+                break
+            if monotonic() - start_time > self.batch_timeout:
+                raise TimeoutError(f"Batch {batch_id} did not complete within {self.batch_timeout:.0f}s")
+            poll_interval = min(self.batch_max_poll_interval, poll_interval * 1.5)
+
+        num_failed = sum(1 for result in results if isinstance(result, Exception))
+        logger.info(f"Batch {batch_id} completed in {monotonic() - start_time:.1f}s, {num_failed}/{len(results)} failed")
+        return results
+
+    def accept_response(self, messages: ConversationHistory | SharedHistory):
+        # Called once the response to the messages was parsed and validated
+        pass
+
+    def submit_batch(self, histories: list[ConversationHistory]) -> str:
+        raise NotImplementedError(f"{self} does not support batch requests")
+
+    def poll_batch(self, batch_id: str, histories: list[ConversationHistory]) -> Optional[list[BatchResult]]:
+        # None while the batch is still being processed
+        raise NotImplementedError(f"{self} does not support batch requests")
+
+    def get_stats(self) -> dict:
+        return {} if self.concurrency_controller is None else self.concurrency_controller.get_stats()
+
     @abstractmethod
-    def generate_content(self, messages: ConversationHistory) -> tuple[ConversationHistory, ModelResponse, 
-                                                                       InputTokenCount, OutputTokenCount]:
+    def request_content(self, history: ConversationHistory) -> tuple[ConversationHistory, ModelResponse,
+                                                                     InputTokenCount, OutputTokenCount,
+                                                                     CachedInputTokenCount]:
+        # Sends one request with a history that is already within the context window
         pass
 
+    def stream_content(self, history: ConversationHistory,
+                       validator: JSONStreamValidator) -> tuple[ConversationHistory, ModelResponse, InputTokenCount,
+                                                                OutputTokenCount, CachedInputTokenCount]:
+        # Feeds the response to the validator while it is generated, providers without streaming feed it at once
+        history, response, input_tokens, output_tokens, cached_input_tokens = self.request_content(history)
+        validator.feed(response)
+        return history, response, input_tokens, output_tokens, cached_input_tokens
+
     @abstractmethod
     def __str__(self):
         pass
@@ -1,54 +1,135 @@
-import copy
 import os
-from time import sleep
+from functools import lru_cache
+
+import ujson
 
-from loguru import logger
 from openai import (APIConnectionError, APIError, APITimeoutError, OpenAI,
                     RateLimitError)
-from tiktoken import encoding_for_model
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletion
+from tiktoken import Encoding, encoding_for_model
 from typing_extensions import Optional
 
 from src.llms.llm import LLM
-from src.models.generation_context import GenerationContext
-from src.types.openai import (ConversationHistory, InputTokenCount,
+from src.llms.stream_validator import JSONStreamValidator
+from src.types.openai import (BatchResult, CachedInputTokenCount,
+                              ConversationHistory, InputTokenCount,
                               ModelResponse, OutputTokenCount)
 
 
+@lru_cache
+def get_encoder(model_name: str) -> Encoding:
+    return encoding_for_model(model_name)
+
+
 class OpenAIModel(LLM):
+    provider = "openai"
+    retryable_errors = (APITimeoutError, APIConnectionError, RateLimitError, APIError)
+    throttling_errors = (RateLimitError,)
+    timeout_errors = (APITimeoutError,)
+    supports_batch = True
+
     def __init__(self, model_name: str, max_tokens: int = 16385, seed: Optional[int] = None):
         super().__init__(model_name, max_tokens)
         self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=60)
         self.seed = seed if seed is not None else 42
 
+    def count_token(self, message: str) -> int:
+        return len(get_encoder(self.model_name).encode(message))
+
     @staticmethod
-    def count_token(message: str) -> int:
-        encoder = encoding_for_model(os.getenv("GENERATION_MODEL"))
-        return len(encoder.encode(message))
-
-    def generate_content(self, ctx: GenerationContext, messages: ConversationHistory) -> tuple[ConversationHistory, ModelResponse, 
-                                                                                               InputTokenCount, OutputTokenCount]:
-        logger.debug(f"Starting chat completion with model: {self.model_name}")
-
-        copied_messages = copy.deepcopy(messages)
-        copied_messages = self.rolling_history(copied_messages)
-
-        try:
-            chat_completion = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=copied_messages,
-                response_format={"type": "json_object"},
-                seed=self.seed
-            )
-
-            response = chat_completion.choices[0].message.content.strip()
-            prompt_tokens = chat_completion.usage.prompt_tokens
-            completion_tokens = chat_completion.usage.completion_tokens
-
-            return copied_messages, response, prompt_tokens, completion_tokens
-        except (APITimeoutError, APIConnectionError, RateLimitError, APIError) as e:
-            logger.warning(f"OpenAI API error: {e}")
-            sleep(3)
-            return self.generate_content(ctx, messages)
+    def get_cached_prompt_tokens(usage: CompletionUsage) -> int:
+        # Prompt caching is applied automatically to repeated prefixes, the usage only reports how much was reused
+        details = getattr(usage, "prompt_tokens_details", None)
+        if isinstance(details, dict):
+            return details.get("cached_tokens") or 0
+        return getattr(details, "cached_tokens", None) or 0
+
+    def get_request_parameters(self) -> dict:
+        return {**super().get_request_parameters(), "response_format": "json_object"}
+
+    def request_content(self, history: ConversationHistory) -> tuple[ConversationHistory, ModelResponse,
+                                                                     InputTokenCount, OutputTokenCount,
+                                                                     CachedInputTokenCount]:
+        chat_completion = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=history,
+            response_format={"type": "json_object"},
+            seed=self.seed
+        )
+
+        response = chat_completion.choices[0].message.content.strip()
+        prompt_tokens = chat_completion.usage.prompt_tokens
+        completion_tokens = chat_completion.usage.completion_tokens
+        cached_prompt_tokens = self.get_cached_prompt_tokens(chat_completion.usage)
+
+        return history, response, prompt_tokens, completion_tokens, cached_prompt_tokens
+
+    def stream_content(self, history: ConversationHistory,
+                       validator: JSONStreamValidator) -> tuple[ConversationHistory, ModelResponse, InputTokenCount,
+                                                                OutputTokenCount, CachedInputTokenCount]:
+        usage = None
+        # Leaving the block closes the connection, which cancels the generation when the validator aborts
+        with self.client.chat.completions.create(
+            model=self.model_name,
+            messages=history,
+            response_format={"type": "json_object"},
+            seed=self.seed,
+            stream=True,
+            extra_body={"stream_options": {"include_usage": True}}
+        ) as stream:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    validator.feed(chunk.choices[0].delta.content)
+                usage = getattr(chunk, "usage", None) or usage
+
+        response = validator.get_response().strip()
+        if usage is None:  # Only reported by servers that support stream_options
+            return history, response, self.get_token_prefix_sums(history)[-1], self.count_token(response), 0
+        usage = CompletionUsage.model_validate(usage) if isinstance(usage, dict) else usage
+        return history, response, usage.prompt_tokens, usage.completion_tokens, self.get_cached_prompt_tokens(usage)
+
+    def submit_batch(self, histories: list[ConversationHistory]) -> str:
+        requests = [{
+            "custom_id": str(idx),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": self.model_name, "messages": history, "response_format": {"type": "json_object"},
+                     "seed": self.seed}
+        } for idx, history in enumerate(histories)]
+        input_file = self.client.files.create(
+            file=("batch.jsonl", "".join(ujson.dumps(request) + "\n" for request in requests).encode()),
+            purpose="batch"
+        )
+        return self.client.batches.create(input_file_id=input_file.id, endpoint="/v1/chat/completions",
+                                          completion_window="24h").id
+
+    def poll_batch(self, batch_id: str, histories: list[ConversationHistory]) -> Optional[list[BatchResult]]:
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status in ("validating", "in_progress", "finalizing", "cancelling"):
+            return None
+
+        # Requests of an expired or cancelled batch that were not processed are reported as failed
+        results: list[BatchResult] = [ValueError(f"Batch {batch_id} {batch.status} before the request was processed")
+                                      for _ in histories]
+        for file_id in (batch.error_file_id, batch.output_file_id):
+            if file_id is None:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if line.strip():
+                    output = ujson.loads(line)
+                    idx = int(output["custom_id"])
+                    results[idx] = self.get_batch_result(histories[idx], output)
+        return results
+
+    def get_batch_result(self, history: ConversationHistory, output: dict) -> BatchResult:
+        response = output.get("response") or {}
+        if output.get("error") or response.get("status_code") != 200:
+            return ValueError(f"Batch request failed: {output.get('error') or response.get('body')}")
+
+        chat_completion = ChatCompletion.model_validate(response["body"])
+        return (history, chat_completion.choices[0].message.content.strip(), chat_completion.usage.prompt_tokens,
+                chat_completion.usage.completion_tokens, self.get_cached_prompt_tokens(chat_completion.usage))
 
     def __str__(self):
         return f"OpenAIModel(model_name={self.model_name}, max_tokens={self.max_tokens})"
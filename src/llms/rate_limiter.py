@@ -0,0 +1,91 @@
+import fcntl
+import re
+import threading
+import time
+from pathlib import Path
+
+import ujson
+from loguru import logger
+
+
+class RateLimiter:
+    def __init__(self, path: Path, requests_per_minute: int, tokens_per_minute: int, burst_seconds: float = 10.0):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # A limit of zero is not enforced
+        self.request_rate = requests_per_minute / 60
+        self.token_rate = tokens_per_minute / 60
+        # Providers enforce their per-minute limits over shorter windows, so only a few seconds of quota can be spent at once
+        self.request_capacity = max(1.0, self.request_rate * burst_seconds)
+        self.token_capacity = max(1.0, self.token_rate * burst_seconds)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_path(state_dir: Path, provider: str, model_name: str) -> Path:
+        return state_dir / f"{re.sub(r'[^A-Za-z0-9._-]', '_', f'{provider}-{model_name}')}.json"
+
+    def _read_state(self, file) -> dict:
+        now = time.time()
+        file.seek(0)
+        try:
+            state = ujson.loads(file.read())
+        except ValueError:  # A new state file, or one left incomplete by a crash
+            return {"requests": self.request_capacity, "tokens": self.token_capacity, "updated_at": now}
+
+        elapsed = max(0.0, now - state["updated_at"])
+        return {
+            "requests": min(self.request_capacity, state["requests"] + elapsed * self.request_rate),
+            "tokens": min(self.token_capacity, state["tokens"] + elapsed * self.token_rate),
+            "updated_at": now,
+        }
+
+    @staticmethod
+    def _write_state(file, state: dict):
+        file.seek(0)
+        file.truncate()
+        file.write(ujson.dumps(state))
+        file.flush()
+
+    def _update(self, func):
+        # The thread lock keeps the threads of this process from contending for the file lock of the other processes
+        with self._lock, open(self.path, "a+") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                state = self._read_state(file)
+                result = func(state)
+                self._write_state(file, state)
+                return result
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def acquire(self, num_tokens: int):
+        # A request larger than the bucket waits for a full bucket and leaves it in debt, which delays the next requests
+        needed_tokens = min(num_tokens, self.token_capacity)
+
+        def take(state: dict) -> float:
+            request_wait = 0.0 if self.request_rate <= 0 else (1 - state["requests"]) / self.request_rate
+            token_wait = 0.0 if self.token_rate <= 0 else (needed_tokens - state["tokens"]) / self.token_rate
+            wait = max(request_wait, token_wait)
+            if wait <= 0:
+                state["requests"] -= 1
+                state["tokens"] -= num_tokens
+            return wait
+
+        total_wait = 0.0
+        while (wait := self._update(take)) > 0:
+            time.sleep(wait)
+            total_wait += wait
+        if total_wait > 0:
+            logger.debug(f"Rate limiter waited {total_wait:.2f}s for {num_tokens} tokens in {self.path.name}")
+
+    def release(self, num_tokens: int):
+        # Gives back the tokens that were reserved but not used, or takes the ones used over the reservation
+        def give_back(state: dict):
+            state["tokens"] = min(self.token_capacity, state["tokens"] + num_tokens)
+
+        if self.token_rate > 0 and num_tokens != 0:
+            self._update(give_back)
+
+    def __str__(self):
+        return (f"RateLimiter(path={self.path}, requests_per_minute={self.request_rate * 60:.0f}, "
+                f"tokens_per_minute={self.token_rate * 60:.0f})")
@@ -0,0 +1,75 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import ujson
+from loguru import logger
+
+from src.types.openai import ConversationHistory
+
+
+class ResponseCache:
+    def __init__(self, cache_dir: Path, max_size_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, int] = OrderedDict()  # Least recently used first
+        self._size_bytes = 0
+        for path in sorted(self.cache_dir.glob("*/*.json"), key=lambda p: p.stat().st_mtime):
+            self._entries[path.stem] = path.stat().st_size
+            self._size_bytes += path.stat().st_size
+        logger.debug(f"Response cache loaded with {len(self._entries)} entries ({self._size_bytes} bytes)")
+
+    @staticmethod
+    def get_key(model_name: str, messages: ConversationHistory, seed: Optional[int], parameters: dict) -> str:
+        normalized_messages = [{"role": message["role"], "content": message["content"]} for message in messages]
+        request = ujson.dumps({"model": model_name, "messages": normalized_messages, "seed": seed, "parameters": parameters},
+                              sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(request.encode()).hexdigest()
+
+    def _get_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[dict]:
+        # Read while holding the lock, so a concurrent put cannot evict the entry in between
+        with self._lock:
+            if key not in self._entries:
+                return None
+            path = self._get_path(key)
+            try:
+                os.utime(path)  # Keeps the eviction order across runs
+                with open(path, "r") as file:
+                    value = ujson.load(file)
+            except FileNotFoundError:  # Evicted by another process sharing the cache directory
+                self._size_bytes -= self._entries.pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: dict):
+        path = self._get_path(key)
+        path.parent.mkdir(exist_ok=True)
+        content = ujson.dumps(value)
+        temp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(temp_path, "w") as file:
+            file.write(content)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self._size_bytes += len(content) - self._entries.pop(key, 0)
+            self._entries[key] = len(content)
+            while self._size_bytes > self.max_size_bytes and len(self._entries) > 1:
+                evicted_key, evicted_size = self._entries.popitem(last=False)
+                self._get_path(evicted_key).unlink(missing_ok=True)
+                self._size_bytes -= evicted_size
+                logger.debug(f"Response cache entry {evicted_key} evicted")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,228 @@
+import re
+from typing import Optional
+
+from src.models.story.story_choice import StoryChoice
+from src.models.story.story_narrative import StoryNarrative
+
+NUMBER_PATTERN = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?")
+LITERAL_KINDS = {"true": "boolean", "false": "boolean", "null": "null"}
+LITERAL_CHARS = frozenset("0123456789+-.eEtruefalsn")
+CLOSERS = {"object": "}", "array": "]"}
+# Code fence headers parse_json_string accepts before the JSON
+FENCE_HEADERS = ("", "json")
+# JSON kinds pydantic accepts for a field in lax mode
+FIELD_KINDS = {str: ("string",), int: ("number", "string")}
+
+JSONPath = tuple[str | int, ...]
+
+
+class StreamAbortedError(ValueError):
+    def __init__(self, message: str, response: str):
+        super().__init__(message)
+        self.response = response
+
+
+class JSONStreamValidator:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # A retried request streams a new response
+        self._parts: list[str] = []
+        self._stack: list[dict] = []
+        # Text outside of the validated object: "start" before anything but whitespace, then "prose", "fence_header"
+        # after an opening code fence and "fence" once its header ends
+        self._outside = "start"
+        self._num_backticks = 0
+        self._fence_header: list[str] = []
+        self._in_string = False
+        self._escaped = False
+        self._key: Optional[list[str]] = None
+        self._literal: list[str] = []
+        self._literal_path: JSONPath = ()
+
+    def get_response(self) -> str:
+        return "".join(self._parts)
+
+    def abort(self, reason: str):
+        raise StreamAbortedError(f"Streamed response aborted: {reason}", self.get_response())
+
+    def feed(self, text: str):
+        self._parts.append(text)
+        for char in text:
+            self._feed_char(char)
+
+    def _feed_outside(self, char: str):
+        # Follows parse_json_string, which parses a response that is one object or else its last fenced JSON block.
+        # Validation starts at a "{" that begins the response or a fenced block, so prose or an example object before
+        # the block does not abort the response.
+        if self._outside == "start":
+            if char in " \t\n\r":
+                return
+            if char == "{":
+                self._open("object", ())
+                return
+            self._outside = "prose"
+
+        if self._outside == "prose":
+            self._num_backticks = self._num_backticks + 1 if char == "`" else 0
+            if self._num_backticks == 3:
+                self._outside = "fence_header"
+                self._num_backticks = 0
+                self._fence_header = []
+        elif self._outside == "fence_header":
+            if char != "\n":
+                self._fence_header.append(char)
+            elif "".join(self._fence_header) in FENCE_HEADERS:
+                self._outside = "fence"
+            else:
+                self._outside = "prose"
+        elif self._outside == "fence":
+            if char == "{":  # A later block replaces an earlier one, as parse_json_string parses the last block
+                self._open("object", ())
+            elif char not in " \t\r\n":
+                self._outside = "prose"
+                self._feed_outside(char)
+
+    def _feed_char(self, char: str):
+        if not self._stack:
+            self._feed_outside(char)
+            return
+        if self._in_string:
+            self._feed_string_char(char)
+            return
+        if self._literal:
+            if char in LITERAL_CHARS:
+                self._literal.append(char)
+                return
+            self._end_literal()
+        if char in " \t\n\r":
+            return
+
+        frame = self._stack[-1]
+        state = frame["state"]
+        if state == "colon":
+            if char != ":":
+                self.abort(f"Expected ':' after key {frame['key']!r}, got {char!r}")
+            frame["state"] = "value"
+        elif state == "comma_or_end":
+            if char == ",":
+                frame["state"] = "key" if frame["kind"] == "object" else "value"
+            elif char == CLOSERS[frame["kind"]]:
+                self._close()
+            else:
+                self.abort(f"Expected ',' or {CLOSERS[frame['kind']]!r} in {format_path(frame['path'])}, got {char!r}")
+        elif state in ("key", "key_or_end"):
+            if char == '"':
+                self._in_string = True
+                self._key = []
+            elif char == "}" and state == "key_or_end":
+                self._close()
+            else:
+                self.abort(f"Expected a key in {format_path(frame['path'])}, got {char!r}")
+        elif char == "]" and state == "value_or_end":
+            self._close()
+        else:
+            self._start_value(char)
+
+    def _feed_string_char(self, char: str):
+        if self._escaped:
+            self._escaped = False
+        elif char == "\\":
+            self._escaped = True
+        elif char == '"':
+            self._in_string = False
+            if self._key is not None:
+                frame = self._stack[-1]
+                frame["key"] = "".join(self._key)
+                frame["state"] = "colon"
+                self._key = None
+            return
+        elif char < " ":  # Rejected by json.loads
+            self.abort("Control character in a string")
+        if self._key is not None:
+            self._key.append(char)
+
+    def _start_value(self, char: str):
+        frame = self._stack[-1]
+        if frame["kind"] == "object":
+            frame["keys"].add(frame["key"])
+            path = frame["path"] + (frame["key"],)
+        else:
+            path = frame["path"] + (frame["count"],)
+        frame["count"] += 1
+        frame["state"] = "comma_or_end"  # Nested values are fed to their own frame until they end
+        if char in "{[":
+            kind = "object" if char == "{" else "array"
+            self.check_value(path, kind)
+            self._open(kind, path)
+        elif char == '"':
+            self.check_value(path, "string")
+            self._in_string = True
+        elif char in LITERAL_CHARS:
+            self._literal = [char]
+            self._literal_path = path
+        else:
+            self.abort(f"Unexpected {char!r} at {format_path(path)}")
+
+    def _end_literal(self):
+        literal = "".join(self._literal)
+        self._literal = []
+        if literal in LITERAL_KINDS:
+            self.check_value(self._literal_path, LITERAL_KINDS[literal])
+        elif NUMBER_PATTERN.fullmatch(literal):
+            self.check_value(self._literal_path, "number")
+        else:
+            self.abort(f"Invalid literal {literal!r} at {format_path(self._literal_path)}")
+
+    def _open(self, kind: str, path: JSONPath):
+        self._stack.append({"kind": kind, "path": path, "state": "key_or_end" if kind == "object" else "value_or_end",
+                            "key": None, "keys": set(), "count": 0})
+
+    def _close(self):
+        frame = self._stack.pop()
+        self.check_end(frame["path"], frame["count"], frame["keys"])
+        if not self._stack:  # Text after the object, such as a closing code fence
+            self._outside = "prose"
+
+    def check_value(self, path: JSONPath, kind: str):
+        # Called when a value starts, or ends for numbers and literals whose kind is only known then
+        pass
+
+    def check_end(self, path: JSONPath, num_items: int, keys: set[str]):
+        pass
+
+
+class StoryChunkStreamValidator(JSONStreamValidator):
+    # The items of the StoryChunk fields that are generated by the model, the others are set after the response
+    item_models = {"story": StoryNarrative, "choices": StoryChoice}
+
+    def __init__(self, num_choices: int):
+        self.num_choices = num_choices
+        super().__init__()
+
+    def check_value(self, path: JSONPath, kind: str):
+        if path == ("story_so_far",) and kind != "string":
+            self.abort(f"story_so_far is {kind}, not string")
+        elif len(path) == 1 and path[0] in self.item_models and kind != "array":
+            self.abort(f"{path[0]} is {kind}, not array")
+        elif len(path) == 2 and path[0] in self.item_models and kind != "object":
+            self.abort(f"{format_path(path)} is {kind}, not object")
+        elif len(path) == 3 and path[0] in self.item_models:
+            field = self.item_models[path[0]].model_fields.get(path[2])
+            if field is not None and kind not in FIELD_KINDS.get(field.annotation, (kind,)):
+                self.abort(f"{format_path(path)} is {kind}, not {field.annotation.__name__}")
+
+    def check_end(self, path: JSONPath, num_items: int, keys: set[str]):
+        if path == ("story",) and num_items == 0:
+            self.abort("Story chunk has no story narratives")
+        elif path == ("choices",) and num_items < self.num_choices:
+            self.abort(f"Choices generated by model ({num_items}) less than setting choices ({self.num_choices})")
+        elif len(path) == 2 and path[0] in self.item_models:
+            missing_fields = self.item_models[path[0]].model_fields.keys() - keys
+            if missing_fields:
+                self.abort(f"{format_path(path)} is missing {', '.join(sorted(missing_fields))}")
+
+
+def format_path(path: JSONPath) -> str:
+    return "$" + "".join(f"[{part}]" if isinstance(part, int) else f".{part}" for part in path)
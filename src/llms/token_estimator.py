@@ -0,0 +1,49 @@
+import math
+import re
+import threading
+from functools import lru_cache
+
+from loguru import logger
+
+# ASCII words, short digit groups and every other non-space character, which is roughly how BPE tokenizers split text
+TOKEN_PIECE_PATTERN = re.compile(r"[A-Za-z]+|\d{1,3}|\S")
+
+
+class TokenEstimator:
+    # Average number of characters of an ASCII word covered by one token
+    chars_per_word_token = 6
+
+    def __init__(self, ratio: float = 1.0, calibration_interval: int = 10, smoothing: float = 0.2, cache_size: int = 65536):
+        self.ratio = ratio
+        self.calibration_interval = calibration_interval
+        self.smoothing = smoothing
+        self._num_observations = 0
+        self._count_cached_base_tokens = lru_cache(maxsize=cache_size)(self.count_base_tokens)
+        self._lock = threading.Lock()
+
+    def count_base_tokens(self, message: str) -> int:
+        count = 0
+        for piece in TOKEN_PIECE_PATTERN.findall(message):
+            count += math.ceil(len(piece) / self.chars_per_word_token) if piece.isalpha() and piece.isascii() else 1
+        return count
+
+    def estimate(self, message: str) -> int:
+        return math.ceil(self._count_cached_base_tokens(message) * self.ratio)
+
+    def calibrate(self, messages: list[str], exact_tokens: int):
+        # Moves the ratio towards what the provider counted for every calibration_interval-th request, so the estimate
+        # follows the provider tokenizer without asking it for every message
+        with self._lock:
+            self._num_observations += 1
+            if self.calibration_interval <= 0 or self._num_observations % self.calibration_interval != 0:
+                return
+
+        base_tokens = sum(self._count_cached_base_tokens(message) for message in messages)
+        if base_tokens == 0 or exact_tokens <= 0:
+            return
+        with self._lock:
+            self.ratio += self.smoothing * (exact_tokens / base_tokens - self.ratio)
+        logger.debug(f"Token estimator calibrated: {base_tokens} estimated, {exact_tokens} exact, ratio {self.ratio:.3f}")
+
+    def __str__(self):
+        return f"TokenEstimator(ratio={self.ratio:.3f})"
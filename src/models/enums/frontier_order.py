@@ -0,0 +1,8 @@
+from enum import Enum
+
+
+class FrontierOrder(str, Enum):
+    BFS = "bfs"
+    DFS = "dfs"
+    CHAPTER = "chapter"
+    PATH_FIRST = "path_first"
@@ -0,0 +1,6 @@
+from enum import Enum
+
+
+class HistoryStorage(str, Enum):
+    FULL = "full"
+    DELTA = "delta"
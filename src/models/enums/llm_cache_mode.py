@@ -0,0 +1,7 @@
+from enum import Enum
+
+
+class LLMCacheMode(str, Enum):
+    PASSTHROUGH = "passthrough"
+    RECORD = "record"
+    REPLAY = "replay"
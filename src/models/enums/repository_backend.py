@@ -0,0 +1,6 @@
+from enum import Enum
+
+
+class RepositoryBackend(str, Enum):
+    NEO4J = "neo4j"
+    SQLITE = "sqlite"
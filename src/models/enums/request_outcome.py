@@ -0,0 +1,9 @@
+from enum import Enum
+
+
+class RequestOutcome(str, Enum):
+    SUCCESS = "success"
+    THROTTLED = "throttled"
+    TIMEOUT = "timeout"
+    ERROR = "error"
+    ABORTED = "aborted"
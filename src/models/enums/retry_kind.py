@@ -0,0 +1,6 @@
+from enum import Enum
+
+
+class RetryKind(str, Enum):
+    TRANSPORT = "transport"
+    CONTENT = "content"
@@ -0,0 +1,7 @@
+from enum import Enum
+
+
+class WriteMode(str, Enum):
+    IMMEDIATE = "immediate"
+    BATCHED = "batched"
+    WRITE_BEHIND = "write_behind"
@@ -0,0 +1,67 @@
+import os
+from pathlib import Path
+from typing import Iterable, Optional, TextIO
+
+import ujson
+from loguru import logger
+
+from src.models.frontier_item import FrontierItem
+from src.types.algorithm import Frontiers
+
+
+class FrontierJournal:
+    def __init__(self, path: Path, min_compaction_records: int = 1000):
+        self.path = path
+        self.min_compaction_records = min_compaction_records
+        self._file: Optional[TextIO] = None
+        self._num_records = 0
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def replay(self) -> Frontiers:
+        items: dict[str, FrontierItem] = {}
+        self._num_records = 0
+        with open(self.path, "r") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    record = ujson.loads(line)
+                except ValueError:  # The last record may be truncated by a crash
+                    logger.warning(f"Ignoring truncated frontier journal record in {self.path}")
+                    break
+
+                self._num_records += 1
+                if record["op"] == "add":
+                    items[record["item"]["id"]] = FrontierItem.model_validate(record["item"])
+                elif record["op"] == "pop":
+                    items.pop(record["id"], None)
+        return list(items.values())
+
+    def append(self, popped_item: Optional[FrontierItem], added_items: Frontiers):
+        records = [] if popped_item is None else [{"op": "pop", "id": popped_item.id}]
+        records += [{"op": "add", "item": item.model_dump()} for item in added_items]
+        if self._file is None:
+            self._file = open(self.path, "a")
+        self._file.write("".join(ujson.dumps(record) + "\n" for record in records))
+        self._file.flush()
+        self._num_records += len(records)
+
+    def should_compact(self, num_live_items: int) -> bool:
+        return self._num_records > max(self.min_compaction_records, 2 * num_live_items)
+
+    def compact(self, live_items: Iterable[FrontierItem]):
+        self.close()
+        temp_path = self.path.with_suffix(".tmp")
+        live_items = list(live_items)
+        with open(temp_path, "w") as file:
+            file.write("".join(ujson.dumps({"op": "add", "item": item.model_dump()}) + "\n" for item in live_items))
+        os.replace(temp_path, self.path)
+        self._num_records = len(live_items)
+        logger.debug(f"Frontier journal compacted to {len(live_items)} records")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
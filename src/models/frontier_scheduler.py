@@ -0,0 +1,120 @@
+import heapq
+import itertools
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Callable, Iterable, Iterator
+
+from src.models.enums.branching_type import BranchingType
+from src.models.enums.frontier_order import FrontierOrder
+from src.models.frontier_item import FrontierItem
+
+BRANCHING_TYPE_RANK = {
+    BranchingType.BRANCHING: 0,
+    BranchingType.CHAPTER_END: 1,
+    BranchingType.GAME_END: 2,
+}
+
+
+class FrontierScheduler(ABC):
+    def __init__(self, items: Iterable[FrontierItem] = ()):
+        self.extend(items)
+
+    @abstractmethod
+    def push(self, item: FrontierItem):
+        pass
+
+    @abstractmethod
+    def pop(self) -> FrontierItem:
+        pass
+
+    def extend(self, items: Iterable[FrontierItem]):
+        for item in items:
+            self.push(item)
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    # Items are iterated in an order that rebuilds the same scheduler when pushed again
+    @abstractmethod
+    def __iter__(self) -> Iterator[FrontierItem]:
+        pass
+
+    def __str__(self):
+        return f"{type(self).__name__}(size={len(self)})"
+
+    def __repr__(self):
+        return str(self)
+
+
+class BFSFrontierScheduler(FrontierScheduler):
+    def __init__(self, items: Iterable[FrontierItem] = ()):
+        self._queue: deque[FrontierItem] = deque()
+        super().__init__(items)
+
+    def push(self, item: FrontierItem):
+        self._queue.append(item)
+
+    def pop(self) -> FrontierItem:
+        return self._queue.popleft()
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def __iter__(self) -> Iterator[FrontierItem]:
+        return iter(self._queue)
+
+
+class DFSFrontierScheduler(FrontierScheduler):
+    def __init__(self, items: Iterable[FrontierItem] = ()):
+        self._stack: list[FrontierItem] = []
+        super().__init__(items)
+
+    def push(self, item: FrontierItem):
+        self._stack.append(item)
+
+    def pop(self) -> FrontierItem:
+        return self._stack.pop()
+
+    def __len__(self) -> int:
+        return len(self._stack)
+
+    def __iter__(self) -> Iterator[FrontierItem]:
+        return iter(self._stack)
+
+
+class PriorityFrontierScheduler(FrontierScheduler):
+    def __init__(self, key: Callable[[FrontierItem], tuple], items: Iterable[FrontierItem] = ()):
+        self._key = key
+        self._heap: list[tuple[tuple, int, FrontierItem]] = []
+        self._counter = itertools.count()  # Ties are broken in insertion order
+        super().__init__(items)
+
+    def push(self, item: FrontierItem):
+        heapq.heappush(self._heap, (self._key(item), next(self._counter), item))
+
+    def pop(self) -> FrontierItem:
+        return heapq.heappop(self._heap)[-1]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __iter__(self) -> Iterator[FrontierItem]:
+        return iter([entry[-1] for entry in sorted(self._heap)])
+
+
+def get_story_progress(item: FrontierItem) -> tuple[int, int, int]:
+    return item.current_chapter, item.used_choice_opportunity, BRANCHING_TYPE_RANK[item.state]
+
+
+def get_frontier_scheduler(order: FrontierOrder, items: Iterable[FrontierItem] = ()) -> FrontierScheduler:
+    if order is FrontierOrder.BFS:
+        return BFSFrontierScheduler(items)
+    elif order is FrontierOrder.DFS:
+        return DFSFrontierScheduler(items)
+    elif order is FrontierOrder.CHAPTER:  # Least progressed item first
+        return PriorityFrontierScheduler(get_story_progress, items)
+    elif order is FrontierOrder.PATH_FIRST:  # Most progressed item first, reaching a playable ending sooner
+        return PriorityFrontierScheduler(lambda item: tuple(-p for p in get_story_progress(item)), items)
+    else:
+        raise ValueError(f"Unknown frontier order: {order}")
@@ -1,6 +1,9 @@
 from typing_extensions import List, Optional
 from pydantic import BaseModel
 
+from src.models.enums.frontier_order import FrontierOrder
+from src.models.enums.repository_backend import RepositoryBackend
+
 
 class GenerationConfig(BaseModel):
     min_num_choices: int
@@ -16,6 +19,11 @@ class GenerationConfig(BaseModel):
     enable_image_generation: bool
     existing_plot: Optional[str] = None
     seed: Optional[int] = None
+    num_workers: int = 1
+    frontier_order: FrontierOrder = FrontierOrder.BFS
+    repository_backend: Optional[RepositoryBackend] = None
+    pipelined: bool = False
+    batch_api: bool = False
 
     def get_themes_str(self) -> str:
         return ', '.join(self.themes)
@@ -35,5 +43,10 @@ class GenerationConfig(BaseModel):
             num_main_scenes=config.num_main_scenes,
             enable_image_generation=config.enable_image_generation,
             existing_plot=config.existing_plot,
-            seed=config.seed
+            seed=config.seed,
+            num_workers=config.num_workers,
+            frontier_order=config.frontier_order,
+            repository_backend=config.repository_backend,
+            pipelined=config.pipelined,
+            batch_api=config.batch_api
         )
@@ -1,4 +1,6 @@
 import copy
+import random
+import threading
 import uuid
 from datetime import datetime
 from pathlib import Path
@@ -11,16 +13,26 @@ from loguru import logger
 from src.bg_remover.bg_removal_model import BackgroundRemovalModel
 from src.image_gen.image_gen_model import ImageGenModel
 from src.llms.llm import LLM
+from src.llms.stream_validator import JSONStreamValidator
 from src.models.enums.branching_type import BranchingType
 from src.models.enums.generation_approach import GenerationApproach
 from src.models.frontier_item import FrontierItem
+from src.models.frontier_journal import FrontierJournal
+from src.models.frontier_scheduler import (FrontierScheduler,
+                                           get_frontier_scheduler)
 from src.models.generation_config import GenerationConfig
+from src.models.generation_log import HistoryLog, MessageStore, ResponseLog
+from src.models.retry_policy import RetryPolicy
+from src.models.shared_history import SharedHistory
+from src.models.story_chunk import StoryChunk
+from src.models.story_chunk_store import StoryChunkStore
 from src.prompts.utility_prompts import get_fix_invalid_json_prompt
-from src.repository import CommonRepository
+from src.repository import Repository
 from src.types.algorithm import Frontiers
 from src.types.openai import ConversationHistory
 from src.utils.general import parse_json_string
-from src.utils.openai_ai import append_openai_message
+from src.utils.openai_ai import (append_openai_message,
+                                 to_conversation_history)
 
 
 class GenerationContext:
@@ -31,43 +43,68 @@ class GenerationContext:
         self.is_generation_completed = False
         self.output_path = Path("outputs") / self.approach.value / self.story_id
         self.output_path.mkdir(exist_ok=True, parents=True)
-        self._initial_history: Optional[ConversationHistory] = None
-        self._frontiers: Frontiers = [FrontierItem(current_chapter=1, used_choice_opportunity=0, state=BranchingType.BRANCHING)]
+        self._initial_history: Optional[SharedHistory] = None
+        self._frontiers: FrontierScheduler = get_frontier_scheduler(config.frontier_order, [
+            FrontierItem(current_chapter=1, used_choice_opportunity=0, state=BranchingType.BRANCHING)
+        ])
+        self._in_flight_frontiers: dict[str, FrontierItem] = {}
+        # Items whose children were dispatched before the commit of the item was journaled
+        self._dispatched_frontiers: dict[str, tuple[FrontierItem, Frontiers]] = {}
+        self._frontier_lock = threading.RLock()
+        self._frontier_journal = FrontierJournal(self.output_path / "frontiers.jsonl")
+        self._story_chunk_store = StoryChunkStore(self.output_path / "chunks.jsonl")
+        self._response_logs: dict[str, ResponseLog] = {}
+        self._history_log = HistoryLog(self.output_path / "histories.jsonl", MessageStore(self.output_path / "messages.jsonl"))
         self.created_at = datetime.now()
         self.updated_at = datetime.now()
-        self.repository: Optional[CommonRepository] = None
+        self.repository: Optional[Repository] = None
         self.generation_model: Optional[LLM] = None
+        self.retry_policy = RetryPolicy()
+        # Owned by the story, so stories generated in one process draw their own choices and a seed reproduces the prompts
+        self.random = random.Random(config.seed)
         self.image_generation_model: Optional[ImageGenModel] = None
         self.background_remover_model: Optional[BackgroundRemovalModel] = None
         self.completed_at: Optional[datetime] = None
+        self._file_lock = threading.Lock()
 
-    def append_response_to_file(self, model_name: str, response: str, prompt_tokens: int, completion_tokens: int):
-        file_output_path = self.output_path / f"{model_name}.json"
-        responses = {"responses": [], "prompt_tokens": 0, "completion_tokens": 0}
-
-        if file_output_path.exists():
-            with open(file_output_path, "r") as file:
-                responses = ujson.load(file)
-
-        responses["responses"] += [response]
-        responses["prompt_tokens"] += prompt_tokens
-        responses["completion_tokens"] += completion_tokens
-
-        with open(file_output_path, "w") as file:
-            ujson.dump(responses, file, indent=2)
+    def append_response_to_file(self, model_name: str, response: str, prompt_tokens: int, completion_tokens: int,
+                                cached_prompt_tokens: int = 0):
+        if model_name not in self._response_logs:
+            self._response_logs[model_name] = ResponseLog(self.output_path, model_name)
+        self._response_logs[model_name].append(response, prompt_tokens, completion_tokens, cached_prompt_tokens)
 
     def append_history_to_file(self, history: ConversationHistory | Iterable[MessageParam]):
-        with open(self.output_path / "histories.json", "r+") as file:
-            histories = ujson.load(file)
-            histories["histories"] += [history]
-            file.seek(0)
-            ujson.dump(histories, file, indent=2)
-
-    def generate_content(self, messages: ConversationHistory) -> tuple[str, dict]:
-        history, response, input_tokens, output_tokens = self.generation_model.generate_content(messages)
-
-        self.append_response_to_file(self.generation_model.model_name, response, input_tokens, output_tokens)
-        self.append_history_to_file(history)
+        self._history_log.append(history)
+
+    def close_logs(self):
+        for response_log in self._response_logs.values():
+            response_log.close()
+        self._history_log.close()
+
+    def generate_content(self, messages: ConversationHistory | SharedHistory,
+                         validator: Optional[JSONStreamValidator] = None) -> tuple[str, dict]:
+        return self.record_response(*self.generation_model.generate_content(messages, validator))
+
+    def generate_batch(self, messages_list: list[ConversationHistory | SharedHistory]) -> list[tuple[str, dict] | Exception]:
+        results = []
+        for result in self.generation_model.generate_batch(messages_list):
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                results.append(self.record_response(*result))
+            except ValueError as e:  # Only fails its own request
+                results.append(e)
+        return results
+
+    def accept_response(self, messages: ConversationHistory | SharedHistory):
+        self.generation_model.accept_response(messages)
+
+    def record_response(self, history: ConversationHistory, response: str, input_tokens: int, output_tokens: int,
+                        cached_input_tokens: int) -> tuple[str, dict]:
+        with self._file_lock:  # Frontier items may be generated concurrently
+            self.append_response_to_file(self.generation_model.model_name, response, input_tokens, output_tokens,
+                                         cached_input_tokens)
+            self.append_history_to_file(history)
 
         try:
             return response, parse_json_string(response)
@@ -88,19 +125,54 @@ class GenerationContext:
         with open(self.output_path / "context.json", "w") as file:
             ujson.dump(self.to_dict(), file, indent=2)
 
-    def get_initial_history(self):
+    def get_initial_history(self) -> Optional[SharedHistory]:
         return self._initial_history
 
-    def set_initial_history(self, initial_history):
-        self._initial_history = copy.deepcopy(initial_history)
+    def set_initial_history(self, initial_history: ConversationHistory):
+        self._initial_history = SharedHistory.from_list(copy.deepcopy(initial_history))
         self.sync_file()
 
     def get_frontiers(self):
         return self._frontiers
 
-    def set_frontiers(self, frontiers: Frontiers):
-        self._frontiers = copy.deepcopy(frontiers)
-        self.sync_file()
+    def get_story_chunk(self, chunk_id: str) -> StoryChunk:
+        return self._story_chunk_store.get(chunk_id)
+
+    def add_story_chunk(self, story_chunk: StoryChunk):
+        self._story_chunk_store.put(story_chunk)
+
+    def pop_frontier(self) -> FrontierItem:
+        with self._frontier_lock:
+            item = self._frontiers.pop()
+            self._in_flight_frontiers[item.id] = item
+            return item
+
+    def dispatch_frontier(self, item: FrontierItem, child_items: Frontiers):
+        # Lets the children be generated while the item is still being saved, commit_frontier journals it afterwards
+        with self._frontier_lock:
+            del self._in_flight_frontiers[item.id]
+            self._frontiers.extend(child_items)
+            self._dispatched_frontiers[item.id] = (item, child_items)
+
+    def commit_frontier(self, item: FrontierItem, child_items: Frontiers):
+        # Only the committed item and its children are journaled, so a checkpoint costs the same for every chunk.
+        # In-flight items are journaled when they are committed, so they are regenerated on resume.
+        with self._frontier_lock:
+            if self._dispatched_frontiers.pop(item.id, None) is None:
+                del self._in_flight_frontiers[item.id]
+                self._frontiers.extend(child_items)
+            self._frontier_journal.append(item, child_items)
+            num_live_items = len(self._frontiers) + len(self._in_flight_frontiers) + len(self._dispatched_frontiers)
+            if self._frontier_journal.should_compact(num_live_items):
+                self.compact_frontier_journal()
+
+    def compact_frontier_journal(self):
+        with self._frontier_lock:
+            # The children of a dispatched item are not journaled yet, the item is regenerated on resume instead
+            unjournaled_ids = {child.id for _, child_items in self._dispatched_frontiers.values() for child in child_items}
+            live_items = [*self._in_flight_frontiers.values(), *(item for item, _ in self._dispatched_frontiers.values()),
+                          *self._frontiers]
+            self._frontier_journal.compact([item for item in live_items if item.id not in unjournaled_ids])
 
     def sync_updated_at(self):
         self.updated_at = datetime.now()
@@ -109,6 +181,13 @@ class GenerationContext:
     def completed(self):
         self.completed_at = datetime.now()
         self.is_generation_completed = True
+        self.compact_frontier_journal()
+        self.close_logs()
+        if self.repository is not None:
+            self.repository.flush()
+        if self.generation_model is not None and self.generation_model.get_stats():
+            logger.info(f"Generation model request stats: {self.generation_model.get_stats()}")
+        logger.info(f"Retries: {self.retry_policy.get_stats()}")
         self.sync_file()
 
     @staticmethod
@@ -120,10 +199,25 @@ class GenerationContext:
         ctx.created_at = datetime.fromisoformat(data_obj['created_at'])
         ctx.updated_at = datetime.fromisoformat(data_obj['updated_at'])
         ctx.completed_at = None if not data_obj.get('completed_at') else datetime.fromisoformat(data_obj['completed_at'])
-        ctx._initial_history = data_obj['initial_history']
-        ctx._frontiers = [FrontierItem.model_validate(item) for item in data_obj["frontiers"]]
+        ctx._initial_history = SharedHistory.from_list(data_obj['initial_history'])
+        if ctx._frontier_journal.exists():
+            ctx._frontiers = get_frontier_scheduler(ctx.config.frontier_order, ctx._frontier_journal.replay())
+        elif 'frontiers' in data_obj:  # Context saved before the frontier journal was introduced
+            ctx._frontiers = get_frontier_scheduler(ctx.config.frontier_order,
+                                                    [ctx._migrate_legacy_frontier_item(item) for item in data_obj['frontiers']])
+        ctx.compact_frontier_journal()
         return ctx
 
+    def _migrate_legacy_frontier_item(self, item_obj: dict) -> FrontierItem:
+        # Older frontier items embed the whole parent chunk instead of referencing it
+        parent_chunk_obj = item_obj.pop('parent_chunk', None)
+        if parent_chunk_obj is not None:
+            parent_chunk = StoryChunk.model_validate(parent_chunk_obj)
+            if parent_chunk.id not in self._story_chunk_store:
+                self.add_story_chunk(parent_chunk)
+            item_obj['parent_chunk_id'] = parent_chunk.id
+        return FrontierItem.model_validate(item_obj)
+
     def to_dict(self) -> dict:
         return {
             'approach': self.approach.value,
@@ -131,8 +225,7 @@ class GenerationContext:
             'story_id': self.story_id,
             'is_generation_completed': self.is_generation_completed,
             'output_path': str(self.output_path),
-            'initial_history': self._initial_history,
-            'frontiers': [item.model_dump() for item in self._frontiers],
+            'initial_history': to_conversation_history(self._initial_history),
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
             'completed_at': None if not self.completed_at else self.completed_at.isoformat()
@@ -0,0 +1,209 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import Any, Iterator, Optional, TextIO
+
+import ujson
+from loguru import logger
+
+from src.types.openai import ConversationHistory
+
+TOKEN_TOTAL_KEYS = ("prompt_tokens", "cached_prompt_tokens", "completion_tokens")
+
+
+class ResponseLog:
+    def __init__(self, output_path: Path, model_name: str):
+        self.path = output_path / f"{model_name}.jsonl"
+        self.totals_path = output_path / f"{model_name}.totals.json"
+        self._file: Optional[TextIO] = None
+        truncate_partial_record(self.path)
+        self.totals = read_log_totals(self.path, self.totals_path)
+
+    def append(self, response: str, prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int = 0):
+        record = {"response": response, "prompt_tokens": prompt_tokens, "cached_prompt_tokens": cached_prompt_tokens,
+                  "completion_tokens": completion_tokens}
+        if self._file is None:
+            self._file = open(self.path, "a")
+        self._file.write(ujson.dumps(record) + "\n")
+        self._file.flush()
+
+        self.totals["num_responses"] += 1
+        self.totals["log_size"] = os.fstat(self._file.fileno()).st_size
+        for key in TOKEN_TOTAL_KEYS:
+            self.totals[key] += record[key]
+        temp_path = self.totals_path.with_suffix(".tmp")
+        with open(temp_path, "w") as file:
+            ujson.dump(self.totals, file)
+        os.replace(temp_path, self.totals_path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class MessageStore:
+    def __init__(self, path: Path):
+        self.path = path
+        self._file: Optional[TextIO] = None
+        self._message_ids: dict[tuple[str, str], str] = {}  # Skips hashing messages that were already stored
+        self._stored_ids: set[str] = set()
+        truncate_partial_record(self.path)
+        if self.path.exists():
+            self._stored_ids = {record["id"] for record in iter_jsonl(self.path)}
+
+    @staticmethod
+    def get_message_id(message: dict) -> str:
+        return hashlib.sha256(ujson.dumps(message, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+    def put(self, message: dict) -> str:
+        key = (message["role"], message["content"]) if len(message) == 2 and isinstance(message["content"], str) else None
+        if key is not None and key in self._message_ids:
+            return self._message_ids[key]
+
+        message_id = self.get_message_id(message)
+        if key is not None:
+            self._message_ids[key] = message_id
+        if message_id not in self._stored_ids:
+            if self._file is None:
+                self._file = open(self.path, "a")
+            self._file.write(ujson.dumps({"id": message_id, "message": message}) + "\n")
+            self._stored_ids.add(message_id)
+        return message_id
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def load(path: Path) -> dict[str, dict]:
+        if not path.exists():
+            return {}
+        return {record["id"]: record["message"] for record in iter_jsonl(path)}
+
+    def __len__(self) -> int:
+        return len(self._stored_ids)
+
+
+class HistoryLog:
+    def __init__(self, path: Path, message_store: MessageStore):
+        self.path = path
+        self.message_store = message_store
+        self._file: Optional[TextIO] = None
+        truncate_partial_record(self.path)
+
+    def append(self, history: ConversationHistory):
+        # Each message body is stored once, a history only lists the ids of its messages
+        message_ids = [self.message_store.put(message) for message in history]
+        self.message_store.flush()  # Messages are durable before the history that refers to them
+        if self._file is None:
+            self._file = open(self.path, "a")
+        self._file.write(ujson.dumps({"message_ids": message_ids}) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self.message_store.close()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def iter_jsonl(path: Path) -> Iterator[Any]:
+    with open(path, "r") as file:
+        for line in file:
+            if not line.endswith("\n"):  # The last record may be truncated by a crash
+                logger.warning(f"Ignoring truncated record in {path}")
+                break
+            yield ujson.loads(line)
+
+
+def truncate_partial_record(path: Path):
+    # A crash in the middle of a write leaves a partial last line, which the next append would be glued to
+    if not path.exists():
+        return
+    with open(path, "r+b") as file:
+        size = end = file.seek(0, os.SEEK_END)
+        complete_size = 0
+        while end > 0:
+            start = max(0, end - 4096)
+            file.seek(start)
+            newline_idx = file.read(end - start).rfind(b"\n")
+            if newline_idx != -1:
+                complete_size = start + newline_idx + 1
+                break
+            end = start
+        if complete_size != size:
+            logger.warning(f"Dropping truncated record in {path}")
+            file.truncate(complete_size)
+
+
+def read_log_totals(path: Path, totals_path: Path) -> dict:
+    log_size = path.stat().st_size if path.exists() else 0
+    if totals_path.exists():
+        with open(totals_path, "r") as file:
+            totals = ujson.load(file)
+        if totals["log_size"] == log_size:
+            return totals
+
+    # The sidecar lags behind the log when a crash happens between the two writes
+    totals = {"num_responses": 0, "log_size": log_size, **{key: 0 for key in TOKEN_TOTAL_KEYS}}
+    if log_size > 0:
+        logger.warning(f"Rebuilding response totals from {path}")
+        for record in iter_jsonl(path):
+            totals["num_responses"] += 1
+            for key in TOKEN_TOTAL_KEYS:
+                totals[key] += record.get(key, 0)
+    return totals
+
+
+def get_response_log_model_names(story_path: Path) -> list[str]:
+    model_names = {path.name.removesuffix(".totals.json") for path in story_path.glob("*.totals.json")}
+    # Stories generated before the append-only logs keep every response in <model>.json
+    model_names |= {path.stem for path in story_path.glob("*.json")
+                    if path.stem not in ["context", "histories", "plot"] and not path.name.endswith(".totals.json")}
+    return sorted(model_names)
+
+
+def read_response_totals(story_path: Path, model_name: str) -> dict:
+    totals = {key: 0 for key in TOKEN_TOTAL_KEYS}
+    legacy_path = story_path / f"{model_name}.json"
+    if legacy_path.exists():
+        with open(legacy_path, "r") as file:
+            legacy_responses = ujson.load(file)
+        for key in TOKEN_TOTAL_KEYS:
+            totals[key] += legacy_responses.get(key, 0)
+    if (story_path / f"{model_name}.jsonl").exists():
+        log_totals = read_log_totals(story_path / f"{model_name}.jsonl", story_path / f"{model_name}.totals.json")
+        for key in TOKEN_TOTAL_KEYS:
+            totals[key] += log_totals[key]
+    return totals
+
+
+def iter_responses(story_path: Path, model_name: str) -> Iterator[str]:
+    legacy_path = story_path / f"{model_name}.json"
+    if legacy_path.exists():
+        with open(legacy_path, "r") as file:
+            yield from ujson.load(file)["responses"]
+    if (story_path / f"{model_name}.jsonl").exists():
+        yield from (record["response"] for record in iter_jsonl(story_path / f"{model_name}.jsonl"))
+
+
+def iter_histories(story_path: Path) -> Iterator[ConversationHistory]:
+    if (story_path / "histories.json").exists():
+        with open(story_path / "histories.json", "r") as file:
+            yield from ujson.load(file)["histories"]
+    if (story_path / "histories.jsonl").exists():
+        messages = MessageStore.load(story_path / "messages.jsonl")
+        for record in iter_jsonl(story_path / "histories.jsonl"):
+            yield resolve_history(record, messages)
+
+
+def resolve_history(record: dict | ConversationHistory, messages: dict[str, dict]) -> ConversationHistory:
+    if isinstance(record, list):  # Histories written before the message store are stored in full
+        return record
+    return [messages[message_id] for message_id in record["message_ids"]]
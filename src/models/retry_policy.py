@@ -0,0 +1,99 @@
+import os
+import random
+import threading
+import time
+from typing import Callable, TypeVar
+
+from loguru import logger
+
+from src.models.enums.retry_kind import RetryKind
+
+T = TypeVar("T")
+
+
+class RetryError(Exception):
+    pass
+
+
+class RetryBudgetExhaustedError(RetryError):
+    pass
+
+
+class RetryPolicy:
+    def __init__(self, max_transport_attempts: int = 6, max_content_attempts: int = 3, story_retry_budget: int = 50,
+                 retry_budget_per_chunk: float = 1.0, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.max_attempts = {RetryKind.TRANSPORT: max_transport_attempts, RetryKind.CONTENT: max_content_attempts}
+        # Shared by every request of a story, so a degraded provider fails the story instead of retrying without end.
+        # It grows with every generated chunk, so a long story only fails when retries outpace the chunks they produce.
+        self.story_retry_budget = story_retry_budget
+        self.retry_budget_per_chunk = retry_budget_per_chunk
+        self.num_completed = 0
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.num_retries = {kind: 0 for kind in RetryKind}
+        self._random = random.Random()  # Separate from the story generator, so retry jitter does not change the prompts
+        self._lock = threading.Lock()
+
+    def get_delay(self, kind: RetryKind, attempt: int) -> float:
+        if kind is RetryKind.CONTENT:  # An invalid response needs a new request, not a pause
+            return 0.0
+        # Full jitter spreads out the retries of requests that failed together
+        return self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def get_budget(self) -> int:
+        return self.story_retry_budget + int(self.retry_budget_per_chunk * self.num_completed)
+
+    def consume_budget(self, kind: RetryKind) -> bool:
+        with self._lock:
+            if sum(self.num_retries.values()) >= self.get_budget():
+                return False
+            self.num_retries[kind] += 1
+            return True
+
+    def record_completed(self, num_completed: int = 1):
+        # Called for every valid response, which is one generated chunk or plot
+        with self._lock:
+            self.num_completed += num_completed
+
+    def call(self, kind: RetryKind, func: Callable[[], T], retryable_errors: tuple[type[Exception], ...]) -> T:
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = func()
+            except retryable_errors as e:
+                if isinstance(e, RetryError):  # Already retried by an inner call
+                    raise
+                if attempt >= self.max_attempts[kind]:
+                    raise RetryError(f"{kind.value} error after {attempt} attempts: {e}") from e
+                if not self.consume_budget(kind):
+                    raise RetryBudgetExhaustedError(f"Story retry budget of {self.get_budget()} is spent, "
+                                                    f"last {kind.value} error: {e}") from e
+
+                delay = self.get_delay(kind, attempt)
+                logger.warning(f"Retrying after {kind.value} error in {delay:.1f}s "
+                               f"(attempt {attempt}/{self.max_attempts[kind]}): {e}")
+                time.sleep(delay)
+                continue
+
+            if kind is RetryKind.CONTENT:
+                self.record_completed()
+            return result
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**{f"{kind.value}_retries": num_retries for kind, num_retries in self.num_retries.items()},
+                    "completed": self.num_completed,
+                    "remaining_budget": self.get_budget() - sum(self.num_retries.values())}
+
+    def __str__(self):
+        return f"RetryPolicy({', '.join(f'{key}={value}' for key, value in self.get_stats().items())})"
+
+
+def get_retry_policy() -> RetryPolicy:
+    return RetryPolicy(max_transport_attempts=int(os.getenv("RETRY_MAX_TRANSPORT_ATTEMPTS", "6")),
+                       max_content_attempts=int(os.getenv("RETRY_MAX_CONTENT_ATTEMPTS", "3")),
+                       story_retry_budget=int(os.getenv("RETRY_STORY_BUDGET", "50")),
+                       retry_budget_per_chunk=float(os.getenv("RETRY_BUDGET_PER_CHUNK", "1")),
+                       base_delay=float(os.getenv("RETRY_BASE_DELAY", "1")),
+                       max_delay=float(os.getenv("RETRY_MAX_DELAY", "60")))
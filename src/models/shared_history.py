@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from typing import Any, Iterator, Optional
+
+from pydantic import GetCoreSchemaHandler
+from pydantic_core import core_schema
+
+from src.types.openai import ConversationHistory, OpenAIRole
+
+
+class SharedHistory:
+    __slots__ = ("message", "parent", "length", "__weakref__")
+
+    def __init__(self, message: dict, parent: Optional[SharedHistory] = None):
+        self.message = message
+        self.parent = parent
+        self.length = 1 if parent is None else parent.length + 1
+
+    def append(self, content: str, role: OpenAIRole = "user") -> SharedHistory:
+        return SharedHistory({"role": role, "content": content}, self)
+
+    def extend(self, history: ConversationHistory) -> SharedHistory:
+        node = self
+        for message in history:
+            node = SharedHistory(message, node)
+        return node
+
+    def tail(self, n: int) -> ConversationHistory:
+        messages, node = [], self
+        for _ in range(min(n, self.length)):
+            messages.append(node.message)
+            node = node.parent
+        return messages[::-1]
+
+    def to_list(self) -> ConversationHistory:
+        return self.tail(self.length)
+
+    @staticmethod
+    def from_list(history: ConversationHistory) -> Optional[SharedHistory]:
+        if not history:
+            return None
+        root = SharedHistory(history[0])
+        return root.extend(history[1:])
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self.to_list())
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source_type: Any, handler: GetCoreSchemaHandler) -> core_schema.CoreSchema:
+        return core_schema.no_info_plain_validator_function(
+            cls._validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(lambda history: history.to_list())
+        )
+
+    @classmethod
+    def _validate(cls, value: Any) -> Optional[SharedHistory]:
+        if value is None or isinstance(value, SharedHistory):
+            return value
+        if isinstance(value, list):
+            return cls.from_list(value)
+        raise ValueError(f"Invalid conversation history: {type(value).__name__}")
+
+    def __str__(self):
+        return f"SharedHistory(length={self.length}, last_role={self.message['role']})"
+
+    def __repr__(self):
+        return str(self)
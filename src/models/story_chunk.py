@@ -1,8 +1,8 @@
 from pydantic import BaseModel
 from typing_extensions import List, Optional
 
+from src.models.shared_history import SharedHistory
 from src.models.story.story_narrative import StoryNarrative
-from src.types.openai import ConversationHistory
 
 
 class StoryChunk(BaseModel):
@@ -12,7 +12,7 @@ class StoryChunk(BaseModel):
     story_so_far: str
     story: List[StoryNarrative]
     num_opportunities: int
-    history: Optional[ConversationHistory] = []
+    history: Optional[SharedHistory] = None
 
     def __str__(self):
         return (f"StoryChunk(id={self.id}, story_id={self.story_id}, chapter={self.chapter}, story_so_far={self.story_so_far}, "
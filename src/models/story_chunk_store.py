@@ -0,0 +1,89 @@
+import threading
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import ujson
+from loguru import logger
+
+from src.models.shared_history import SharedHistory
+from src.models.story_chunk import StoryChunk
+from src.types.openai import ConversationHistory
+
+
+class StoryChunkStore:
+    def __init__(self, path: Path, cache_size: int = 256):
+        self.path = path
+        self.cache_size = cache_size
+        self._offsets: dict[str, tuple[int, int]] = {}
+        self._cache: OrderedDict[str, StoryChunk] = OrderedDict()
+        self._history_owners: weakref.WeakKeyDictionary[SharedHistory, str] = weakref.WeakKeyDictionary()
+        self._lock = threading.RLock()
+        if self.path.exists():
+            self._load_offsets()
+
+    def _load_offsets(self):
+        offset = 0
+        with open(self.path, "r+b") as file:
+            for line in file:
+                if not line.endswith(b"\n"):  # The last line may be truncated by a crash
+                    logger.warning(f"Dropping truncated story chunk record in {self.path}")
+                    file.truncate(offset)
+                    break
+                chunk_id = ujson.loads(line)["id"]
+                self._offsets[chunk_id] = (offset, len(line))
+                offset += len(line)
+        logger.debug(f"Story chunk store loaded with {len(self._offsets)} chunks")
+
+    def put(self, story_chunk: StoryChunk):
+        with self._lock:
+            # Only the messages added after the closest stored ancestor are written
+            record = story_chunk.model_dump(exclude={"history"})
+            record["history_base_id"], record["history"] = self._get_history_delta(story_chunk.history)
+            line = (ujson.dumps(record) + "\n").encode()
+            with open(self.path, "ab") as file:
+                offset = file.tell()
+                file.write(line)
+            self._offsets[story_chunk.id] = (offset, len(line))
+            self._remember(story_chunk)
+
+    def get(self, chunk_id: str) -> StoryChunk:
+        with self._lock:
+            if chunk_id in self._cache:
+                self._cache.move_to_end(chunk_id)
+                return self._cache[chunk_id]
+
+            offset, length = self._offsets[chunk_id]
+            with open(self.path, "rb") as file:
+                file.seek(offset)
+                record = ujson.loads(file.read(length))
+
+            history_base_id, history = record.pop("history_base_id"), record.pop("history")
+            base_history = None if history_base_id is None else self.get(history_base_id).history
+            record["history"] = SharedHistory.from_list(history) if base_history is None else base_history.extend(history)
+            story_chunk = StoryChunk.model_validate(record)
+            self._remember(story_chunk)
+            return story_chunk
+
+    def __contains__(self, chunk_id: Optional[str]) -> bool:
+        return chunk_id in self._offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def _get_history_delta(self, history: Optional[SharedHistory]) -> tuple[Optional[str], ConversationHistory]:
+        node, num_new_messages = history, 0
+        while node is not None:
+            if node in self._history_owners:
+                return self._history_owners[node], history.tail(num_new_messages)
+            node, num_new_messages = node.parent, num_new_messages + 1
+        return None, [] if history is None else history.to_list()
+
+    def _remember(self, story_chunk: StoryChunk):
+        if story_chunk.history is not None:
+            self._history_owners[story_chunk.history] = story_chunk.id
+        self._cache[story_chunk.id] = story_chunk
+        self._cache.move_to_end(story_chunk.id)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
@@ -0,0 +1,54 @@
+import base64
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import ujson
+
+
+class WriteQueue:
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # WAL keeps enqueueing cheap and lets other processes drain the same queue while it is written
+        self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS writes (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                                 "operation TEXT NOT NULL, parameters TEXT NOT NULL, created_at REAL NOT NULL)")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def encode_parameters(parameters: dict) -> str:
+        # Compressed histories are bytes, which JSON cannot hold
+        return ujson.dumps({key: {"base64": base64.b64encode(value).decode()} if isinstance(value, bytes) else value
+                            for key, value in parameters.items()})
+
+    @staticmethod
+    def decode_parameters(encoded_parameters: str) -> dict:
+        return {key: base64.b64decode(value["base64"]) if isinstance(value, dict) and "base64" in value else value
+                for key, value in ujson.loads(encoded_parameters).items()}
+
+    def put(self, operation: str, parameters: dict):
+        with self._lock:
+            self._connection.execute("INSERT INTO writes (operation, parameters, created_at) VALUES (?, ?, ?)",
+                                     (operation, self.encode_parameters(parameters), time.time()))
+
+    def peek(self, limit: int) -> list[tuple[int, str, dict]]:
+        with self._lock:
+            rows = self._connection.execute("SELECT id, operation, parameters FROM writes ORDER BY id LIMIT ?",
+                                            (limit,)).fetchall()
+        return [(write_id, operation, self.decode_parameters(parameters)) for write_id, operation, parameters in rows]
+
+    def remove(self, write_ids: list[int]):
+        with self._lock:
+            self._connection.execute(f"DELETE FROM writes WHERE id IN ({', '.join('?' * len(write_ids))})", write_ids)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM writes").fetchone()[0]
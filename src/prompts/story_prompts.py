@@ -8,18 +8,18 @@ from src.models.story_data import StoryData
 JSON_MAGIC_PHRASE = "Return output in JSON format and only the JSON in the Markdown code block. JSON."
 
 
-def get_plot_prompt(config: GenerationConfig) -> str:
+def get_plot_prompt(config: GenerationConfig, rng: random.Random) -> str:
     if config.themes is None or len(config.themes) == 0:
         config.themes = ["sci-fi", "fantasy", "middle-age", "utopia", "mythical creatures", "world scale"]
 
     if config.num_main_characters is None:
-        config.num_main_characters = random.randint(3, 7)
+        config.num_main_characters = rng.randint(3, 7)
 
     if config.num_main_scenes is None:
-        config.num_main_scenes = random.randint(1, 5)
+        config.num_main_scenes = rng.randint(1, 5)
 
     if config.num_chapters is None:
-        config.num_chapters = random.randint(3, 7)
+        config.num_chapters = rng.randint(3, 7)
 
     return f"""Write a game story synopsis. Then generate 1 story beginning, {config.num_endings} possible endings, {config.num_main_characters} main characters, and {config.num_main_scenes} main scenes. There are a total of {config.num_chapters} chapters. {JSON_MAGIC_PHRASE}
 
@@ -106,8 +106,9 @@ def get_story_until_chapter_end_prompt(config: GenerationConfig, story_data: Sto
 {story_data.chapter_synopses[story_chunk.chapter].synopsis}"""
 
 
-def get_story_until_game_end_prompt(config: GenerationConfig, story_data: StoryData, story_chunk: StoryChunk) -> str:
-    selected_ending_idx = random.randint(0, config.num_endings - 1)
+def get_story_until_game_end_prompt(config: GenerationConfig, story_data: StoryData, story_chunk: StoryChunk,
+                                     rng: random.Random) -> str:
+    selected_ending_idx = rng.randint(0, config.num_endings - 1)
     return f"""Generate possible narratives and dialogues for a {config.game_genre} game, culminating in the end of the game. {JSON_MAGIC_PHRASE}
 
 # Output format
@@ -1,68 +1,199 @@
+import atexit
+import os
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
 import ujson
 from loguru import logger
 
-from src.database import Neo4J
+from neo4j import ManagedTransaction
+
+from src.database import Neo4J, SQLite
+from src.models.enums.history_storage import HistoryStorage
+from src.models.enums.repository_backend import RepositoryBackend
+from src.models.enums.write_mode import WriteMode
 from src.models.story_branch import StoryBranch
 from src.models.story_chunk import StoryChunk
 from src.models.story_data import StoryData
+from src.models.write_queue import WriteQueue
+from src.types.openai import ConversationHistory
 from src.utils.general import json_dumps_list
+from src.utils.openai_ai import to_conversation_history
 
 
-class CommonRepository:
+class Repository(ABC):
     _instance = None
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(CommonRepository, cls).__new__(cls)
+            cls._instance = super(Repository, cls).__new__(cls)
             cls._instance._initialize()
-            logger.info("CommonRepository instance created")
+            logger.info(f"{cls.__name__} instance created")
         return cls._instance
 
     def _initialize(self):
+        self.history_storage = HistoryStorage(os.getenv("NEO4J_HISTORY_STORAGE", HistoryStorage.FULL.value))
+        self.history_compression = os.getenv("NEO4J_HISTORY_COMPRESSION", "false").lower() == "true"
+
+    def encode_history(self, history: ConversationHistory) -> str | bytes:
+        encoded_history = ujson.dumps(history)
+        if self.history_compression:
+            return zlib.compress(encoded_history.encode())
+        return encoded_history
+
+    @staticmethod
+    def decode_history(encoded_history: str | bytes | None) -> ConversationHistory:
+        if encoded_history is None:
+            return []
+        if isinstance(encoded_history, (bytes, bytearray)):
+            encoded_history = zlib.decompress(encoded_history).decode()
+        return ujson.loads(encoded_history)
+
+    def rebuild_history(self, history_storage: str, initial_history: str | bytes | None,
+                        histories: list[str | bytes]) -> ConversationHistory:
+        histories = [self.decode_history(history) for history in histories]
+        if history_storage != HistoryStorage.DELTA.value or len(histories[-1]) == 0:
+            return histories[-1]
+
+        # Rebuild the full history from the initial history and the pairs along the path from the start chunk
+        history = self.decode_history(initial_history)
+        for delta in histories:
+            history += delta
+        return history
+
+    @staticmethod
+    def get_branch_parameters(branch: StoryBranch) -> dict:
+        return {
+            "source_id": branch.source_chunk_id,
+            "branched_id": branch.target_chunk_id,
+            "choice": '{}' if branch.choice is None else branch.choice.model_dump_json(),
+        }
+
+    def get_story_chunk_parameters(self, story_chunk: StoryChunk) -> dict:
+        history = to_conversation_history(story_chunk.history)
+        if self.history_storage is HistoryStorage.DELTA:  # Only the user/assistant pair added by this chunk
+            history = story_chunk.history.tail(2) if story_chunk.history is not None else []
+
+        return {
+            "id": story_chunk.id,
+            "chapter": story_chunk.chapter,
+            "story_so_far": story_chunk.story_so_far,
+            "story": json_dumps_list(story_chunk.story),
+            "history": self.encode_history(history),
+            "history_storage": self.history_storage.value,
+            "story_id": story_chunk.story_id,
+            "num_opportunities": story_chunk.num_opportunities,
+        }
+
+    @staticmethod
+    def get_story_data_parameters(story_data: StoryData) -> dict:
+        return {
+            "id": story_data.id,
+            "title": story_data.title,
+            "genre": story_data.genre,
+            "themes": story_data.themes,
+            "main_scenes": json_dumps_list(story_data.main_scenes),
+            "main_characters": json_dumps_list(story_data.main_characters),
+            "synopsis": story_data.synopsis,
+            "chapter_synopses": json_dumps_list(story_data.chapter_synopses),
+            "beginning": story_data.beginning,
+            "endings": json_dumps_list(story_data.endings),
+            "generated_by": story_data.generated_by,
+            "approach": story_data.approach.value,
+        }
+
+    @abstractmethod
+    def create_story_data(self, story_data: StoryData):
+        pass
+
+    @abstractmethod
+    def create_story_chunk(self, story_chunk: StoryChunk):
+        pass
+
+    @abstractmethod
+    def create_branch(self, branch: StoryBranch):
+        pass
+
+    @abstractmethod
+    def set_start_chunk(self, story_id: str, chunk_id: str):
+        pass
+
+    @abstractmethod
+    def set_initial_history(self, story_id: str, initial_history: ConversationHistory):
+        pass
+
+    @abstractmethod
+    def get_story_chunk_history(self, chunk_id: str) -> ConversationHistory:
+        pass
+
+    def flush(self):
+        pass  # Nothing is buffered unless the repository batches its writes
+
+    def get_num_pending_writes(self) -> int:
+        return 0
+
+
+class CommonRepository(Repository):
+    _instance = None
+
+    def _initialize(self):
+        super()._initialize()
         self.database = Neo4J()
-    
+        self.database.bootstrap_schema()
+
     def create_branch(self, branch: StoryBranch):
         with self.database.driver.session() as session:
             session.run(
                 ("MATCH (source:StoryChunk {id: $source_id}), (branched:StoryChunk {id: $branched_id}) "
                  "MERGE (source)-[:BRANCHED_TO {choice: $choice}]->(branched)"),
-                source_id=branch.source_chunk_id,
-                branched_id=branch.target_chunk_id,
-                choice='{}' if branch.choice is None else branch.choice.model_dump_json(),
+                **self.get_branch_parameters(branch)
             )
         logger.info(f"Created branch from {branch.source_chunk_id} to {branch.target_chunk_id}")
 
     def create_story_chunk(self, story_chunk: StoryChunk):
+        properties = self.get_story_chunk_parameters(story_chunk)
         with self.database.driver.session() as session:
-            session.run(
-                ("MERGE (storyChunk:StoryChunk {id: $id, chapter: $chapter, story_so_far: $story_so_far, "
-                 "story: $story, history: $history, story_id: $story_id, num_opportunities: $num_opportunities})"),
-                id=story_chunk.id,
-                chapter=story_chunk.chapter,
-                story_so_far=story_chunk.story_so_far,
-                story=json_dumps_list(story_chunk.story),
-                history=ujson.dumps(story_chunk.history),
-                story_id=story_chunk.story_id,
-                num_opportunities=story_chunk.num_opportunities,
-            )
+            session.run("MERGE (storyChunk:StoryChunk {id: $id}) SET storyChunk += $properties",
+                        id=properties["id"], properties=properties)
         logger.info(f"StoryChunk {story_chunk.id} created")
-    
+
     def create_story_data(self, story_data: StoryData):
+        properties = self.get_story_data_parameters(story_data)
         with self.database.driver.session() as session:
-            session.run(
-                ("MERGE (storyData:StoryData {id: $id, title: $title, genre: $genre, themes: $themes, "
-                 "main_scenes: $main_scenes, main_characters: $main_characters, "
-                 "synopsis: $synopsis, chapter_synopses: $chapter_synopses, "
-                 "beginning: $beginning, endings: $endings, generated_by: $generated_by, approach: $approach})"),
-                id=story_data.id, title=story_data.title, genre=story_data.genre, themes=story_data.themes,
-                main_scenes=json_dumps_list(story_data.main_scenes),
-                main_characters=json_dumps_list(story_data.main_characters), synopsis=story_data.synopsis,
-                chapter_synopses=json_dumps_list(story_data.chapter_synopses), beginning=story_data.beginning,
-                endings=json_dumps_list(story_data.endings), generated_by=story_data.generated_by,
-                approach=story_data.approach.value
-            )
+            session.run("MERGE (storyData:StoryData {id: $id}) SET storyData += $properties",
+                        id=properties["id"], properties=properties)
         logger.info(f"StoryData {story_data.id} created")
 
+    def set_initial_history(self, story_id: str, initial_history: ConversationHistory):
+        if self.history_storage is not HistoryStorage.DELTA:  # Full histories already contain the initial history
+            return
+
+        with self.database.driver.session() as session:
+            session.run("MATCH (storyData:StoryData {id: $story_id}) SET storyData.initial_history = $initial_history",
+                        story_id=story_id, initial_history=self.encode_history(initial_history))
+        logger.info(f"StoryData {story_id} initial history stored")
+
+    def get_story_chunk_history(self, chunk_id: str) -> ConversationHistory:
+        with self.database.driver.session() as session:
+            record = session.run(
+                ("MATCH (storyChunk:StoryChunk {id: $chunk_id}) "
+                 "MATCH path = (startChunk:StoryChunk)-[:BRANCHED_TO*0..]->(storyChunk) "
+                 "WHERE NOT ()-[:BRANCHED_TO]->(startChunk) "
+                 "OPTIONAL MATCH (storyData:StoryData {id: storyChunk.story_id}) "
+                 "RETURN storyChunk.history_storage AS history_storage, storyData.initial_history AS initial_history, "
+                 "[chunk IN nodes(path) | chunk.history] AS histories LIMIT 1"),
+                chunk_id=chunk_id
+            ).single()
+
+        if record is None:
+            raise ValueError(f"StoryChunk {chunk_id} not found")
+
+        return self.rebuild_history(record["history_storage"], record["initial_history"], record["histories"])
+
     def set_start_chunk(self, story_id: str, chunk_id: str):
         with self.database.driver.session() as session:
             session.run(
@@ -73,4 +204,306 @@ class CommonRepository:
         logger.info(f"StoryData {story_id} linked to chunk {chunk_id}")
 
     def __str__(self):
-        return f"CommonRepository(database={self.database})"
+        return (f"CommonRepository(database={self.database}, history_storage={self.history_storage.value}, "
+                f"history_compression={self.history_compression})")
+
+
+class BatchingRepository(CommonRepository):
+    _instance = None
+
+    def _initialize(self):
+        super()._initialize()
+        self.batch_size = int(os.getenv("NEO4J_BATCH_SIZE", "100"))
+        self.batch_interval = float(os.getenv("NEO4J_BATCH_INTERVAL", "5"))
+        self._story_chunks: list[dict] = []
+        self._branches: list[dict] = []
+        self._start_chunks: list[dict] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # Batches are written in order, branches may refer to earlier chunks
+        self._flush_timer: Optional[threading.Timer] = None
+        atexit.register(self.flush)
+
+    def _buffer(self, records: list[dict], record: dict):
+        with self._lock:
+            records.append(record)
+            num_buffered = len(self._story_chunks) + len(self._branches) + len(self._start_chunks)
+            if num_buffered == 1 and self.batch_interval > 0:
+                self._flush_timer = threading.Timer(self.batch_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        if num_buffered >= self.batch_size:
+            self.flush()
+
+    def create_branch(self, branch: StoryBranch):
+        self._buffer(self._branches, self.get_branch_parameters(branch))
+
+    def create_story_chunk(self, story_chunk: StoryChunk):
+        self._buffer(self._story_chunks, self.get_story_chunk_parameters(story_chunk))
+
+    def set_start_chunk(self, story_id: str, chunk_id: str):
+        self._buffer(self._start_chunks, {"story_id": story_id, "chunk_id": chunk_id})
+
+    def get_story_chunk_history(self, chunk_id: str) -> ConversationHistory:
+        self.flush()
+        return super().get_story_chunk_history(chunk_id)
+
+    @staticmethod
+    def write_batch(tx: ManagedTransaction, story_chunks: list[dict], branches: list[dict], start_chunks: list[dict]):
+        # Chunks go first so branches and start links in the same batch can match them
+        if story_chunks:
+            tx.run("UNWIND $story_chunks AS chunk MERGE (storyChunk:StoryChunk {id: chunk.id}) SET storyChunk += chunk",
+                   story_chunks=story_chunks)
+        if branches:
+            tx.run(("UNWIND $branches AS branch "
+                    "MATCH (source:StoryChunk {id: branch.source_id}), (branched:StoryChunk {id: branch.branched_id}) "
+                    "MERGE (source)-[:BRANCHED_TO {choice: branch.choice}]->(branched)"),
+                   branches=branches)
+        if start_chunks:
+            tx.run(("UNWIND $start_chunks AS start "
+                    "MATCH (storyData:StoryData {id: start.story_id}), (storyChunk:StoryChunk {id: start.chunk_id}) "
+                    "MERGE (storyData)-[:STARTED_AT]->(storyChunk)"),
+                   start_chunks=start_chunks)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                story_chunks, branches, start_chunks = self._story_chunks, self._branches, self._start_chunks
+                self._story_chunks, self._branches, self._start_chunks = [], [], []
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+            if not story_chunks and not branches and not start_chunks:
+                return
+
+            try:
+                with self.database.driver.session() as session:
+                    session.execute_write(self.write_batch, story_chunks, branches, start_chunks)
+            except Exception:
+                with self._lock:  # Keeps the batch for the next flush
+                    self._story_chunks[:0], self._branches[:0], self._start_chunks[:0] = story_chunks, branches, start_chunks
+                raise
+        logger.info(f"Flushed {len(story_chunks)} story chunks, {len(branches)} branches and "
+                    f"{len(start_chunks)} start chunks")
+
+    def get_num_pending_writes(self) -> int:
+        with self._lock:
+            return len(self._story_chunks) + len(self._branches) + len(self._start_chunks)
+
+    def __str__(self):
+        return (f"BatchingRepository(database={self.database}, history_storage={self.history_storage.value}, "
+                f"history_compression={self.history_compression}, batch_size={self.batch_size}, "
+                f"batch_interval={self.batch_interval})")
+
+
+class WriteBehindRepository(CommonRepository):
+    _instance = None
+    # Writes may reach Neo4j in any order and more than once, so every query merges the nodes it refers to
+    WRITE_QUERIES = {
+        "story_data": "UNWIND $rows AS row MERGE (storyData:StoryData {id: row.id}) SET storyData += row",
+        "initial_history": ("UNWIND $rows AS row MERGE (storyData:StoryData {id: row.story_id}) "
+                            "SET storyData.initial_history = row.initial_history"),
+        "story_chunk": "UNWIND $rows AS row MERGE (storyChunk:StoryChunk {id: row.id}) SET storyChunk += row",
+        "branch": ("UNWIND $rows AS row MERGE (source:StoryChunk {id: row.source_id}) "
+                   "MERGE (branched:StoryChunk {id: row.branched_id}) "
+                   "MERGE (source)-[:BRANCHED_TO {choice: row.choice}]->(branched)"),
+        "start_chunk": ("UNWIND $rows AS row MERGE (storyData:StoryData {id: row.story_id}) "
+                        "MERGE (storyChunk:StoryChunk {id: row.chunk_id}) MERGE (storyData)-[:STARTED_AT]->(storyChunk)"),
+    }
+
+    def _initialize(self):
+        super()._initialize()
+        self.batch_size = int(os.getenv("NEO4J_BATCH_SIZE", "100"))
+        self.flush_timeout = float(os.getenv("NEO4J_WRITE_BEHIND_FLUSH_TIMEOUT", "30"))
+        self.max_retry_interval = 30.0
+        self.queue = WriteQueue(Path(os.getenv("NEO4J_WRITE_QUEUE_PATH", "outputs/neo4j-write-queue.sqlite3")))
+        self._has_writes = threading.Event()
+        self._is_drained = threading.Event()
+        self._num_enqueued = 0
+        self._enqueue_lock = threading.Lock()
+        self._has_writes.set()  # Writes left by a previous run are replayed first
+        self._worker = threading.Thread(target=self._drain_queue, name="neo4j-write-behind", daemon=True)
+        self._worker.start()
+
+    def _enqueue(self, operation: str, parameters: dict):
+        with self._enqueue_lock:
+            self.queue.put(operation, parameters)
+            self._num_enqueued += 1
+            self._is_drained.clear()
+        self._has_writes.set()
+
+    def create_branch(self, branch: StoryBranch):
+        self._enqueue("branch", self.get_branch_parameters(branch))
+
+    def create_story_chunk(self, story_chunk: StoryChunk):
+        self._enqueue("story_chunk", self.get_story_chunk_parameters(story_chunk))
+
+    def create_story_data(self, story_data: StoryData):
+        self._enqueue("story_data", self.get_story_data_parameters(story_data))
+
+    def set_initial_history(self, story_id: str, initial_history: ConversationHistory):
+        if self.history_storage is HistoryStorage.DELTA:
+            self._enqueue("initial_history", {"story_id": story_id, "initial_history": self.encode_history(initial_history)})
+
+    def set_start_chunk(self, story_id: str, chunk_id: str):
+        self._enqueue("start_chunk", {"story_id": story_id, "chunk_id": chunk_id})
+
+    def get_story_chunk_history(self, chunk_id: str) -> ConversationHistory:
+        self.flush()
+        return super().get_story_chunk_history(chunk_id)
+
+    def write_batch(self, tx: ManagedTransaction, writes: list[tuple[int, str, dict]]):
+        for operation, query in self.WRITE_QUERIES.items():
+            rows = [parameters for _, write_operation, parameters in writes if write_operation == operation]
+            if rows:
+                tx.run(query, rows=rows)
+
+    def _drain_queue(self):
+        retry_interval = 1.0
+        while True:
+            self._has_writes.wait(timeout=self.max_retry_interval)  # Also picks up writes queued by other processes
+            self._has_writes.clear()
+            try:
+                self.database.bootstrap_schema()
+                with self._enqueue_lock:
+                    num_enqueued = self._num_enqueued
+                while writes := self.queue.peek(self.batch_size):
+                    with self.database.driver.session() as session:
+                        session.execute_write(self.write_batch, writes)
+                    self.queue.remove([write_id for write_id, _, _ in writes])
+                    logger.debug(f"Wrote {len(writes)} queued writes to Neo4J")
+                with self._enqueue_lock:
+                    if self._num_enqueued == num_enqueued:  # Nothing was queued after the last empty read
+                        self._is_drained.set()
+                retry_interval = 1.0
+            except Exception as e:  # The writes stay queued until Neo4j is reachable again
+                logger.warning(f"Failed to write queued writes to Neo4J, retrying in {retry_interval:.0f}s: {e}")
+                time.sleep(retry_interval)
+                retry_interval = min(retry_interval * 2, self.max_retry_interval)
+                self._has_writes.set()
+
+    def flush(self):
+        self._has_writes.set()
+        if not self._is_drained.wait(timeout=self.flush_timeout):
+            logger.warning(f"{self.get_num_pending_writes()} writes are still queued in {self.queue.path}, "
+                           f"they are replayed on the next run")
+
+    def get_num_pending_writes(self) -> int:
+        return len(self.queue)
+
+    def __str__(self):
+        return (f"WriteBehindRepository(database={self.database}, history_storage={self.history_storage.value}, "
+                f"history_compression={self.history_compression}, queue={self.queue.path})")
+
+
+class SQLiteRepository(Repository):
+    _instance = None
+
+    def _initialize(self):
+        super()._initialize()
+        self.database = SQLite()
+        self.database.bootstrap_schema()
+
+    @staticmethod
+    def get_upsert_query(table: str, columns: list[str], key_columns: list[str]) -> str:
+        # Same semantics as the Neo4j MERGE on id followed by SET, a later write only replaces the columns it has
+        updates = [f"{column} = excluded.{column}" for column in columns if column not in key_columns]
+        return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(':' + column for column in columns)}) "
+                f"ON CONFLICT ({', '.join(key_columns)}) DO " + (f"UPDATE SET {', '.join(updates)}" if updates else "NOTHING"))
+
+    def create_branch(self, branch: StoryBranch):
+        parameters = self.get_branch_parameters(branch)
+        with self.database.transaction() as connection:
+            connection.execute(self.get_upsert_query("branches", list(parameters), list(parameters)), parameters)
+        logger.info(f"Created branch from {branch.source_chunk_id} to {branch.target_chunk_id}")
+
+    def create_story_chunk(self, story_chunk: StoryChunk):
+        parameters = self.get_story_chunk_parameters(story_chunk)
+        with self.database.transaction() as connection:
+            connection.execute(self.get_upsert_query("story_chunks", list(parameters), ["id"]), parameters)
+        logger.info(f"StoryChunk {story_chunk.id} created")
+
+    def create_story_data(self, story_data: StoryData):
+        parameters = self.get_story_data_parameters(story_data)
+        parameters["themes"] = ujson.dumps(parameters["themes"])
+        with self.database.transaction() as connection:
+            connection.execute(self.get_upsert_query("story_data", list(parameters), ["id"]), parameters)
+        logger.info(f"StoryData {story_data.id} created")
+
+    def set_initial_history(self, story_id: str, initial_history: ConversationHistory):
+        if self.history_storage is not HistoryStorage.DELTA:  # Full histories already contain the initial history
+            return
+
+        parameters = {"id": story_id, "initial_history": self.encode_history(initial_history)}
+        with self.database.transaction() as connection:
+            connection.execute(self.get_upsert_query("story_data", list(parameters), ["id"]), parameters)
+        logger.info(f"StoryData {story_id} initial history stored")
+
+    def set_start_chunk(self, story_id: str, chunk_id: str):
+        parameters = {"story_id": story_id, "chunk_id": chunk_id}
+        with self.database.transaction() as connection:
+            connection.execute(self.get_upsert_query("start_chunks", list(parameters), list(parameters)), parameters)
+        logger.info(f"StoryData {story_id} linked to chunk {chunk_id}")
+
+    def get_story_chunk_history(self, chunk_id: str) -> ConversationHistory:
+        rows = self.database.query(
+            ("WITH RECURSIVE path (id, depth) AS ("
+             "SELECT ?, 0 UNION ALL "
+             "SELECT branches.source_id, path.depth + 1 FROM branches JOIN path ON branches.branched_id = path.id) "
+             "SELECT storyChunk.id, storyChunk.history, storyChunk.history_storage, storyData.initial_history "
+             "FROM path JOIN story_chunks AS storyChunk ON storyChunk.id = path.id "
+             "LEFT JOIN story_data AS storyData ON storyData.id = storyChunk.story_id ORDER BY path.depth DESC"),
+            (chunk_id,)
+        )
+        if not rows or rows[-1]["id"] != chunk_id:
+            raise ValueError(f"StoryChunk {chunk_id} not found")
+
+        return self.rebuild_history(rows[-1]["history_storage"], rows[-1]["initial_history"],
+                                    [row["history"] for row in rows])
+
+    def get_story_ids(self) -> list[str]:
+        return [row["id"] for row in self.database.query("SELECT id FROM story_data ORDER BY id")]
+
+    def get_num_story_chunks(self, story_id: str) -> int:
+        return self.database.query("SELECT COUNT(*) AS num_chunks FROM story_chunks WHERE story_id = ?",
+                                   (story_id,))[0]["num_chunks"]
+
+    def get_story_graph(self, story_id: str) -> dict[str, list[dict]]:
+        # Rows are keyed by the write-behind operations, whose queries merge them into Neo4j in any order
+        story_data = [dict(row) for row in self.database.query("SELECT * FROM story_data WHERE id = ?", (story_id,))]
+        if not story_data:
+            raise ValueError(f"StoryData {story_id} not found")
+        initial_history = story_data[0].pop("initial_history")
+        if story_data[0]["themes"] is not None:
+            story_data[0]["themes"] = ujson.loads(story_data[0]["themes"])
+
+        return {
+            "story_data": story_data,
+            "initial_history": [] if initial_history is None else [{"story_id": story_id, "initial_history": initial_history}],
+            "story_chunk": [dict(row) for row in self.database.query("SELECT * FROM story_chunks WHERE story_id = ?",
+                                                                     (story_id,))],
+            "branch": [dict(row) for row in self.database.query(
+                ("SELECT branches.* FROM branches JOIN story_chunks AS storyChunk ON storyChunk.id = branches.source_id "
+                 "WHERE storyChunk.story_id = ?"), (story_id,))],
+            "start_chunk": [dict(row) for row in self.database.query("SELECT * FROM start_chunks WHERE story_id = ?",
+                                                                     (story_id,))],
+        }
+
+    def __str__(self):
+        return (f"SQLiteRepository(database={self.database}, history_storage={self.history_storage.value}, "
+                f"history_compression={self.history_compression})")
+
+
+def get_repository_backend() -> RepositoryBackend:
+    return RepositoryBackend(os.getenv("REPOSITORY_BACKEND", RepositoryBackend.NEO4J.value).lower())
+
+
+def get_repository(backend: Optional[RepositoryBackend] = None) -> Repository:
+    if (backend or get_repository_backend()) is RepositoryBackend.SQLITE:
+        return SQLiteRepository()
+
+    write_mode = WriteMode(os.getenv("NEO4J_WRITE_MODE", WriteMode.IMMEDIATE.value).lower())
+    if write_mode is WriteMode.BATCHED:
+        return BatchingRepository()
+    elif write_mode is WriteMode.WRITE_BEHIND:
+        return WriteBehindRepository()
+    return CommonRepository()
@@ -10,3 +10,6 @@ ConversationHistory = list[ChatCompletionSystemMessageParam | ChatCompletionUser
 ModelResponse = str
 InputTokenCount = int
 OutputTokenCount = int
+CachedInputTokenCount = int
+# A batch request that failed has its error in place of the response
+BatchResult = tuple[ConversationHistory, ModelResponse, InputTokenCount, OutputTokenCount, CachedInputTokenCount] | Exception
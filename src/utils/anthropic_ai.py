@@ -15,6 +15,18 @@ def map_openai_history_to_anthropic_history(history: ConversationHistory) -> Ite
     return converted_history
 
 
+def mark_anthropic_cache_breakpoints(history: Iterable[MessageParam], breakpoints: Iterable[int]) -> list[MessageParam]:
+    marked_history: list[MessageParam] = list(history)
+    for idx in breakpoints:
+        message = marked_history[idx]
+        marked_history[idx] = {
+            "role": message["role"],
+            "content": [{"type": "text", "text": message["content"], "cache_control": {"type": "ephemeral"}}]
+        }
+
+    return marked_history
+
+
 def map_anthropic_history_to_openai_history(history: Iterable[MessageParam]) -> ConversationHistory:
     converted_history: ConversationHistory = []
     for message in history:
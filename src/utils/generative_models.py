@@ -1,3 +1,6 @@
+import os
+from pathlib import Path
+
 from loguru import logger
 from typing_extensions import Optional
 
@@ -6,9 +9,15 @@ from src.image_gen.image_gen_model import ImageGenModel
 from src.image_gen.local_sd import LocalStableDiffusionModel
 from src.image_gen.stable_cascade import StableCascade
 from src.llms.anthropic_model import AnthropicModel
+from src.llms.cached_model import CachedModel
+from src.llms.concurrency_controller import ConcurrencyController
 from src.llms.google_model import GoogleModel
 from src.llms.llm import LLM
 from src.llms.openai_model import OpenAIModel
+from src.llms.rate_limiter import RateLimiter
+from src.llms.response_cache import ResponseCache
+from src.models.enums.llm_cache_mode import LLMCacheMode
+from src.models.retry_policy import RetryPolicy
 
 MAX_TOKENS = {
     'gpt-3.5-turbo-0125': 16385,
@@ -20,7 +29,49 @@ MAX_TOKENS = {
 }
 
 
-def get_generation_model(model_name: str, seed: Optional[int]) -> LLM:
+def get_generation_model(model_name: str, seed: Optional[int], retry_policy: Optional[RetryPolicy] = None) -> LLM:
+    model = get_provider_generation_model(model_name, seed)
+    if retry_policy is not None:
+        model.retry_policy = retry_policy
+    model.rate_limiter = get_rate_limiter(model)
+    model.concurrency_controller = get_concurrency_controller()
+    model.streaming = os.getenv("LLM_STREAMING", "false").lower() == "true"
+    model.batch_poll_interval = float(os.getenv("LLM_BATCH_POLL_INTERVAL", "5"))
+    model.batch_max_poll_interval = float(os.getenv("LLM_BATCH_MAX_POLL_INTERVAL", "60"))
+    model.batch_timeout = float(os.getenv("LLM_BATCH_TIMEOUT", str(24 * 60 * 60)))
+    cache_mode = LLMCacheMode(os.getenv("LLM_CACHE_MODE", LLMCacheMode.PASSTHROUGH.value).lower())
+    if cache_mode is LLMCacheMode.PASSTHROUGH:
+        return model
+
+    cache_dir = Path(os.getenv("LLM_CACHE_DIR", ".cache/llm"))
+    max_size_bytes = int(os.getenv("LLM_CACHE_MAX_SIZE_MB", "1024")) * 1024 * 1024
+    logger.info(f"LLM response cache enabled in {cache_mode.value} mode at {cache_dir}")
+    return CachedModel(model, ResponseCache(cache_dir, max_size_bytes), cache_mode)
+
+
+def get_rate_limiter(model: LLM) -> Optional[RateLimiter]:
+    requests_per_minute = int(os.getenv("LLM_RATE_LIMIT_RPM", "0"))
+    tokens_per_minute = int(os.getenv("LLM_RATE_LIMIT_TPM", "0"))
+    if requests_per_minute <= 0 and tokens_per_minute <= 0:
+        return None
+
+    # Every thread and process generating with the same model shares the state file
+    state_dir = Path(os.getenv("LLM_RATE_LIMIT_DIR", ".cache/rate-limits"))
+    rate_limiter = RateLimiter(RateLimiter.get_path(state_dir, model.provider, model.model_name), requests_per_minute,
+                               tokens_per_minute, float(os.getenv("LLM_RATE_LIMIT_BURST_SECONDS", "10")))
+    logger.info(f"LLM rate limiter enabled: {rate_limiter}")
+    return rate_limiter
+
+
+def get_concurrency_controller() -> Optional[ConcurrencyController]:
+    if os.getenv("LLM_ADAPTIVE_CONCURRENCY", "false").lower() != "true":
+        return None
+    # The generation workers are the upper bound, the controller decides how many of them send requests at once
+    return ConcurrencyController(initial_limit=int(os.getenv("LLM_CONCURRENCY_INITIAL_LIMIT", "4")),
+                                 max_limit=int(os.getenv("LLM_CONCURRENCY_MAX_LIMIT", "64")))
+
+
+def get_provider_generation_model(model_name: str, seed: Optional[int]) -> LLM:
     if model_name in ["gpt-3.5-turbo-0125", "gpt-4-0125-preview"]:
         max_tokens = MAX_TOKENS[model_name]
         return OpenAIModel(model_name, max_tokens, seed)
@@ -1,11 +1,16 @@
 import copy
+from typing import Optional
 
+from src.models.shared_history import SharedHistory
 from src.types.openai import OpenAIRole, ConversationHistory
 
 
 def append_openai_message(message: str,
                           role: OpenAIRole = "user",
-                          history: ConversationHistory = None) -> ConversationHistory:
+                          history: ConversationHistory | SharedHistory = None) -> ConversationHistory | SharedHistory:
+    if isinstance(history, SharedHistory):  # Shares the prefix instead of copying it
+        return history.append(message, role)
+
     if history is None:
         history = []
 
@@ -17,3 +22,11 @@ def append_openai_message(message: str,
     })
 
     return history
+
+
+def to_conversation_history(history: Optional[ConversationHistory | SharedHistory]) -> ConversationHistory:
+    if history is None:
+        return []
+    if isinstance(history, SharedHistory):
+        return history.to_list()
+    return list(history)
@@ -26,9 +26,10 @@ def validate_existing_plot(existing_plot_path: str):
 
 def validate_config(min_num_choices: int, max_num_choices: int, min_num_choices_opportunity: int,
                     max_num_choices_opportunity: int, num_chapters: int, num_endings: int, num_main_characters: int,
-                    num_main_scenes: int):
+                    num_main_scenes: int, num_workers: int = 1, workers: int = 1):
     if min_num_choices < 1 or max_num_choices < 1 or min_num_choices_opportunity < 1 or max_num_choices_opportunity < 1 or \
-            num_chapters < 1 or num_endings < 1 or num_main_characters < 1 or num_main_scenes < 1:
+            num_chapters < 1 or num_endings < 1 or num_main_characters < 1 or num_main_scenes < 1 or num_workers < 1 or \
+            workers < 1:
         logger.error("All config values must be greater than one")
         raise typer.Abort()
 
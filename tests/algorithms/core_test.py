@@ -0,0 +1,66 @@
+import json
+import unittest
+
+from src.algorithms.core import generate_story_chunks_in_batches
+from src.llms.llm import LLM
+from src.models.enums.branching_type import BranchingType
+from src.models.enums.generation_approach import GenerationApproach
+from src.models.frontier_item import FrontierItem
+from src.models.generation_context import GenerationContext
+from src.models.retry_policy import RetryError
+from tests.helpers import WorkingDirectoryTestCase, get_config
+
+
+class FailingBatchLLM(LLM):
+    supports_batch = True
+
+    def __init__(self, errors: list[Exception]):
+        super().__init__(model_name="test-model", max_tokens=1000)
+        self.errors = errors
+        self.num_batches = 0
+
+    def count_token(self, message: str) -> int:
+        return len(message.split())
+
+    def generate_batch(self, messages_list):
+        self.num_batches += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return [(messages, json.dumps({"prompt": messages[-1]["content"]}), 10, 5, 0) for messages in messages_list]
+
+    def request_content(self, history):
+        raise NotImplementedError
+
+    def __str__(self):
+        return "FailingBatchLLM()"
+
+
+def parse_story_chunk(ctx, item, history, current_num_choices, story_chunk_raw, story_chunk_obj):
+    return story_chunk_obj["prompt"], []
+
+
+class GenerateStoryChunksInBatchesTest(WorkingDirectoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ctx = GenerationContext(GenerationApproach.PROPOSED, get_config(batch_api=True))
+        item = FrontierItem(current_chapter=1, used_choice_opportunity=0, state=BranchingType.BRANCHING)
+        self.requests = [(item, [{"role": "user", "content": prompt}], 2) for prompt in ["first", "second"]]
+
+    def tearDown(self):
+        self.ctx.close_logs()
+
+    def test_failed_batch_is_resubmitted(self):
+        self.ctx.generation_model = FailingBatchLLM([TimeoutError("Batch did not complete")])
+        results = generate_story_chunks_in_batches(self.ctx, self.requests, parse_story_chunk)
+        self.assertListEqual([("first", []), ("second", [])], results)
+        self.assertEqual(2, self.ctx.generation_model.num_batches)
+
+    def test_batch_failing_every_attempt_fails_its_chunks(self):
+        self.ctx.generation_model = FailingBatchLLM([RetryError("Submit failed")] * 3)
+        results = generate_story_chunks_in_batches(self.ctx, self.requests, parse_story_chunk)
+        self.assertListEqual([(None, None), (None, None)], results)
+        self.assertEqual(3, self.ctx.generation_model.num_batches)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+from collections import Counter
+
+import ujson
+
+import src.algorithms.proposed as proposed
+from src.models.enums.generation_approach import GenerationApproach
+from src.models.frontier_item import FrontierItem
+from src.models.generation_context import GenerationContext
+from src.models.retry_policy import RetryPolicy
+from tests.helpers import (Crash, FakeLLM, InMemoryRepository,
+                           WorkingDirectoryTestCase, get_config,
+                           get_story_data)
+
+
+class ProcessGenerationQueueTest(WorkingDirectoryTestCase):
+    # 2 chapters with 2 choices at 2 opportunities each form a tree of 55 chunks
+    num_chapters = 2
+    num_choices = 2
+    num_chunks = 55
+
+    def setUp(self):
+        super().setUp()
+        self.story_data = get_story_data(self.num_chapters)
+
+    def create_context(self, repository: InMemoryRepository, model: FakeLLM, num_workers: int = 1,
+                       pipelined: bool = False) -> GenerationContext:
+        config = get_config(min_num_choices=self.num_choices, max_num_choices=self.num_choices,
+                            min_num_choices_opportunity=2, max_num_choices_opportunity=2, num_chapters=self.num_chapters,
+                            num_workers=num_workers, pipelined=pipelined)
+        ctx = GenerationContext(GenerationApproach.PROPOSED, config)
+        ctx.repository = repository
+        ctx.generation_model = model
+        ctx.set_initial_history([{"role": "user", "content": "Plot prompt"}, {"role": "assistant", "content": model.response}])
+        return ctx
+
+    def resume_context(self, ctx: GenerationContext, repository: InMemoryRepository) -> GenerationContext:
+        ctx.close_logs()
+        with open(ctx.output_path / "context.json", "r") as file:
+            resumed_ctx = GenerationContext.from_dict(ujson.load(file))
+        resumed_ctx.repository = repository
+        resumed_ctx.generation_model = FakeLLM(self.num_choices)
+        return resumed_ctx
+
+    def get_tree(self, repository: InMemoryRepository, chunk_id: str) -> tuple:
+        # Chunk ids are random, so trees are compared by their chunks and the choices leading to them
+        story_chunk = repository.story_chunks[chunk_id]
+        children = sorted((branch.choice.model_dump_json() if branch.choice is not None else "", branch.target_chunk_id)
+                          for branch in repository.branches if branch.source_chunk_id == chunk_id)
+        return (story_chunk.chapter, story_chunk.num_opportunities,
+                [(choice, self.get_tree(repository, child_id)) for choice, child_id in children])
+
+    def run_story(self, num_workers: int) -> tuple[InMemoryRepository, Counter, Counter]:
+        repository = InMemoryRepository()
+        ctx = self.create_context(repository, FakeLLM(self.num_choices), num_workers=num_workers)
+        popped_ids, committed_ids = Counter(), Counter()
+        pop_frontier, commit_frontier = ctx.pop_frontier, ctx.commit_frontier
+
+        def count_pop_frontier() -> FrontierItem:
+            item = pop_frontier()
+            popped_ids[item.id] += 1
+            return item
+
+        def count_commit_frontier(item: FrontierItem, child_items: list[FrontierItem]):
+            committed_ids[item.id] += 1
+            commit_frontier(item, child_items)
+
+        ctx.pop_frontier, ctx.commit_frontier = count_pop_frontier, count_commit_frontier
+        proposed.process_generation_queue(ctx, self.story_data)
+        return repository, popped_ids, committed_ids
+
+    def test_concurrent_workers_generate_the_same_tree(self):
+        sequential_repository, _, _ = self.run_story(num_workers=1)
+        sequential_tree = self.get_tree(sequential_repository, *sequential_repository.start_chunks.values())
+
+        for num_workers in [2, 4]:
+            with self.subTest(num_workers=num_workers):
+                repository, popped_ids, committed_ids = self.run_story(num_workers)
+                self.assertEqual(self.num_chunks, len(repository.story_chunks))
+                self.assertEqual(sequential_tree, self.get_tree(repository, *repository.start_chunks.values()))
+                self.assertEqual(popped_ids, committed_ids)
+                self.assertEqual({1}, set(committed_ids.values()))
+
+                # Every chunk continues the conversation of the chunk it branched from
+                for branch in repository.branches:
+                    parent_history = repository.story_chunks[branch.source_chunk_id].history.to_list()
+                    child_history = repository.story_chunks[branch.target_chunk_id].history.to_list()
+                    self.assertListEqual(parent_history, child_history[:len(parent_history)])
+
+    def test_long_story_with_occasional_invalid_responses_finishes(self):
+        self.num_chapters = 3  # 231 chunks
+        self.story_data = get_story_data(self.num_chapters)
+        repository = InMemoryRepository()
+        ctx = self.create_context(repository, FakeLLM(self.num_choices, invalid_every=7), num_workers=2)
+        ctx.retry_policy = RetryPolicy(story_retry_budget=5, base_delay=0)
+        proposed.process_generation_queue(ctx, self.story_data)
+
+        self.assertEqual(231, len(repository.story_chunks))
+        self.assertGreater(ctx.retry_policy.get_stats()["content_retries"], ctx.retry_policy.story_retry_budget)
+
+    def test_pipelined_crash_saves_dispatched_chunks_before_resume(self):
+        for crash_at in [5, 12, 20, 30]:
+            with self.subTest(crash_at=crash_at):
+                repository = InMemoryRepository(write_latency=0.005)
+                ctx = self.create_context(repository, FakeLLM(self.num_choices, crash_at=crash_at), num_workers=3, pipelined=True)
+                with self.assertRaises(Crash):
+                    proposed.process_generation_queue(ctx, self.story_data)
+
+                proposed.process_generation_queue(self.resume_context(ctx, repository), self.story_data)
+                self.assertEqual(self.num_chunks, len(repository.story_chunks))
+                self.assertEqual(self.num_chunks - 1, len(repository.branches))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import unittest
+from unittest.mock import patch
+
+from neo4j.exceptions import ClientError, TransientError
+
+from src.database import Neo4J
+
+
+class FailingSession:
+    def __init__(self, driver: "FailingDriver"):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def run(self, query: str):
+        self.driver.num_queries += 1
+        if self.driver.errors:
+            raise self.driver.errors.pop(0)
+
+
+class FailingDriver:
+    def __init__(self, errors: list[Exception]):
+        self.errors = errors
+        self.num_queries = 0
+
+    def session(self):
+        return FailingSession(self)
+
+
+class Neo4JSchemaTest(unittest.TestCase):
+    def setUp(self):
+        self.env = patch.dict(os.environ, {"NEO4J_URI": "bolt://localhost:7687", "NEO4J_AUTH": "neo4j/password"})
+        self.env.start()
+
+    def tearDown(self):
+        Neo4J._instance = None
+        self.env.stop()
+
+    def create_database(self, driver: FailingDriver) -> Neo4J:
+        with patch("src.database.GraphDatabase.driver", return_value=driver):
+            return Neo4J()
+
+    def test_rejected_schema_is_not_retried(self):
+        driver = FailingDriver([ClientError("Duplicated ids")])
+        database = self.create_database(driver)
+        for _ in range(3):
+            database.bootstrap_schema()
+        self.assertFalse(database.is_schema_ready)
+        self.assertEqual(1, driver.num_queries)
+
+    def test_transient_error_is_retried(self):
+        driver = FailingDriver([TransientError("Deadlock")])
+        database = self.create_database(driver)
+        database.bootstrap_schema()
+        self.assertFalse(database.is_schema_ready)
+        database.bootstrap_schema()
+        self.assertTrue(database.is_schema_ready)
+        self.assertEqual(1 + len(Neo4J.SCHEMA_QUERIES), driver.num_queries)
+
+
+if __name__ == "__main__":
+    unittest.main()
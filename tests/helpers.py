@@ -0,0 +1,128 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import contextmanager
+from typing import Iterator
+
+import ujson
+
+from src.llms.llm import LLM
+from src.models.generation_config import GenerationConfig
+from src.models.story_branch import StoryBranch
+from src.models.story_chunk import StoryChunk
+from src.models.story_data import StoryData
+from src.utils.openai_ai import to_conversation_history
+
+# Fakes shared by the tests and scripts/benchmark.py, so the benchmarked pipeline is the one that is tested
+
+
+class Crash(KeyboardInterrupt):
+    # Not retried, like a process that is stopped while generating
+    pass
+
+
+class FakeLLM(LLM):
+    def __init__(self, num_choices: int, latency: float = 0.0, num_narratives: int = 1, narrative_length: int = 20,
+                 crash_at: int = -1, invalid_every: int = 0):
+        super().__init__(model_name="fake-model", max_tokens=10 ** 9)
+        self.latency = latency
+        # The request with this number raises Crash, and every invalid_every-th response is truncated JSON
+        self.crash_at = crash_at
+        self.invalid_every = invalid_every
+        self.num_requests = 0
+        self._lock = threading.Lock()
+        self.response = ujson.dumps({
+            "story_so_far": "x" * narrative_length,
+            "story": [{"id": i, "speaker": "Narrator", "speaker_id": -1, "scene_title": "Scene", "scene_id": 1,
+                       "text": "x" * narrative_length} for i in range(num_narratives)],
+            "choices": [{"id": i, "choice": f"Choice {i}", "description": "x" * narrative_length} for i in range(num_choices)]
+        })
+
+    def count_token(self, message: str) -> int:
+        return len(message) // 4
+
+    def request_content(self, history):
+        with self._lock:
+            self.num_requests += 1
+            num_requests = self.num_requests
+        if num_requests == self.crash_at:
+            raise Crash()
+        time.sleep(self.latency)
+        response = self.response
+        if self.invalid_every and num_requests % self.invalid_every == 0:
+            response = response[:len(response) // 2]
+        return history, response, sum(self.count_token(m["content"]) for m in history), len(response) // 4, 0
+
+    def __str__(self):
+        return f"FakeLLM(latency={self.latency})"
+
+
+class InMemoryRepository:
+    def __init__(self, write_latency: float = 0.0):
+        self.write_latency = write_latency  # Stands in for a round trip to a remote database
+        self.story_chunks: dict[str, StoryChunk] = {}
+        self.branches: list[StoryBranch] = []
+        self.start_chunks: dict[str, str] = {}
+
+    def create_story_chunk(self, story_chunk: StoryChunk):
+        # Serializes the chunk the same way the Neo4j repository builds its query parameters
+        story_chunk_obj = story_chunk.model_dump(exclude={"history"})
+        story_chunk_obj["history"] = ujson.dumps(to_conversation_history(story_chunk.history))
+        time.sleep(self.write_latency)
+        self.story_chunks[story_chunk.id] = story_chunk
+
+    def create_branch(self, branch: StoryBranch):
+        branch.model_dump()
+        self.branches.append(branch)
+
+    def set_start_chunk(self, story_id: str, chunk_id: str):
+        self.start_chunks[story_id] = chunk_id
+
+    def set_initial_history(self, story_id: str, history):
+        pass
+
+    def get_num_story_chunks(self, story_id: str) -> int:
+        return sum(1 for story_chunk in self.story_chunks.values() if story_chunk.story_id == story_id)
+
+    def flush(self):
+        pass
+
+
+def get_config(**fields) -> GenerationConfig:
+    return GenerationConfig(**{
+        "min_num_choices": 2, "max_num_choices": 2, "min_num_choices_opportunity": 1, "max_num_choices_opportunity": 1,
+        "game_genre": "visual novel", "themes": ["test"], "num_chapters": 1, "num_endings": 1,
+        "num_main_characters": 1, "num_main_scenes": 1, "enable_image_generation": False, **fields
+    })
+
+
+def get_story_data(num_chapters: int) -> StoryData:
+    return StoryData.model_validate({
+        "id": "test", "title": "Test", "genre": "Visual novel", "themes": ["test"], "main_scenes": [],
+        "main_characters": [], "synopsis": "Synopsis",
+        "chapter_synopses": [{"chapter": i, "synopsis": "Synopsis", "character_ids": [], "scene_ids": []}
+                             for i in range(1, num_chapters + 1)],
+        "beginning": "Beginning", "endings": [{"id": 1, "ending": "Ending"}], "generated_by": "fake-model",
+        "approach": "proposed"
+    })
+
+
+@contextmanager
+def temporary_working_directory() -> Iterator[str]:
+    # Story outputs are written relative to the working directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        try:
+            yield temp_dir
+        finally:
+            os.chdir(cwd)
+
+
+class WorkingDirectoryTestCase(unittest.TestCase):
+    def setUp(self):
+        working_directory = temporary_working_directory()
+        self.working_directory = working_directory.__enter__()
+        self.addCleanup(working_directory.__exit__, None, None, None)
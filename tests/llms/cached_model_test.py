@@ -0,0 +1,94 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.llms.cached_model import CachedModel
+from src.llms.llm import LLM
+from src.llms.response_cache import ResponseCache
+from src.models.enums.llm_cache_mode import LLMCacheMode
+from src.models.shared_history import SharedHistory
+
+
+class CountingLLM(LLM):
+    def __init__(self):
+        super().__init__(model_name="test-model", max_tokens=1000)
+        self.seed = 42
+        self.num_calls = 0
+
+    def count_token(self, message: str) -> int:
+        return len(message)
+
+    def request_content(self, history):
+        self.num_calls += 1
+        return history, f"response {self.num_calls}", 10, 5, 0
+
+    def __str__(self):
+        return "CountingLLM()"
+
+
+class CachedModelTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = Path(self.temp_dir.name)
+        self.messages = [{"role": "user", "content": "Hello"}]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_record_then_replay(self):
+        model = CountingLLM()
+        recorder = CachedModel(model, ResponseCache(self.cache_dir, 1024 * 1024), LLMCacheMode.RECORD)
+        first = recorder.generate_content(self.messages)
+        recorder.accept_response(self.messages)
+        second = recorder.generate_content(SharedHistory.from_list(self.messages))
+        self.assertEqual(first, second)
+        self.assertEqual(model.num_calls, 1)
+
+        replay_model = CountingLLM()
+        replayer = CachedModel(replay_model, ResponseCache(self.cache_dir, 1024 * 1024), LLMCacheMode.REPLAY)
+        self.assertEqual(replayer.generate_content(self.messages), first)
+        self.assertEqual(replay_model.num_calls, 0)
+
+    def test_rejected_response_is_not_recorded(self):
+        model = CountingLLM()
+        recorder = CachedModel(model, ResponseCache(self.cache_dir, 1024 * 1024), LLMCacheMode.RECORD)
+        rejected = recorder.generate_content(self.messages)  # The caller failed to parse it and retries
+        retried = recorder.generate_content(self.messages)
+        self.assertNotEqual(rejected, retried)
+        self.assertEqual(model.num_calls, 2)
+
+        recorder.accept_response(self.messages)
+        self.assertEqual(recorder.generate_content(self.messages), retried)
+        self.assertEqual(model.num_calls, 2)
+
+    def test_replay_miss_raises(self):
+        replayer = CachedModel(CountingLLM(), ResponseCache(self.cache_dir, 1024 * 1024), LLMCacheMode.REPLAY)
+        with self.assertRaises(ValueError):
+            replayer.generate_content(self.messages)
+
+    def test_key_depends_on_seed(self):
+        key = ResponseCache.get_key("test-model", self.messages, 42, {})
+        self.assertEqual(key, ResponseCache.get_key("test-model", self.messages, 42, {}))
+        self.assertNotEqual(key, ResponseCache.get_key("test-model", self.messages, 43, {}))
+
+    def test_entry_removed_by_another_process_is_a_miss(self):
+        cache = ResponseCache(self.cache_dir, 1024)
+        cache.put("aa1", {"response": "x"})
+        (self.cache_dir / "aa" / "aa1.json").unlink()
+        self.assertIsNone(cache.get("aa1"))
+        self.assertNotIn("aa1", cache)
+
+    def test_evicts_least_recently_used(self):
+        cache = ResponseCache(self.cache_dir, 250)
+        for key in ["aa1", "bb2", "cc3"]:
+            cache.put(key, {"response": "x" * 100})
+            if key == "bb2":
+                cache.get("aa1")
+        self.assertIn("aa1", cache)
+        self.assertNotIn("bb2", cache)
+        self.assertIn("cc3", cache)
+        self.assertFalse((self.cache_dir / "bb" / "bb2.json").exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
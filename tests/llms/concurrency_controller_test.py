@@ -0,0 +1,92 @@
+import threading
+import unittest
+
+from src.llms.concurrency_controller import ConcurrencyController
+from src.llms.llm import LLM
+from src.models.enums.request_outcome import RequestOutcome
+from src.models.retry_policy import RetryPolicy
+
+
+class ThrottledError(Exception):
+    pass
+
+
+class ThrottledLLM(LLM):
+    throttling_errors = (ThrottledError,)
+    retryable_errors = (ThrottledError,)
+
+    def __init__(self, num_throttled: int):
+        super().__init__(model_name="test-model", max_tokens=1000)
+        self.num_throttled = num_throttled
+
+    def count_token(self, message: str) -> int:
+        return len(message.split())
+
+    def request_content(self, history):
+        if self.num_throttled > 0:
+            self.num_throttled -= 1
+            raise ThrottledError("429 Too Many Requests")
+        return history, "{}", 3, 10, 0
+
+    def __str__(self):
+        return "ThrottledLLM()"
+
+
+class ConcurrencyControllerTest(unittest.TestCase):
+    def test_limit_grows_additively_on_healthy_requests(self):
+        controller = ConcurrencyController(initial_limit=2)
+        for _ in range(6):  # About one more request per limit requests
+            controller.acquire()
+            controller.release(1.0, RequestOutcome.SUCCESS)
+        self.assertEqual(4, controller.get_stats()["limit"])
+
+    def test_limit_halves_once_per_throttling_burst(self):
+        controller = ConcurrencyController(initial_limit=16)
+        controller._latencies.append(10.0)
+        for _ in range(4):  # Requests that were in flight together are throttled together
+            controller.acquire()
+        for _ in range(4):
+            controller.release(0.5, RequestOutcome.THROTTLED)
+
+        stats = controller.get_stats()
+        self.assertEqual(8, stats["limit"])
+        self.assertEqual(1.0, stats["throttle_rate"])
+
+    def test_limit_does_not_grow_on_slow_requests(self):
+        controller = ConcurrencyController(initial_limit=2, latency_tolerance=3.0)
+        for _ in range(10):
+            controller.acquire()
+            controller.release(1.0, RequestOutcome.SUCCESS)
+        limit = controller.limit
+        controller.acquire()
+        controller.release(5.0, RequestOutcome.SUCCESS)
+        self.assertEqual(limit, controller.limit)
+        self.assertEqual(1.0, controller.get_stats()["latency_p50"])
+
+    def test_acquire_waits_for_a_free_slot(self):
+        controller = ConcurrencyController(initial_limit=1)
+        controller.acquire()
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: controller.acquire() or acquired.set())
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+
+        controller.release(0.1, RequestOutcome.SUCCESS)
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+
+    def test_generate_content_reports_throttled_requests(self):
+        llm = ThrottledLLM(num_throttled=2)
+        llm.retry_policy = RetryPolicy(base_delay=0)
+        llm.concurrency_controller = ConcurrencyController(initial_limit=8)
+        _, response, _, _, _ = llm.generate_content([{"role": "user", "content": "one two three"}])
+
+        self.assertEqual("{}", response)
+        stats = llm.get_stats()
+        self.assertEqual(4, stats["limit"])  # The second throttled request came within the cooldown
+        self.assertEqual(0, stats["in_flight"])
+        self.assertAlmostEqual(2 / 3, stats["throttle_rate"], places=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest.mock import patch
+
+from src.llms.cached_model import CachedModel
+from src.llms.openai_model import OpenAIModel
+from src.llms.response_cache import ResponseCache
+from src.models.enums.llm_cache_mode import LLMCacheMode
+
+
+class FakeBatchHandler(BaseHTTPRequestHandler):
+    # Processes a batch once it has been polled this many times
+    num_polls_to_complete = 2
+    final_status = "completed"
+    files: dict[str, str] = {}
+    batches: dict[str, dict] = {}
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path == "/v1/files":
+            message = BytesParser().parsebytes(b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body)
+            content = next(part.get_payload(decode=True) for part in message.get_payload() if part.get_filename())
+            file_id = self.add_file(content.decode())
+            self.send_json({"id": file_id, "object": "file", "bytes": len(content), "created_at": 0,
+                            "filename": "batch.jsonl", "purpose": "batch", "status": "processed"})
+        elif self.path == "/v1/batches":
+            request = json.loads(body)
+            batch = {"id": f"batch-{len(FakeBatchHandler.batches)}", "object": "batch", "endpoint": request["endpoint"],
+                     "input_file_id": request["input_file_id"], "completion_window": request["completion_window"],
+                     "created_at": 0, "status": "validating", "num_polls": 0}
+            FakeBatchHandler.batches[batch["id"]] = batch
+            self.send_json(batch)
+
+    def do_GET(self):
+        if self.path.startswith("/v1/batches/"):
+            batch = FakeBatchHandler.batches[self.path.rsplit("/", 1)[-1]]
+            batch["num_polls"] += 1
+            if batch["status"] in ("validating", "in_progress"):
+                if batch["num_polls"] < FakeBatchHandler.num_polls_to_complete:
+                    batch["status"] = "in_progress"
+                else:
+                    self.process_batch(batch)
+            self.send_json(batch)
+        elif self.path.startswith("/v1/files/") and self.path.endswith("/content"):
+            content = FakeBatchHandler.files[self.path.split("/")[3]].encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    @staticmethod
+    def add_file(content: str) -> str:
+        file_id = f"file-{len(FakeBatchHandler.files)}"
+        FakeBatchHandler.files[file_id] = content
+        return file_id
+
+    @staticmethod
+    def process_batch(batch: dict):
+        requests = [json.loads(line) for line in FakeBatchHandler.files[batch["input_file_id"]].splitlines()]
+        if FakeBatchHandler.final_status == "expired":  # Only the first request was processed in time
+            requests = requests[:1]
+
+        outputs, errors = [], []
+        for request in requests:
+            prompt = request["body"]["messages"][-1]["content"]
+            if "fail" in prompt:
+                errors.append({"id": "response", "custom_id": request["custom_id"], "error": None,
+                               "response": {"status_code": 500, "body": {"error": {"message": "Server error"}}}})
+                continue
+            outputs.append({"id": "response", "custom_id": request["custom_id"], "error": None, "response": {
+                "status_code": 200,
+                "body": {"id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": request["body"]["model"],
+                         "choices": [{"index": 0, "finish_reason": "stop",
+                                      "message": {"role": "assistant", "content": json.dumps({"echo": prompt})}}],
+                         "usage": {"prompt_tokens": 100, "completion_tokens": 10, "total_tokens": 110}}
+            }})
+
+        # Outputs are not in request order
+        batch["output_file_id"] = FakeBatchHandler.add_file("".join(json.dumps(o) + "\n" for o in reversed(outputs)))
+        batch["error_file_id"] = FakeBatchHandler.add_file("".join(json.dumps(e) + "\n" for e in errors)) if errors else None
+        batch["status"] = FakeBatchHandler.final_status
+
+    def send_json(self, obj: dict):
+        response = json.dumps(obj).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+class OpenAIBatchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeBatchHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.env = patch.dict(os.environ, {"OPENAI_API_KEY": "test",
+                                          "OPENAI_BASE_URL": f"http://127.0.0.1:{cls.server.server_port}/v1"})
+        cls.env.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.env.stop()
+        cls.server.shutdown()
+
+    def setUp(self):
+        FakeBatchHandler.files.clear()
+        FakeBatchHandler.batches.clear()
+        FakeBatchHandler.final_status = "completed"
+        self.model = OpenAIModel("gpt-3.5-turbo-0125")
+        self.model.count_token = lambda message: len(message.split())
+        self.model.batch_poll_interval = 0.01
+        self.messages_list = [[{"role": "user", "content": prompt}] for prompt in ["first", "fail", "third"]]
+
+    def test_generate_batch_returns_results_in_request_order(self):
+        results = self.model.generate_batch(self.messages_list)
+
+        first, failed, third = results
+        self.assertEqual(json.dumps({"echo": "first"}), first[1])
+        self.assertEqual((100, 10, 0), first[2:])
+        self.assertIsInstance(failed, ValueError)
+        self.assertEqual(json.dumps({"echo": "third"}), third[1])
+
+        batch, = FakeBatchHandler.batches.values()
+        self.assertEqual(FakeBatchHandler.num_polls_to_complete, batch["num_polls"])
+        submitted = [json.loads(line) for line in FakeBatchHandler.files[batch["input_file_id"]].splitlines()]
+        self.assertListEqual(["0", "1", "2"], [request["custom_id"] for request in submitted])
+        self.assertEqual({"type": "json_object"}, submitted[0]["body"]["response_format"])
+
+    def test_unprocessed_requests_of_expired_batch_fail(self):
+        FakeBatchHandler.final_status = "expired"
+        first, second, third = self.model.generate_batch(self.messages_list)
+        self.assertEqual(json.dumps({"echo": "first"}), first[1])
+        self.assertIsInstance(second, ValueError)
+        self.assertIsInstance(third, ValueError)
+
+    def test_cached_model_only_submits_missed_requests(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            model = CachedModel(self.model, ResponseCache(Path(cache_dir), 1024 * 1024), LLMCacheMode.RECORD)
+            first_results = model.generate_batch(self.messages_list)
+            for messages in self.messages_list:
+                model.accept_response(messages)
+            second_results = model.generate_batch(self.messages_list)
+
+        self.assertEqual(2, len(FakeBatchHandler.batches))
+        resubmitted = FakeBatchHandler.files[FakeBatchHandler.batches["batch-1"]["input_file_id"]].splitlines()
+        self.assertEqual(1, len(resubmitted))  # Only the failed request
+        self.assertEqual(first_results[0], second_results[0])
+        self.assertEqual(first_results[2], second_results[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.llms.openai_model import OpenAIModel
+from src.llms.stream_validator import (StoryChunkStreamValidator,
+                                       StreamAbortedError)
+from src.models.shared_history import SharedHistory
+
+
+class FakeChatCompletionHandler(BaseHTTPRequestHandler):
+    requests: list[dict] = []
+    stream_chunks: list[str] = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        FakeChatCompletionHandler.requests.append(body)
+        if body.get("stream"):
+            self.stream_response(body)
+            return
+        response = json.dumps({
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": " {\"key\": \"value\"} "}}],
+            "usage": {"prompt_tokens": 2048, "completion_tokens": 16, "total_tokens": 2064,
+                      "prompt_tokens_details": {"cached_tokens": 1024}}
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def stream_response(self, body: dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        chunks = [{"choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]}
+                  for content in FakeChatCompletionHandler.stream_chunks]
+        chunks.append({"choices": [], "usage": {"prompt_tokens": 2048, "completion_tokens": 16, "total_tokens": 2064}})
+        try:
+            for chunk in chunks:
+                chunk.update({"id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0, "model": body["model"]})
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(0.01)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):  # The client cancelled the stream
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class OpenAIModelTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeChatCompletionHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        os.environ["OPENAI_API_KEY"] = "test"
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{cls.server.server_port}/v1"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        FakeChatCompletionHandler.requests.clear()
+        FakeChatCompletionHandler.stream_chunks = []
+        self.model = OpenAIModel("gpt-3.5-turbo-0125")
+        self.model.count_token = lambda message: len(message.split())
+
+    def test_generate_content_records_cached_prompt_tokens(self):
+        history = SharedHistory.from_list([{"role": "user", "content": "plot"}]).append("story data", "assistant")
+        messages, response, prompt_tokens, completion_tokens, cached_prompt_tokens = \
+            self.model.generate_content(history.append("chunk"))
+
+        self.assertEqual("{\"key\": \"value\"}", response)
+        self.assertEqual(2048, prompt_tokens)
+        self.assertEqual(16, completion_tokens)
+        self.assertEqual(1024, cached_prompt_tokens)
+        self.assertEqual(3, len(messages))
+
+    def test_generate_content_keeps_prefix_stable(self):
+        prefix = SharedHistory.from_list([{"role": "user", "content": "plot"}, {"role": "assistant", "content": "story data"},
+                                          {"role": "user", "content": "first chunk"}, {"role": "assistant", "content": "{}"}])
+        self.model.generate_content(prefix.append("first choice"))
+        self.model.generate_content(prefix.append("second choice"))
+
+        first_request, second_request = FakeChatCompletionHandler.requests
+        self.assertEqual(json.dumps(first_request["messages"][:4]), json.dumps(second_request["messages"][:4]))
+
+    def test_stream_content_returns_the_streamed_response(self):
+        FakeChatCompletionHandler.stream_chunks = [" {\"story_so_far\": ", "\"The ship\", \"choices\": ", "[]} "]
+        self.model.streaming = True
+        _, response, prompt_tokens, completion_tokens, _ = \
+            self.model.generate_content([{"role": "user", "content": "chunk"}], StoryChunkStreamValidator(num_choices=0))
+
+        self.assertTrue(FakeChatCompletionHandler.requests[0]["stream"])
+        self.assertEqual("{\"story_so_far\": \"The ship\", \"choices\": []}", response)
+        self.assertEqual((2048, 16), (prompt_tokens, completion_tokens))
+
+    def test_stream_content_aborts_invalid_response_early(self):
+        FakeChatCompletionHandler.stream_chunks = ["{\"story_so_far\": ", "[\"not a string\"]"] + [" "] * 100
+        self.model.streaming = True
+        start_time = time.monotonic()
+        with self.assertRaises(StreamAbortedError):
+            self.model.generate_content([{"role": "user", "content": "chunk"}], StoryChunkStreamValidator(num_choices=2))
+        self.assertLess(time.monotonic() - start_time, 0.5)  # Streaming the whole response takes over a second
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+import ujson
+
+from src.llms.llm import LLM
+from src.llms.rate_limiter import RateLimiter
+
+
+class SilentLLM(LLM):
+    def __init__(self):
+        super().__init__(model_name="test-model", max_tokens=1000)
+
+    def count_token(self, message: str) -> int:
+        return len(message.split())
+
+    def request_content(self, history):
+        return history, "{}", 3, 10, 0
+
+    def __str__(self):
+        return "SilentLLM()"
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = RateLimiter.get_path(Path(self.temp_dir.name), "openai", "gpt-3.5-turbo-0125")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_requests_wait_for_the_bucket_to_refill(self):
+        rate_limiter = RateLimiter(self.path, requests_per_minute=1200, tokens_per_minute=0, burst_seconds=0.1)
+        start_time = time.monotonic()
+        for _ in range(4):  # Two requests fit in the bucket, the next two wait 50 ms each
+            rate_limiter.acquire(100)
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.09)
+
+    def test_state_is_shared_between_limiters(self):
+        # Limiters of different processes only have the state file in common
+        rate_limiters = [RateLimiter(self.path, requests_per_minute=0, tokens_per_minute=60000, burst_seconds=0.1)
+                         for _ in range(2)]
+        rate_limiters[0].acquire(100)
+        start_time = time.monotonic()
+        rate_limiters[1].acquire(100)
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.09)
+
+    def test_unused_tokens_are_released(self):
+        rate_limiter = RateLimiter(self.path, requests_per_minute=0, tokens_per_minute=60000, burst_seconds=0.1)
+        rate_limiter.acquire(100)
+        rate_limiter.release(100)
+        start_time = time.monotonic()
+        rate_limiter.acquire(100)
+        self.assertLess(time.monotonic() - start_time, 0.05)
+
+    def test_concurrent_requests_stay_within_the_limit(self):
+        rate_limiter = RateLimiter(self.path, requests_per_minute=6000, tokens_per_minute=0, burst_seconds=0.01)
+        start_time = time.monotonic()
+        threads = [threading.Thread(target=lambda: [rate_limiter.acquire(1) for _ in range(5)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 20 requests at 100 per second, the first one is taken from the full bucket
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.18)
+
+    def test_generate_content_reserves_and_reconciles_tokens(self):
+        llm = SilentLLM()
+        llm.rate_limiter = RateLimiter(self.path, requests_per_minute=0, tokens_per_minute=6000)
+        llm.expected_output_tokens = 50
+        llm.generate_content([{"role": "user", "content": "one two three"}])
+
+        # 3 prompt and 50 output tokens were reserved, the response used 3 and 10
+        with open(self.path, "r") as file:
+            self.assertAlmostEqual(llm.rate_limiter.token_capacity - 13, ujson.load(file)["tokens"], delta=2)
+        self.assertEqual(42, llm.expected_output_tokens)
+
+
+if __name__ == "__main__":
+    unittest.main()
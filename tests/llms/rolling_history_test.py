@@ -6,13 +6,13 @@ from src.types.openai import ConversationHistory
 
 class TestLLM(LLM):
     def __init__(self, max_tokens: int):
-        super().__init__(max_tokens=max_tokens)
+        super().__init__(model_name="test-model", max_tokens=max_tokens)
 
     def count_token(self, message: str) -> int:
         return len(message.split())
 
-    def generate_content(self, ctx: 'GenerationContext', messages: ConversationHistory) -> tuple[str, dict]:
-        return "generated content", {}
+    def request_content(self, history: ConversationHistory):
+        return history, "generated content", 0, 0, 0
 
     def __str__(self):
         return "TestLLM"
@@ -60,6 +60,19 @@ class RollingHistoryTest(unittest.TestCase):
 
         self.assertTrue("History is not in the correct conversation format: assistant" in str(context.exception))
 
+    def test_token_counts_are_memoized(self):
+        history: ConversationHistory = []
+        for i in range(1, 106, 5):
+            role = "user" if i % 2 == 1 else "assistant"
+            history.append({"role": role, "content": f"{i} {i + 1} {i + 2} {i + 3} {i + 4}"})
+
+        llm = TestLLM(50)
+        counted_messages = []
+        llm.count_token = lambda message: counted_messages.append(message) or len(message.split())
+        llm.rolling_history(history)
+        llm.rolling_history(history)
+        self.assertEqual(len(history), len(counted_messages))
+
 
 if __name__ == "__main__":
     unittest.main()
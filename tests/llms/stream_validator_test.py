@@ -0,0 +1,93 @@
+import json
+import unittest
+
+from src.llms.stream_validator import (JSONStreamValidator,
+                                       StoryChunkStreamValidator,
+                                       StreamAbortedError)
+from src.utils.general import parse_json_string
+
+
+def create_narrative(idx: int) -> dict:
+    return {"id": idx, "speaker": "Narration", "speaker_id": -1, "scene_title": "Harbor", "scene_id": 1,
+            "text": f"Line {idx} with \"quotes\", braces {{}} and brackets []"}
+
+
+def create_response(num_narratives: int = 2, num_choices: int = 3) -> str:
+    return json.dumps({"id": 1, "story_so_far": "The ship arrived.",
+                       "story": [create_narrative(idx) for idx in range(num_narratives)],
+                       "choices": [{"id": idx, "choice": f"Choice {idx}", "description": "A path"} for idx in range(num_choices)]},
+                      indent=2)
+
+
+def feed_in_chunks(validator: JSONStreamValidator, response: str, chunk_size: int = 7):
+    for idx in range(0, len(response), chunk_size):
+        validator.feed(response[idx:idx + chunk_size])
+
+
+class StreamValidatorTest(unittest.TestCase):
+    def test_valid_response_is_fed_completely(self):
+        response = f"```json\n{create_response()}\n```"
+        validator = StoryChunkStreamValidator(num_choices=3)
+        feed_in_chunks(validator, response)
+
+        self.assertEqual(response, validator.get_response())
+        self.assertEqual(3, len(parse_json_string(validator.get_response())["choices"]))
+
+    def test_too_few_choices_abort_when_the_choices_end(self):
+        response = create_response(num_choices=1)
+        validator = StoryChunkStreamValidator(num_choices=3)
+        with self.assertRaises(StreamAbortedError) as context:
+            feed_in_chunks(validator, response + " " * 100, chunk_size=1)
+
+        self.assertIn("Choices generated by model (1) less than setting choices (3)", str(context.exception))
+        self.assertEqual(response[:response.rindex("]") + 1], context.exception.response)
+
+    def test_wrong_story_type_aborts_at_its_first_character(self):
+        response = '{"story_so_far": "The ship arrived.", "story": "Once upon a time'
+        with self.assertRaises(StreamAbortedError) as context:
+            feed_in_chunks(StoryChunkStreamValidator(num_choices=2), response, chunk_size=1)
+        self.assertTrue(context.exception.response.endswith('"story": "'))
+
+    def test_narrative_field_types_and_missing_fields_abort(self):
+        invalid_narratives = [
+            {**create_narrative(0), "text": ["not", "a", "string"]},
+            {key: value for key, value in create_narrative(0).items() if key != "speaker_id"},
+        ]
+        for narrative in invalid_narratives:
+            with self.subTest(narrative=narrative), self.assertRaises(StreamAbortedError):
+                feed_in_chunks(StoryChunkStreamValidator(num_choices=1), json.dumps({"story": [narrative]}))
+
+    def test_numeric_strings_are_accepted_for_int_fields(self):
+        narrative = {**create_narrative(0), "id": "0", "scene_id": 1.0}
+        feed_in_chunks(StoryChunkStreamValidator(num_choices=0), json.dumps({"story": [narrative]}))
+
+    def test_malformed_json_aborts(self):
+        for response in ['{"story": [}', '{"story_so_far" "text"}', '{"story_so_far": "a\nb"}', '{"id": tru}']:
+            with self.subTest(response=response), self.assertRaises(StreamAbortedError):
+                JSONStreamValidator().feed(response)
+
+    def test_preamble_before_the_fenced_response_is_skipped(self):
+        # The example object is not validated, as parse_json_string only parses the fenced block
+        response = f'Sure! Unlike {{"story": []}}, this story has narratives:\n```json\n{create_response()}\n```\n'
+        validator = StoryChunkStreamValidator(num_choices=3)
+        feed_in_chunks(validator, response, chunk_size=1)
+
+        self.assertEqual(response, validator.get_response())
+        self.assertEqual(3, len(parse_json_string(validator.get_response())["choices"]))
+
+    def test_invalid_fenced_response_after_a_preamble_aborts(self):
+        response = f'Here it is:\n```\n{create_response(num_choices=1)}\n```'
+        with self.assertRaises(StreamAbortedError):
+            feed_in_chunks(StoryChunkStreamValidator(num_choices=3), response)
+
+    def test_reset_starts_a_new_response(self):
+        validator = StoryChunkStreamValidator(num_choices=3)
+        with self.assertRaises(StreamAbortedError):
+            validator.feed('{"story": []')
+        validator.reset()
+        validator.feed(create_response())
+        self.assertEqual(create_response(), validator.get_response())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+from src.llms.llm import LLM
+from src.llms.token_estimator import TokenEstimator
+
+
+class EstimatingLLM(LLM):
+    memoize_token_counts = False
+
+    def __init__(self):
+        super().__init__(model_name="estimating-model", max_tokens=1000)
+        self.token_estimator = TokenEstimator(calibration_interval=1, smoothing=1.0)
+
+    def count_token(self, message: str) -> int:
+        return self.token_estimator.estimate(message)
+
+    def request_content(self, history):
+        raise NotImplementedError
+
+    def __str__(self):
+        return "EstimatingLLM()"
+
+
+class TokenEstimatorTest(unittest.TestCase):
+    def test_estimate(self):
+        estimator = TokenEstimator()
+        self.assertEqual(0, estimator.estimate(""))
+        self.assertEqual(6, estimator.estimate("Hello, lighthouse 127!"))
+
+    def test_calibrate_moves_ratio_towards_exact_count(self):
+        estimator = TokenEstimator(calibration_interval=1, smoothing=0.5)
+        estimator.calibrate(["one two three four"], 8)
+        self.assertAlmostEqual(1.5, estimator.ratio)
+        self.assertEqual(6, estimator.estimate("one two three four"))
+
+    def test_calibrate_every_interval(self):
+        estimator = TokenEstimator(calibration_interval=2, smoothing=1.0)
+        estimator.calibrate(["one two"], 4)
+        self.assertEqual(1.0, estimator.ratio)
+        estimator.calibrate(["one two"], 4)
+        self.assertEqual(2.0, estimator.ratio)
+
+    def test_calibration_disabled(self):
+        estimator = TokenEstimator(calibration_interval=0)
+        estimator.calibrate(["one two"], 4)
+        self.assertEqual(1.0, estimator.ratio)
+
+    def test_calibration_applies_to_counted_messages(self):
+        llm = EstimatingLLM()
+        history = [{"role": "user", "content": "one two three four"}]
+        self.assertEqual([0, 4], llm.get_token_prefix_sums(history))
+        llm.token_estimator.calibrate(["one two three four"], 8)
+        self.assertEqual([0, 8], llm.get_token_prefix_sums(history))
+
+
+if __name__ == "__main__":
+    unittest.main()
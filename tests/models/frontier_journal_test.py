@@ -0,0 +1,58 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.models.enums.branching_type import BranchingType
+from src.models.frontier_item import FrontierItem
+from src.models.frontier_journal import FrontierJournal
+
+
+def create_item(chapter: int) -> FrontierItem:
+    return FrontierItem(current_chapter=chapter, used_choice_opportunity=0, state=BranchingType.BRANCHING)
+
+
+class FrontierJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name) / "frontiers.jsonl"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_replay_keeps_unpopped_items_in_order(self):
+        root, first, second, third = create_item(1), create_item(2), create_item(3), create_item(4)
+        journal = FrontierJournal(self.path)
+        journal.append(None, [root])
+        journal.append(root, [first, second])
+        journal.append(first, [third])
+        journal.close()
+
+        actual = FrontierJournal(self.path).replay()
+        self.assertListEqual([second, third], actual)
+
+    def test_replay_ignores_truncated_record(self):
+        root = create_item(1)
+        journal = FrontierJournal(self.path)
+        journal.append(None, [root])
+        journal.close()
+        with open(self.path, "a") as file:
+            file.write('{"op": "pop", "id"')
+
+        actual = FrontierJournal(self.path).replay()
+        self.assertListEqual([root], actual)
+
+    def test_compact_rewrites_live_items(self):
+        root, first, second = create_item(1), create_item(2), create_item(3)
+        journal = FrontierJournal(self.path, min_compaction_records=2)
+        journal.append(None, [root])
+        journal.append(root, [first, second])
+        self.assertTrue(journal.should_compact(1))
+
+        journal.compact([first, second])
+        self.assertFalse(journal.should_compact(1))
+        self.assertEqual(2, len(self.path.read_text().splitlines()))
+        self.assertListEqual([first, second], FrontierJournal(self.path).replay())
+
+
+if __name__ == "__main__":
+    unittest.main()
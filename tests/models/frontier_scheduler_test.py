@@ -0,0 +1,48 @@
+import unittest
+
+from src.models.enums.branching_type import BranchingType
+from src.models.enums.frontier_order import FrontierOrder
+from src.models.frontier_item import FrontierItem
+from src.models.frontier_scheduler import get_frontier_scheduler
+
+
+def create_item(chapter: int, used_choice_opportunity: int, state: BranchingType = BranchingType.BRANCHING) -> FrontierItem:
+    return FrontierItem(current_chapter=chapter, used_choice_opportunity=used_choice_opportunity, state=state)
+
+
+class FrontierSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.items = [create_item(1, 1), create_item(2, 0), create_item(1, 2, BranchingType.CHAPTER_END), create_item(1, 1)]
+
+    def pop_all(self, order: FrontierOrder) -> list[FrontierItem]:
+        scheduler = get_frontier_scheduler(order, self.items)
+        return [scheduler.pop() for _ in range(len(scheduler))]
+
+    def test_bfs_order(self):
+        actual = self.pop_all(FrontierOrder.BFS)
+        self.assertListEqual(self.items, actual)
+
+    def test_dfs_order(self):
+        actual = self.pop_all(FrontierOrder.DFS)
+        self.assertListEqual(self.items[::-1], actual)
+
+    def test_chapter_order(self):
+        expected = [self.items[0], self.items[3], self.items[2], self.items[1]]
+        actual = self.pop_all(FrontierOrder.CHAPTER)
+        self.assertListEqual(expected, actual)
+
+    def test_path_first_order(self):
+        expected = [self.items[1], self.items[2], self.items[0], self.items[3]]
+        actual = self.pop_all(FrontierOrder.PATH_FIRST)
+        self.assertListEqual(expected, actual)
+
+    def test_iteration_rebuilds_same_order(self):
+        for order in FrontierOrder:
+            scheduler = get_frontier_scheduler(order, self.items)
+            rebuilt = get_frontier_scheduler(order, list(scheduler))
+            self.assertListEqual([scheduler.pop() for _ in range(len(scheduler))],
+                                 [rebuilt.pop() for _ in range(len(rebuilt))])
+
+
+if __name__ == "__main__":
+    unittest.main()
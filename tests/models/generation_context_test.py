@@ -0,0 +1,54 @@
+import random
+import unittest
+
+from src.models.enums.branching_type import BranchingType
+from src.models.enums.generation_approach import GenerationApproach
+from src.models.frontier_item import FrontierItem
+from src.models.frontier_journal import FrontierJournal
+from src.models.generation_context import GenerationContext
+from tests.helpers import WorkingDirectoryTestCase, get_config
+
+
+def create_item(chapter: int) -> FrontierItem:
+    return FrontierItem(current_chapter=chapter, used_choice_opportunity=0, state=BranchingType.BRANCHING)
+
+
+class GenerationContextTest(WorkingDirectoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ctx = GenerationContext(GenerationApproach.PROPOSED, get_config(pipelined=True))
+
+    def tearDown(self):
+        self.ctx.close_logs()
+
+    def replay(self) -> list[str]:
+        return [item.id for item in FrontierJournal(self.ctx.output_path / "frontiers.jsonl").replay()]
+
+    def test_dispatched_item_is_regenerated_until_it_is_committed(self):
+        root = self.ctx.pop_frontier()
+        children = [create_item(2), create_item(3)]
+        self.ctx.dispatch_frontier(root, children)
+        first_child = self.ctx.pop_frontier()
+        self.ctx.compact_frontier_journal()
+
+        # The children are not journaled before their parent is committed
+        self.assertListEqual([root.id], self.replay())
+
+        self.ctx.commit_frontier(root, children)
+        self.assertCountEqual([child.id for child in children], self.replay())
+        self.ctx.commit_frontier(first_child, [])
+        self.assertCountEqual([child.id for child in children if child is not first_child], self.replay())
+
+    def test_seeded_context_draws_independently_of_global_random(self):
+        config = self.ctx.config.model_copy(update={"seed": 7})
+        first = GenerationContext(GenerationApproach.PROPOSED, config)
+        second = GenerationContext(GenerationApproach.PROPOSED, config)
+        first_draws = [first.random.randint(2, 5) for _ in range(10)]
+        random.seed(0)
+        self.assertListEqual(first_draws, [second.random.randint(2, 5) for _ in range(10)])
+        for ctx in (first, second):
+            ctx.close_logs()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import ujson
+
+from src.models.generation_log import (HistoryLog, MessageStore, ResponseLog,
+                                       get_response_log_model_names,
+                                       iter_histories, iter_responses,
+                                       read_response_totals)
+
+
+class GenerationLogTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.story_path = Path(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_response_totals(self):
+        response_log = ResponseLog(self.story_path, "test-model")
+        response_log.append("first", 10, 5, 2)
+        response_log.append("second", 20, 7)
+        response_log.close()
+
+        totals = read_response_totals(self.story_path, "test-model")
+        self.assertEqual({"prompt_tokens": 30, "cached_prompt_tokens": 2, "completion_tokens": 12}, totals)
+        self.assertListEqual(["first", "second"], list(iter_responses(self.story_path, "test-model")))
+        self.assertListEqual(["test-model"], get_response_log_model_names(self.story_path))
+
+    def test_truncated_record_is_dropped(self):
+        response_log = ResponseLog(self.story_path, "test-model")
+        response_log.append("first", 10, 5)
+        response_log.close()
+        with open(self.story_path / "test-model.jsonl", "a") as file:
+            file.write('{"response": "sec')
+
+        response_log = ResponseLog(self.story_path, "test-model")
+        self.assertEqual(1, response_log.totals["num_responses"])
+        response_log.append("third", 1, 1)
+        response_log.close()
+        self.assertListEqual(["first", "third"], list(iter_responses(self.story_path, "test-model")))
+        self.assertEqual(11, read_response_totals(self.story_path, "test-model")["prompt_tokens"])
+
+    def test_legacy_files_are_read_first(self):
+        with open(self.story_path / "test-model.json", "w") as file:
+            ujson.dump({"responses": ["legacy"], "prompt_tokens": 3, "completion_tokens": 4}, file)
+        with open(self.story_path / "histories.json", "w") as file:
+            ujson.dump({"histories": [[{"role": "user", "content": "legacy"}]]}, file)
+        response_log = ResponseLog(self.story_path, "test-model")
+        response_log.append("new", 10, 5)
+        response_log.close()
+        history_log = HistoryLog(self.story_path / "histories.jsonl", MessageStore(self.story_path / "messages.jsonl"))
+        history_log.append([{"role": "user", "content": "new"}])
+        history_log.close()
+
+        self.assertListEqual(["legacy", "new"], list(iter_responses(self.story_path, "test-model")))
+        self.assertEqual(13, read_response_totals(self.story_path, "test-model")["prompt_tokens"])
+        self.assertListEqual(["legacy", "new"], [history[0]["content"] for history in iter_histories(self.story_path)])
+
+    def test_history_messages_are_stored_once(self):
+        plot = [{"role": "user", "content": "plot prompt"}, {"role": "assistant", "content": "plot"}]
+        history_log = HistoryLog(self.story_path / "histories.jsonl", MessageStore(self.story_path / "messages.jsonl"))
+        history_log.append(plot)
+        history_log.append(plot + [{"role": "user", "content": "first"}])
+        history_log.append(plot + [{"role": "user", "content": "second"}])
+        history_log.close()
+
+        self.assertEqual(4, len(MessageStore(self.story_path / "messages.jsonl")))
+        self.assertListEqual([2, 3, 3], [len(history) for history in iter_histories(self.story_path)])
+        self.assertEqual("second", list(iter_histories(self.story_path))[-1][-1]["content"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+
+from src.models.enums.retry_kind import RetryKind
+from src.models.retry_policy import (RetryBudgetExhaustedError, RetryError,
+                                     RetryPolicy)
+
+
+class FlakyCall:
+    def __init__(self, num_failures: int, error: Exception = ValueError("invalid response")):
+        self.num_failures = num_failures
+        self.error = error
+        self.num_calls = 0
+
+    def __call__(self) -> str:
+        self.num_calls += 1
+        if self.num_calls <= self.num_failures:
+            raise self.error
+        return "ok"
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_call_retries_until_success(self):
+        policy = RetryPolicy(base_delay=0)
+        func = FlakyCall(num_failures=2)
+        self.assertEqual("ok", policy.call(RetryKind.CONTENT, func, (ValueError,)))
+        self.assertEqual(3, func.num_calls)
+        self.assertEqual(2, policy.get_stats()["content_retries"])
+
+    def test_call_stops_at_max_attempts(self):
+        policy = RetryPolicy(max_content_attempts=3, base_delay=0)
+        func = FlakyCall(num_failures=5)
+        with self.assertRaises(RetryError):
+            policy.call(RetryKind.CONTENT, func, (ValueError,))
+        self.assertEqual(3, func.num_calls)
+
+    def test_non_retryable_errors_are_raised(self):
+        policy = RetryPolicy(base_delay=0)
+        func = FlakyCall(num_failures=1, error=KeyError("id"))
+        with self.assertRaises(KeyError):
+            policy.call(RetryKind.TRANSPORT, func, (ValueError,))
+        self.assertEqual(1, func.num_calls)
+
+    def test_story_budget_is_shared_between_calls(self):
+        policy = RetryPolicy(max_content_attempts=10, story_retry_budget=3, retry_budget_per_chunk=0, base_delay=0)
+        policy.call(RetryKind.CONTENT, FlakyCall(num_failures=2), (ValueError,))
+        func = FlakyCall(num_failures=5)
+        with self.assertRaises(RetryBudgetExhaustedError):
+            policy.call(RetryKind.CONTENT, func, (ValueError,))
+        self.assertEqual(2, func.num_calls)
+        self.assertEqual(0, policy.get_stats()["remaining_budget"])
+
+    def test_budget_grows_with_completed_chunks(self):
+        # A long story with an occasional invalid response retries far more often than the base budget in total
+        policy = RetryPolicy(story_retry_budget=5, base_delay=0)
+        for chunk_idx in range(2000):
+            num_failures = 2 if chunk_idx % 10 == 0 else 0
+            self.assertEqual("ok", policy.call(RetryKind.CONTENT, FlakyCall(num_failures), (ValueError,)))
+        stats = policy.get_stats()
+        self.assertEqual(400, stats["content_retries"])
+        self.assertEqual(2000, stats["completed"])
+
+    def test_budget_still_fails_a_degraded_story(self):
+        policy = RetryPolicy(max_content_attempts=10, story_retry_budget=5, base_delay=0)
+        with self.assertRaises(RetryBudgetExhaustedError):
+            for _ in range(100):
+                policy.call(RetryKind.CONTENT, FlakyCall(num_failures=3), (ValueError,))
+
+    def test_inner_retry_errors_are_not_retried_again(self):
+        policy = RetryPolicy(base_delay=0)
+
+        def func():  # Transport retries inside a content retry must not multiply
+            return policy.call(RetryKind.TRANSPORT, FlakyCall(num_failures=10, error=ConnectionError()),
+                               (ConnectionError,))
+
+        with self.assertRaises(RetryError):
+            policy.call(RetryKind.CONTENT, func, (Exception,))
+        stats = policy.get_stats()
+        self.assertEqual(5, stats["transport_retries"])
+        self.assertEqual(0, stats["content_retries"])
+
+    def test_transport_delay_is_capped_full_jitter(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=8.0)
+        for attempt in range(1, 10):
+            delay = policy.get_delay(RetryKind.TRANSPORT, attempt)
+            self.assertGreaterEqual(delay, 0.0)
+            self.assertLessEqual(delay, min(8.0, 2 ** (attempt - 1)))
+        self.assertEqual(0.0, policy.get_delay(RetryKind.CONTENT, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from src.models.shared_history import SharedHistory
+from src.models.story_chunk import StoryChunk
+
+
+class SharedHistoryTest(unittest.TestCase):
+    def test_from_list_empty_history(self):
+        self.assertIsNone(SharedHistory.from_list([]))
+
+    def test_to_list_round_trip(self):
+        expected = [{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Hi"}]
+        actual = SharedHistory.from_list(expected).to_list()
+
+        self.assertListEqual(expected, actual)
+
+    def test_append_shares_prefix(self):
+        parent = SharedHistory.from_list([{"role": "user", "content": "Hello"}])
+        first = parent.append("First", "assistant")
+        second = parent.append("Second", "assistant")
+
+        self.assertIs(parent, first.parent)
+        self.assertIs(parent, second.parent)
+        self.assertEqual(1, len(parent))
+        self.assertListEqual([{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Second"}],
+                             second.to_list())
+
+    def test_tail(self):
+        history = SharedHistory.from_list([{"role": "user", "content": "1"}, {"role": "assistant", "content": "2"},
+                                           {"role": "user", "content": "3"}])
+
+        self.assertListEqual([{"role": "assistant", "content": "2"}, {"role": "user", "content": "3"}], history.tail(2))
+        self.assertListEqual([], history.tail(0))
+
+    def test_story_chunk_serialization(self):
+        history = [{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Hi"}]
+        story_chunk = StoryChunk(id="id", story_id="story_id", chapter=1, story_so_far="", story=[], num_opportunities=0,
+                                 history=history)
+
+        self.assertIsInstance(story_chunk.history, SharedHistory)
+        self.assertListEqual(history, story_chunk.model_dump()["history"])
+
+
+if __name__ == "__main__":
+    unittest.main()
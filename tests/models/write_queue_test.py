@@ -0,0 +1,34 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.models.write_queue import WriteQueue
+
+
+class WriteQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name) / "queue.sqlite3"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_writes_survive_reopening(self):
+        queue = WriteQueue(self.path)
+        queue.put("story_chunk", {"id": "1", "history": b"compressed"})
+        queue.put("branch", {"source_id": "1", "branched_id": "2"})
+        queue.close()
+
+        queue = WriteQueue(self.path)
+        writes = queue.peek(10)
+        self.assertEqual(["story_chunk", "branch"], [operation for _, operation, _ in writes])
+        self.assertEqual(b"compressed", writes[0][2]["history"])
+
+        queue.remove([writes[0][0]])
+        self.assertEqual(1, len(queue))
+        self.assertEqual("branch", queue.peek(10)[0][1])
+        queue.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
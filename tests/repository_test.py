@@ -0,0 +1,260 @@
+import os
+import tempfile
+import unittest
+from typing import Optional
+from unittest.mock import patch
+
+import ujson
+
+from src.models.story_branch import StoryBranch
+from src.database import SQLite
+from src.models.shared_history import SharedHistory
+from src.models.story_chunk import StoryChunk
+from src.repository import (BatchingRepository, CommonRepository,
+                            SQLiteRepository, WriteBehindRepository)
+
+
+class FakeTransaction:
+    def __init__(self, queries: list[tuple[str, dict]]):
+        self.queries = queries
+
+    def run(self, query: str, **parameters):
+        self.queries.append((query, parameters))
+
+
+class FakeSession:
+    def __init__(self, queries: list[tuple[str, dict]]):
+        self.queries = queries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute_write(self, func, *args):
+        self.queries.append(("BEGIN", {}))
+        return func(FakeTransaction(self.queries), *args)
+
+
+class FakeNeo4J:
+    def __init__(self):
+        self.queries: list[tuple[str, dict]] = []
+        self.driver = self
+
+    def session(self):
+        return FakeSession(self.queries)
+
+    def bootstrap_schema(self):
+        pass
+
+
+class FakeResult:
+    def __init__(self, record: Optional[dict]):
+        self.record = record
+
+    def single(self) -> Optional[dict]:
+        return self.record
+
+
+class FakeGraphSession(FakeSession):
+    # Applies the queries of CommonRepository to an in-memory graph
+    def __init__(self, graph: "FakeGraph"):
+        super().__init__(graph.queries)
+        self.graph = graph
+
+    def run(self, query: str, **parameters) -> FakeResult:
+        self.queries.append((query, parameters))
+        if query.startswith("MERGE (storyChunk:StoryChunk"):
+            self.graph.story_chunks.setdefault(parameters["id"], {}).update(parameters["properties"])
+        elif query.startswith("MATCH (storyData:StoryData {id: $story_id}) SET storyData.initial_history"):
+            self.graph.initial_histories[parameters["story_id"]] = parameters["initial_history"]
+        elif "MERGE (source)-[:BRANCHED_TO" in query:
+            self.graph.parents[parameters["branched_id"]] = parameters["source_id"]
+        elif "MATCH path" in query:
+            return FakeResult(self.graph.get_history_record(parameters["chunk_id"]))
+        return FakeResult(None)
+
+
+class FakeGraph(FakeNeo4J):
+    def __init__(self):
+        super().__init__()
+        self.story_chunks: dict[str, dict] = {}
+        self.initial_histories: dict[str, str | bytes] = {}
+        self.parents: dict[str, str] = {}
+
+    def session(self):
+        return FakeGraphSession(self)
+
+    def get_history_record(self, chunk_id: str) -> Optional[dict]:
+        if chunk_id not in self.story_chunks:
+            return None
+        path = [chunk_id]
+        while path[0] in self.parents:
+            path.insert(0, self.parents[path[0]])
+        story_chunk = self.story_chunks[chunk_id]
+        return {"history_storage": story_chunk["history_storage"],
+                "initial_history": self.initial_histories.get(story_chunk["story_id"]),
+                "histories": [self.story_chunks[path_chunk_id]["history"] for path_chunk_id in path]}
+
+
+class CommonRepositoryTest(unittest.TestCase):
+    def setUp(self):
+        self.initial_history = SharedHistory.from_list([{"role": "user", "content": "Plot prompt"},
+                                                        {"role": "assistant", "content": "Plot \u00e9"}])
+
+    def tearDown(self):
+        CommonRepository._instance = None
+
+    def create_repository(self, history_storage: str, history_compression: bool) -> CommonRepository:
+        CommonRepository._instance = None
+        with patch.dict(os.environ, {"NEO4J_HISTORY_STORAGE": history_storage,
+                                     "NEO4J_HISTORY_COMPRESSION": str(history_compression).lower()}):
+            with patch("src.repository.Neo4J", FakeGraph):
+                return CommonRepository()
+
+    def get_story_chunk(self, chunk_id: str, parent: SharedHistory) -> StoryChunk:
+        history = parent.append(f"Prompt {chunk_id}").append(f"Response {chunk_id}", "assistant")
+        return StoryChunk(id=chunk_id, chapter=1, story_so_far="", story=[], story_id="story", num_opportunities=0,
+                          history=history)
+
+    def write_story(self, repository: CommonRepository) -> list[StoryChunk]:
+        first_chunk = self.get_story_chunk("1", self.initial_history)
+        second_chunk = self.get_story_chunk("2", first_chunk.history)
+        third_chunk = self.get_story_chunk("3", second_chunk.history)
+        repository.set_initial_history("story", self.initial_history.to_list())
+        for story_chunk in [first_chunk, second_chunk, third_chunk, self.get_story_chunk("4", first_chunk.history)]:
+            repository.create_story_chunk(story_chunk)
+        for source_id, target_id in [("1", "2"), ("2", "3"), ("1", "4")]:
+            repository.create_branch(StoryBranch(source_chunk_id=source_id, target_chunk_id=target_id, choice=None))
+        return [first_chunk, second_chunk, third_chunk]
+
+    def test_history_rebuilt_from_deltas_matches_full_history(self):
+        full_repository = self.create_repository("full", False)
+        story_chunks = self.write_story(full_repository)
+        full_histories = [ujson.dumps(full_repository.get_story_chunk_history(story_chunk.id))
+                          for story_chunk in story_chunks]
+
+        for history_compression in [False, True]:
+            with self.subTest(history_compression=history_compression):
+                repository = self.create_repository("delta", history_compression)
+                self.write_story(repository)
+                # Only the pair added by the chunk is stored, not the history of its parent
+                self.assertEqual(2, len(repository.decode_history(repository.database.story_chunks["3"]["history"])))
+                self.assertListEqual(full_histories, [ujson.dumps(repository.get_story_chunk_history(story_chunk.id))
+                                                      for story_chunk in story_chunks])
+                self.assertEqual(ujson.dumps(story_chunks[-1].history.to_list()), full_histories[-1])
+                with self.assertRaises(ValueError):
+                    repository.get_story_chunk_history("5")
+
+
+class BatchingRepositoryTest(unittest.TestCase):
+    def setUp(self):
+        self.env = patch.dict(os.environ, {"NEO4J_BATCH_SIZE": "4", "NEO4J_BATCH_INTERVAL": "0"})
+        self.env.start()
+        with patch("src.repository.Neo4J", FakeNeo4J):
+            self.repository = BatchingRepository()
+        self.queries = self.repository.database.queries
+
+    def tearDown(self):
+        BatchingRepository._instance = None
+        self.env.stop()
+
+    @staticmethod
+    def get_story_chunk(chunk_id: str) -> StoryChunk:
+        return StoryChunk(id=chunk_id, chapter=1, story_so_far="", story=[], story_id="story", num_opportunities=0)
+
+    def test_flush_when_batch_is_full(self):
+        self.repository.create_story_chunk(self.get_story_chunk("1"))
+        self.repository.set_start_chunk("story", "1")
+        self.repository.create_story_chunk(self.get_story_chunk("2"))
+        self.assertListEqual([], self.queries)
+
+        self.repository.create_branch(StoryBranch(source_chunk_id="1", target_chunk_id="2", choice=None))
+        self.assertEqual(["BEGIN", "UNWIND $story_chunks", "UNWIND $branches", "UNWIND $start_chunks"],
+                         [" ".join(query.split()[:2]) for query, _ in self.queries])
+        self.assertEqual(["1", "2"], [chunk["id"] for chunk in self.queries[1][1]["story_chunks"]])
+
+    def test_flush_writes_remaining_records(self):
+        self.repository.create_story_chunk(self.get_story_chunk("1"))
+        self.repository.flush()
+        self.repository.flush()
+        self.assertEqual(2, len(self.queries))
+
+
+class WriteBehindRepositoryTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"NEO4J_WRITE_QUEUE_PATH": f"{self.temp_dir.name}/queue.sqlite3",
+                                           "NEO4J_WRITE_BEHIND_FLUSH_TIMEOUT": "5"})
+        self.env.start()
+
+    def tearDown(self):
+        WriteBehindRepository._instance = None
+        self.env.stop()
+        self.temp_dir.cleanup()
+
+    def test_queued_writes_are_drained(self):
+        with patch("src.repository.Neo4J", FakeNeo4J):
+            repository = WriteBehindRepository()
+        repository.create_story_chunk(BatchingRepositoryTest.get_story_chunk("1"))
+        repository.set_start_chunk("story", "1")
+        repository.flush()
+
+        self.assertEqual(0, repository.get_num_pending_writes())
+        queries = [" ".join(query.split()[:6]) for query, _ in repository.database.queries if query != "BEGIN"]
+        self.assertEqual(["UNWIND $rows AS row MERGE (storyChunk:StoryChunk",
+                          "UNWIND $rows AS row MERGE (storyData:StoryData"], queries)
+
+
+class SQLiteRepositoryTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"SQLITE_PATH": f"{self.temp_dir.name}/story-graph.sqlite3",
+                                           "NEO4J_HISTORY_STORAGE": "delta", "NEO4J_HISTORY_COMPRESSION": "true"})
+        self.env.start()
+        self.repository = SQLiteRepository()
+        self.initial_history = SharedHistory.from_list([{"role": "user", "content": "Plot prompt"},
+                                                        {"role": "assistant", "content": "Plot"}])
+
+    def tearDown(self):
+        self.repository.database.close()
+        SQLite._instance = None
+        SQLiteRepository._instance = None
+        self.env.stop()
+        self.temp_dir.cleanup()
+
+    def get_story_chunk(self, chunk_id: str, parent: SharedHistory) -> StoryChunk:
+        history = parent.append(f"Prompt {chunk_id}").append(f"Response {chunk_id}", "assistant")
+        return StoryChunk(id=chunk_id, chapter=1, story_so_far="", story=[], story_id="story", num_opportunities=0,
+                          history=history)
+
+    def test_history_is_rebuilt_from_deltas(self):
+        self.repository.set_initial_history("story", self.initial_history.to_list())
+        first_chunk = self.get_story_chunk("1", self.initial_history)
+        second_chunk = self.get_story_chunk("2", first_chunk.history)
+        for story_chunk in [first_chunk, second_chunk, self.get_story_chunk("3", first_chunk.history)]:
+            self.repository.create_story_chunk(story_chunk)
+        self.repository.create_branch(StoryBranch(source_chunk_id="1", target_chunk_id="2", choice=None))
+        self.repository.create_branch(StoryBranch(source_chunk_id="1", target_chunk_id="3", choice=None))
+
+        self.assertListEqual(second_chunk.history.to_list(), self.repository.get_story_chunk_history("2"))
+        with self.assertRaises(ValueError):
+            self.repository.get_story_chunk_history("4")
+
+    def test_writes_are_idempotent(self):
+        story_chunk = self.get_story_chunk("1", self.initial_history)
+        self.repository.create_story_chunk(story_chunk)
+        self.repository.set_start_chunk("story", "1")
+        self.repository.set_start_chunk("story", "1")
+        story_chunk.chapter = 2
+        self.repository.create_story_chunk(story_chunk)
+
+        self.assertEqual(1, self.repository.get_num_story_chunks("story"))
+        rows = self.repository.database.query("SELECT chapter FROM story_chunks WHERE id = ?", ("1",))
+        self.assertEqual(2, rows[0]["chapter"])
+        self.assertEqual(1, len(self.repository.database.query("SELECT * FROM start_chunks")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 
+from src.models.shared_history import SharedHistory
 from src.utils.openai_ai import append_openai_message
 
 
@@ -28,6 +29,14 @@ class AppendOpenAIMessageTest(unittest.TestCase):
 
         self.assertListEqual(expected, actual)
 
+    def test_append_openai_message_shared_history(self):
+        history = SharedHistory.from_list([{"role": "system", "content": "Hello"}])
+        expected = [{"role": "system", "content": "Hello"}, {"role": "assistant", "content": "Hi"}]
+        actual = append_openai_message("Hi", "assistant", history)
+
+        self.assertIs(history, actual.parent)
+        self.assertListEqual(expected, actual.to_list())
+
 
 if __name__ == "__main__":
     unittest.main()
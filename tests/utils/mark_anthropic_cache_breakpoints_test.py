@@ -0,0 +1,27 @@
+import unittest
+
+from src.utils.anthropic_ai import mark_anthropic_cache_breakpoints
+
+
+class MarkAnthropicCacheBreakpointsTest(unittest.TestCase):
+    def test_mark_cache_breakpoints(self):
+        history = [{"role": "user", "content": "plot"}, {"role": "assistant", "content": "story data"},
+                   {"role": "user", "content": "chunk"}]
+        expected = [{"role": "user", "content": "plot"},
+                    {"role": "assistant",
+                     "content": [{"type": "text", "text": "story data", "cache_control": {"type": "ephemeral"}}]},
+                    {"role": "user", "content": "chunk"}]
+        actual = mark_anthropic_cache_breakpoints(history, [1])
+
+        self.assertListEqual(expected, actual)
+        self.assertEqual("story data", history[1]["content"])
+
+    def test_mark_no_cache_breakpoints(self):
+        history = [{"role": "user", "content": "plot"}]
+        actual = mark_anthropic_cache_breakpoints(history, [])
+
+        self.assertListEqual(history, actual)
+
+
+if __name__ == "__main__":
+    unittest.main()